@@ -1,7 +1,9 @@
 import argparse
 import ast
+import hashlib
 import json
 import logging
+import mmap
 
 from lxml import etree as ET
 from lxml import etree
@@ -9,12 +11,15 @@ from lxml.etree import Element, _Element
 from enum import Enum
 import lxml
 import os
-import pandas as pd
 import re
+import struct
+import threading
 import traceback
+import unicodedata
 import urllib.request
 
-from collections import Counter
+from collections import Counter, OrderedDict
+from collections.abc import Mapping, Sequence
 from pathlib import Path
 from urllib.error import URLError
 from shutil import copyfile
@@ -27,7 +32,7 @@ from py4ami.ami_html import HtmlUtil, CSSStyle, H_A, H_SPAN, H_BODY, H_DIV, H_UL
     A_HREF, A_NAME, A_TITLE, A_TERM
 from py4ami.file_lib import FileLib
 from py4ami.util import AbstractArgs
-from py4ami.wikimedia import WikidataSparql, WikidataLookup, WikidataPage
+from py4ami.wikimedia import WikidataSparql, WikidataLookup, WikidataPage, WikidataDumpIndex, WikidataExtractor
 
 # elements in amidict
 DICTIONARY = "dictionary"
@@ -54,6 +59,7 @@ WIKIDATA_HITS = "wikidata_hits"
 WIKIDATA_HIT = "wikidataHit"
 
 # commandline
+COMPILE = "compile"
 DELETE = "delete"
 DICT = "dict"
 FILTER = "filter"
@@ -62,6 +68,8 @@ METADATA = "metadata"
 REPLACE = "replace"
 SYNONYM = "synonym"
 VALIDATE = "validate"
+WIKIDATA_DUMP = "wikidata_dump"
+WIKIDATA_INDEX = "wikidata_index"
 WORDS = "words"
 
 # constants
@@ -308,12 +316,15 @@ class AmiEntry:
         return matched_pages
 
     @classmethod
-    def get_wikidata_pages_for_ids(cls, wikidata_ids):
+    def get_wikidata_pages_for_ids(cls, wikidata_ids, executor=None):
         """
         get WikidataPages for list of PQids
         :param wikidata_ids: list of PQitems
+        :param executor: optional WikidataLookupExecutor to fetch pages concurrently (failures give None)
         :return: list of corresponding WikidataPages
         """
+        if executor is not None:
+            return executor.map(lambda id: WikidataPage(pqitem=id), wikidata_ids)
         wikidata_pages = []
         for id in wikidata_ids:
             wikidata_page = WikidataPage(pqitem=id)
@@ -414,12 +425,14 @@ class AmiDictionary:
     def __init__(self, title=None, wikilangs=None, ignorecase=True, **kwargs):
         self.logger = logger
         self.xml_content = None
+        self.compiled = None
         self.entries = []
         self.entry_by_id = dict()
         self.entry_by_term = dict()
         self.entry_by_wikidata_id = {}
         self.file = None
         self.ignorecase = ignorecase
+        self._name = None
         self.title = title
         self.root = None
         self.sparql_result_list = None
@@ -427,6 +440,9 @@ class AmiDictionary:
         self.sparql_to_dictionary = None
         self.split_terms = False
         self.term_set = set()
+        self.term_automaton_by_case = dict()
+        self.term_index = None
+        self.fuzzy_index_by_key = dict()
         self.url = None
         self.wikilangs = wikilangs
         self.wikidata_lookup = WikidataLookup()
@@ -439,6 +455,20 @@ class AmiDictionary:
         self.split_terms = True
         self.split_terms = False
 
+    @property
+    def name(self):
+        """name used for the dictionary in search results: as set, else the stem of its file, else its title"""
+        if self._name is not None:
+            return self._name
+        if self.file:
+            return Path(self.file).stem
+        title = self.title[0] if isinstance(self.title, list) and self.title else self.title
+        return title if isinstance(title, str) else None
+
+    @name.setter
+    def name(self, name):
+        self._name = name
+
     #    class AmiDictionary:
 
     @classmethod
@@ -516,6 +546,7 @@ class AmiDictionary:
             raise ValueError("must give column name")
         if title is None:
             raise ValueError("must give title")
+        import pandas as pd
         df = pd.read_csv(csv_term_file)
         keywords = df[col_name]
         keyword_dict, _ = AmiDictionary.create_dictionary_from_words(keywords, title=title, wikidata=True)
@@ -631,6 +662,71 @@ class AmiDictionary:
 
     #    class AmiDictionary:
 
+    @classmethod
+    def create_from_compiled_file(cls, xml_file, ignorecase=False, compile_if_stale=True):
+        """
+        reads dictionary from its compiled sidecar (see compile()) without parsing the XML, if the
+        sidecar is current; otherwise reads the XML (create_from_xml_file) and, optionally, compiles it
+        for next time.
+        Compiled dictionaries are read-only: entries and entry_by_term are lazy views and root is None
+        :param xml_file: file containing an AMI Dictionary as XML
+        :param ignorecase: see AmiDictionary.create_from_xml_object
+        :param compile_if_stale: if True (re)write the sidecar when missing or out of date
+        :returns: AmiDictionary object or None
+        """
+        if xml_file is None or not os.path.exists(xml_file):
+            logging.warning("cannot find dictionary path " + str(xml_file))
+            return None
+        compiled_file = AmiCompiledDictionary.get_compiled_path(xml_file)
+        if AmiCompiledDictionary.is_current(xml_file, compiled_file):
+            return AmiDictionary.create_from_compiled_dictionary(
+                AmiCompiledDictionary.read(compiled_file), xml_file=xml_file, ignorecase=ignorecase)
+        dictionary = AmiDictionary.create_from_xml_file(xml_file, ignorecase=ignorecase)
+        if dictionary is not None and compile_if_stale:
+            try:
+                dictionary.compile(compiled_file)
+            except OSError as e:
+                logging.warning(f"cannot write compiled dictionary {compiled_file} because {e}")
+        return dictionary
+
+    @classmethod
+    def create_from_compiled_dictionary(cls, compiled, xml_file=None, ignorecase=False):
+        """
+        wraps an AmiCompiledDictionary
+        :param compiled: AmiCompiledDictionary
+        :param xml_file: source file (for self.file)
+        :param ignorecase: see AmiDictionary.create_from_xml_object
+        :returns: read-only AmiDictionary
+        """
+        dictionary = AmiDictionary(ignorecase=ignorecase)
+        dictionary.compiled = compiled
+        dictionary.file = xml_file
+        dictionary.title = [compiled.title] if compiled.title is not None else []
+        dictionary.entries = compiled.get_entry_list()
+        dictionary.entry_by_term = compiled
+        return dictionary
+
+    def compile(self, compiled_file=None):
+        """
+        writes the binary sidecar read by create_from_compiled_file(); it records the SHA-256 of
+        self.file (or, if there is no file, of the serialized root) and is ignored once the XML changes
+        :param compiled_file: output (default AmiCompiledDictionary.get_compiled_path(self.file))
+        :return: Path of compiled file
+        """
+        if compiled_file is None:
+            if self.file is None:
+                raise AMIDictError("no dictionary file, so compiled_file must be given")
+            compiled_file = AmiCompiledDictionary.get_compiled_path(self.file)
+        if self.file is not None and os.path.exists(self.file):
+            xml_hash = AmiCompiledDictionary.hash_file(self.file)
+        elif self.root is not None:
+            xml_hash = hashlib.sha256(ET.tostring(self.root)).digest()
+        else:
+            raise AMIDictError("dictionary has neither file nor root to compile")
+        title = self.root.get(TITLE) if self.root is not None else (self.title[0] if self.title else None)
+        return AmiCompiledDictionary.write(self.entries, compiled_file, xml_hash, title=title,
+                                           ignorecase=self.ignorecase)
+
     @classmethod
     def create_from_xml_object(cls, xml_object, ignorecase=True):
         if xml_object is None:
@@ -678,19 +774,21 @@ class AmiDictionary:
 
     def get_or_create_term_set(self):
         if len(self.term_set) == 0:
-            for entry in self.entries:
-                if TERM in entry.attrib:
-                    term = self.term_from_entry(entry)
-                    # single word terms
-                    if " " not in term:
-                        self.add_processed_term(term)
-                    elif self.split_terms:
-                        # multiword terms
-                        for termx in term.split(" "):
-                            self.add_processed_term(termx)
-                    else:
-                        # add multiword term
-                        self.add_processed_term(term)
+            if self.compiled is not None:
+                terms = (term.lower() if self.ignorecase else term for term in self.compiled.iter_terms())
+            else:
+                terms = (self.term_from_entry(entry) for entry in self.entries if TERM in entry.attrib)
+            for term in terms:
+                # single word terms
+                if " " not in term:
+                    self.add_processed_term(term)
+                elif self.split_terms:
+                    # multiword terms
+                    for termx in term.split(" "):
+                        self.add_processed_term(termx)
+                else:
+                    # add multiword term
+                    self.add_processed_term(term)
 
         return self.term_set
 
@@ -738,8 +836,33 @@ class AmiDictionary:
 
     #    class AmiDictionary:
 
-    def match(self, target_words):
+    def match(self, target_words, synonyms=False, max_distance=0):
+        """
+        :param target_words: words to look up (case is ignored)
+        :param synonyms: if True also match synonyms in any language (see get_or_create_term_index())
+            and return the term of their entry
+        :param max_distance: if > 0 match approximately (see match_approximate()) and return the terms
+        :return: list of matched (lowercase) words, or terms for synonym matches
+        """
         matched = []
+        if max_distance > 0:
+            return [key for _, key, _ in self.match_approximate(
+                target_words, max_distance=max_distance, synonyms=synonyms)]
+        if synonyms:
+            term_index = self.get_or_create_term_index()
+            for target_word in target_words:
+                key = term_index.get_entry_key(target_word)
+                if key is not None:
+                    matched.append(key)
+            return matched
+        if self.compiled is not None:
+            # binary search of the compiled term table; no term set needed
+            for target_word in target_words:
+                target_word = target_word.lower()
+                index = self.compiled.find_entry_index(target_word)
+                if index is not None and (self.ignorecase or self.compiled.get_term(index) == target_word):
+                    matched.append(target_word)
+            return matched
         self.term_set = self.get_or_create_term_set()
         for target_word in target_words:
             target_word = target_word.lower()
@@ -747,19 +870,80 @@ class AmiDictionary:
                 matched.append(target_word)
         return matched
 
-    def match_multiple_word_terms_against_sentences(self, sentence_list):
-        """this will be slow with large dictionaries until we optimise the algorithm """
+    def match_multiple_word_terms_against_sentences(self, sentence_list, word_boundary=False):
+        """matches multiword terms against sentences using the cached term automaton
+        each sentence is scanned once, independently of the number of terms
+        :param sentence_list: list of sentences (strings)
+        :param word_boundary: if True terms must not be embedded in longer words
+        :return: list of lowercase multiword terms, one per sentence containing the term
+        """
         matched = []
-
-        for term in self.term_set:
-            term = term.lower()
-            term_words = term.split(" ")
-            if len(term_words) > 1:
-                for sentence in sentence_list:
-                    if term in sentence.lower():
-                        matched.append(term)
+        automaton = self.get_or_create_term_automaton(ignorecase=True)
+        for sentence in sentence_list:
+            sentence_terms = set()
+            for _, _, term in automaton.find_all(sentence, word_boundary=word_boundary):
+                if " " in term and term not in sentence_terms:
+                    sentence_terms.add(term)
+                    matched.append(term)
         return matched
 
+    def get_or_create_term_index(self):
+        """get or build the multilingual AmiTermIndex of terms and synonyms; built once per dictionary
+        :return: AmiTermIndex
+        """
+        if self.term_index is None:
+            self.term_index = AmiTermIndex.create_from_dictionary(self)
+        return self.term_index
+
+    def get_or_create_fuzzy_index(self, max_distance=1, synonyms=False):
+        """get or build the AmiFuzzyTermIndex of the terms (and synonyms if synonyms);
+        built once per dictionary, distance and synonym mode
+        :param max_distance: maximum edit distance the index supports
+        :param synonyms: if True index all surfaces of get_or_create_term_index(), else get_or_create_term_set()
+        :return: AmiFuzzyTermIndex
+        """
+        fuzzy_index = self.fuzzy_index_by_key.get((max_distance, synonyms))
+        if fuzzy_index is None:
+            if synonyms:
+                surfaces = self.get_or_create_term_index().entry_key_by_surface
+            else:
+                surfaces = ((term, term.lower()) for term in self.get_or_create_term_set())
+            fuzzy_index = AmiFuzzyTermIndex.create_from_surfaces(surfaces, max_distance=max_distance)
+            self.fuzzy_index_by_key[(max_distance, synonyms)] = fuzzy_index
+        return fuzzy_index
+
+    def match_approximate(self, target_words, max_distance=1, synonyms=False):
+        """matches words within max_distance edits of a term (after AmiFuzzyTermIndex.normalize())
+        :param target_words: words to look up
+        :param max_distance: maximum edit distance
+        :param synonyms: also match synonyms (see match())
+        :return: list of (word, term, distance) for each matched word
+        """
+        fuzzy_index = self.get_or_create_fuzzy_index(max_distance=max_distance, synonyms=synonyms)
+        return fuzzy_index.match_words(target_words)
+
+    def get_or_create_term_automaton(self, ignorecase=True):
+        """get or build the Aho-Corasick automaton for the terms in get_or_create_term_set()
+        built once per dictionary and case mode
+        :param ignorecase: whether automaton folds case
+        :return: AmiTermAutomaton
+        """
+        automaton = self.term_automaton_by_case.get(ignorecase)
+        if automaton is None:
+            automaton = AmiTermAutomaton.create_from_terms(self.get_or_create_term_set(), ignorecase=ignorecase)
+            self.term_automaton_by_case[ignorecase] = automaton
+        return automaton
+
+    def match_terms_in_text(self, text, word_boundary=True, ignorecase=True):
+        """finds all single- and multi-word terms in text in one pass
+        :param text: string to search (e.g. text of a section)
+        :param word_boundary: if True terms must not be embedded in longer words
+        :param ignorecase: if True matching is case-insensitive
+        :return: list of (start, end, term) tuples
+        """
+        automaton = self.get_or_create_term_automaton(ignorecase=ignorecase)
+        return automaton.find_all(text, word_boundary=word_boundary)
+
     #    class AmiDictionary:
 
     def get_lxml_entry(self, termx, ignorecase=True):
@@ -904,18 +1088,73 @@ class AmiDictionary:
             et.write(f, encoding="utf-8",
                      xml_declaration=True, pretty_print=True)
 
-    def add_wikidata_from_terms(self, allowed_descriptions=ANY):
-
+    def add_wikidata_from_terms(self, allowed_descriptions=ANY, cache=None, index=None, extractor=None):
+        """looks up all entries in Wikidata
+        terms are searched one by one; the items found are then fetched together (see create_wikidata_pages)
+        :param allowed_descriptions: see lookup_and_add_wikidata_to_entry
+        :param cache: WikidataCache for search and item pages (persists across runs); if None do not cache
+        :param index: WikidataDumpIndex to resolve terms offline; if None uses the lookup's index (if any)
+        :param extractor: WikidataExtractor for batched item fetches; default one using the lookup's cache
+        """
+        if cache is not None:
+            self.wikidata_lookup.cache = cache
+        if index is not None:
+            self.wikidata_lookup.index = index
         entries = self.root.findall(ENTRY)
-        for entry in entries:
-            self.lookup_and_add_wikidata_to_entry(entry, allowed_descriptions=allowed_descriptions)
+        hits_list = [self.wikidata_lookup.lookup_wikidata(entry.attrib[TERM]) for entry in entries]
+        page_by_qid = self.create_wikidata_pages([hits[0] for hits in hits_list if hits[0]], extractor=extractor)
+        for entry, hits in zip(entries, hits_list):
+            self.add_wikidata_hits_to_entry(entry, hits, allowed_descriptions=allowed_descriptions,
+                                            wikidata_page=page_by_qid.get(hits[0]))
+
+    def create_wikidata_pages(self, qitems, extractor=None):
+        """WikidataPages for qitems without a request per item: from the lookup's WikidataDumpIndex if it
+        has the item, else from wbgetentities in batches of WikidataExtractor.MAX_IDS_PER_REQUEST
+        (responses are stored in the lookup's WikidataCache, if any)
+        :param qitems: Wikidata ids
+        :param extractor: WikidataExtractor (default one using the lookup's cache)
+        :return: dict of WikidataPage by qitem; items that could not be fetched are absent
+        """
+        index = self.wikidata_lookup.index
+        page_by_qid = dict()
+        missing = []
+        for qitem in dict.fromkeys(qitems):
+            entity = index.get_entity(qitem) if index is not None else None
+            if entity is not None:
+                page_by_qid[qitem] = WikidataPage.create_from_entity(entity)
+            else:
+                missing.append(qitem)
+        if not missing:
+            return page_by_qid
+        if extractor is None:
+            extractor = WikidataExtractor(response_cache=self.wikidata_lookup.cache)
+        try:
+            extractor.load_many(missing)
+        except Exception as e:
+            logging.warning(f"batched Wikidata fetch failed; pages will be fetched singly: {e}")
+        for qitem in missing:
+            entity = extractor.entities.get(qitem)
+            if entity is not None:
+                page_by_qid[qitem] = WikidataPage.create_from_entity(
+                    WikidataDumpIndex.create_entity_dict_from_json(entity, lang=extractor.lang))
+        return page_by_qid
 
     def lookup_and_add_wikidata_to_entry(self, entry, allowed_descriptions=ANY):
         """lookup term and  add wikidata Info to entry if desc fits required description
         :param entry: to add wikidata to
         :param allowed_descriptions: only add if the description fits (ANY overrides)"""
         term = entry.attrib[TERM]
-        qitem, desc, qitems = self.wikidata_lookup.lookup_wikidata(term)
+        hits = self.wikidata_lookup.lookup_wikidata(term)
+        self.add_wikidata_hits_to_entry(entry, hits, allowed_descriptions=allowed_descriptions)
+
+    def add_wikidata_hits_to_entry(self, entry, hits, allowed_descriptions=ANY, wikidata_page=None):
+        """adds wikidata Info to entry if desc fits required description
+        :param entry: to add wikidata to
+        :param hits: (qitem, desc, qitems) from WikidataLookup.lookup_wikidata()
+        :param allowed_descriptions: only add if the description fits (ANY overrides)
+        :param wikidata_page: WikidataPage of qitem; if None it is fetched"""
+        term = entry.attrib[TERM]
+        qitem, desc, qitems = hits
         if not qitem:
             print(f"Wikidata lookup for {term} failed")
             return
@@ -931,8 +1170,9 @@ class AmiDictionary:
                     wikidata_hit = ET.SubElement(entry, WIKIDATA_HIT)
                     wikidata_hit.attrib[TYPE] = WIKIDATA_HITS
                     wikidata_hit.text = str(wid)
-            wikidata_page = WikidataPage(qitem)
-            assert wikidata_page is not None
+            if wikidata_page is None:
+                wikidata_page = WikidataPage(qitem, cache=self.wikidata_lookup.cache,
+                                             index=self.wikidata_lookup.index)
             wikipedia_dict = wikidata_page.get_wikipedia_page_links(self.wikilangs)
             self.add_wikipedia_page_links(entry, wikipedia_dict)
 
@@ -1005,7 +1245,7 @@ class AmiDictionary:
                 _term_id_list.append((ami_entry.get_term(), ids))
         return _term_id_list
 
-    def lookup_missing_wikidata_ids(self, lookup_string=NAME, maxhits=99999):
+    def lookup_missing_wikidata_ids(self, lookup_string=NAME, maxhits=99999, executor=None):
         """
         finds entries with missing WikidataIDs and searches wikidata by name or term
         creates WikidataLookup which holds hits_dict with details of possible match
@@ -1031,10 +1271,12 @@ class AmiDictionary:
 
         :param lookup_string: either "name" (NAME) OR "term" (TERM); default NAME
         :param maxhits: exit after maxhits entries
+        :param executor: optional WikidataLookupExecutor to run requests concurrently
         :return: new WikidataLookup with lookup.hits_dict
         """
         lxml_entries = self.get_lxml_entries_with_missing_wikidata_ids()
-        lookup = WikidataLookup()
+        lookup = WikidataLookup(cache=self.wikidata_lookup.cache, index=self.wikidata_lookup.index)
+        strings = []
         for i, lxml_entry in enumerate(lxml_entries):
             if i >= maxhits:
                 break
@@ -1048,29 +1290,52 @@ class AmiDictionary:
                 string = ami_entry.get_term()
                 if not string:
                     string = ami_entry.get_name()
+            strings.append(string)
 
-            lookup.get_possible_wikidata_hits(string)
+        if executor is not None:
+            lookup.get_possible_wikidata_hits_for_names(strings, executor)
+        else:
+            for string in strings:
+                lookup.get_possible_wikidata_hits(string)
         return lookup
 
-    def markup_html_from_dictionary(self, target_path, output_path, background_color):
-        term_set = self.get_or_create_term_set()
-        re_join = '|'.join(term_set)
-        try:
-            rec = re.compile(f"(.*?)({re_join})(.*)")
-        except Exception as e:
-            logging.error(f"dictionary {self.title}: Cannot parse terms into regex: \n{re_join}\n please remove or escape characters")
-            return None
+    def markup_html_from_dictionary(self, target_path, output_path, background_color, word_boundary=False):
+        """annotates div/span text in target_path with terms from dictionary and writes annotated html and index
+        each span text is scanned once by the term automaton and split at the leftmost-longest
+        non-overlapping matches; matches become <a> elements
+        :param target_path: html file with div/span structure
+        :param output_path: annotated html file (index.html written alongside)
+        :param background_color: for matched terms
+        :param word_boundary: if True terms must not be embedded in longer words
+        :return: (id_dict, multidict) from write_annotated_html()
+        """
         target_elem = lxml.etree.parse(str(target_path))
         div_spans = target_elem.xpath(f".//{H_DIV}/{H_SPAN}")
-        for span in div_spans:
-            text = span.text
-            new_elems = HtmlUtil.split_span_at_match(span, rec, new_tags=[H_SPAN, H_A, H_SPAN],
-                                                     recurse=True, id_root=f"{span.attrib['id']}_", id_counter=0)
-        self.convert_matched_spans_to_a(target_elem)
+        self.annotate_spans_with_terms(div_spans, word_boundary=word_boundary)
 
         id_dict, multidict = self.write_annotated_html(background_color, output_path, target_elem)
 
         self.write_index(id_dict, multidict, output_path)
+        return id_dict, multidict
+
+    def annotate_spans_with_terms(self, spans, word_boundary=False):
+        """splits spans at dictionary terms, wrapping each match in <a class="re_match">
+        uses cached term automaton (case-folded if self.ignorecase)
+        :param spans: list of span elements (each must have a parent and an id)
+        :param word_boundary: if True terms must not be embedded in longer words
+        :return: number of matches
+        """
+        automaton = self.get_or_create_term_automaton(ignorecase=self.ignorecase)
+        match_count = 0
+        for span in spans:
+            hits = automaton.find_longest_non_overlapping(HtmlUtil.get_text_content(span), word_boundary=word_boundary)
+            if not hits:
+                continue
+            match_count += len(hits)
+            HtmlUtil.split_span_at_offsets(span, [(start, end) for start, end, _ in hits],
+                                           new_tags=[H_SPAN, H_A, H_SPAN],
+                                           id_root=f"{span.attrib['id']}_", id_counter=0)
+        return match_count
 
     def write_annotated_html(self, background_color, output_path,
                              target_elem):
@@ -1353,6 +1618,853 @@ class AmiSynonym:
         return ami_synonym
 
 
+class AmiTermAutomaton:
+    """Aho-Corasick automaton for finding all dictionary terms in a text in a single pass
+
+    built once from a set of terms (single- or multi-word) and then applied to any number of texts.
+    Matching time is linear in the length of the text (plus number of hits) and independent
+    of the number of terms.
+
+        automaton = AmiTermAutomaton.create_from_terms(["carbon dioxide", "methane"])
+        hits = automaton.find_all("Methane and carbon dioxide")
+        # [(0, 7, 'methane'), (12, 26, 'carbon dioxide')]
+
+    offsets are into the original text; terms are returned in their (possibly casefolded) stored form
+    """
+
+    def __init__(self, ignorecase=True, word_boundary=True):
+        """
+        :param ignorecase: fold case of terms and text before matching
+        :param word_boundary: only report hits not embedded in longer words (alphanumeric neighbours)
+        """
+        self.ignorecase = ignorecase
+        self.word_boundary = word_boundary
+        # state 0 is root; each state has transitions (dict), failure link, own term and output term indexes
+        self.goto = [dict()]
+        self.fail = [0]
+        self.state_term = [None]
+        self.output = [[]]
+        self.terms = []
+        self.built = False
+
+    @classmethod
+    def create_from_terms(cls, terms, ignorecase=True, word_boundary=True):
+        """create and build automaton
+        :param terms: iterable of strings (empty or None terms are ignored)
+        :param ignorecase: see __init__
+        :param word_boundary: see __init__
+        :return: built AmiTermAutomaton
+        """
+        automaton = AmiTermAutomaton(ignorecase=ignorecase, word_boundary=word_boundary)
+        for term in terms:
+            automaton.add_term(term)
+        automaton.build()
+        return automaton
+
+    def fold(self, text):
+        """casefolds text (if ignorecase) character by character so that offsets are preserved
+        :param text: to fold
+        :return: folded string of same length as text
+        """
+        if not self.ignorecase:
+            return text
+        folded = text.lower()
+        if len(folded) == len(text):
+            return folded
+        # rare characters (e.g. dotted I) expand on lowering; keep them unchanged
+        return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+    def add_term(self, term):
+        """add term to the trie; automaton must be (re)built before matching
+        :param term: string to add; ignored if empty
+        """
+        if not term:
+            return
+        key = self.fold(term)
+        state = 0
+        for char in key:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append(dict())
+                self.fail.append(0)
+                self.state_term.append(None)
+                self.output.append([])
+            state = next_state
+        if self.state_term[state] is None:
+            self.state_term[state] = len(self.terms)
+            self.terms.append(key)
+        self.built = False
+
+    def build(self):
+        """computes failure links by breadth-first traversal and merges outputs"""
+        self.output = [[] if term_index is None else [term_index] for term_index in self.state_term]
+        queue = []
+        for state in self.goto[0].values():
+            self.fail[state] = 0
+            queue.append(state)
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                fail_state = self.goto[fail_state].get(char, 0)
+                self.fail[next_state] = fail_state
+                self.output[next_state] = self.output[next_state] + self.output[fail_state]
+        self.built = True
+        return self
+
+    def find_all(self, text, word_boundary=None):
+        """find all (possibly overlapping) occurrences of terms in text
+        :param text: string to search
+        :param word_boundary: overrides self.word_boundary if not None
+        :return: list of (start, end, term) tuples in order of end offset
+        """
+        if not self.built:
+            self.build()
+        word_boundary = self.word_boundary if word_boundary is None else word_boundary
+        hits = []
+        if not text:
+            return hits
+        folded = self.fold(text)
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for i, char in enumerate(folded):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                end = i + 1
+                for term_index in output[state]:
+                    term = self.terms[term_index]
+                    start = end - len(term)
+                    if word_boundary and not self.is_at_word_boundary(text, start, end):
+                        continue
+                    hits.append((start, end, term))
+        return hits
+
+    def find_longest_non_overlapping(self, text, word_boundary=None):
+        """find leftmost-longest non-overlapping occurrences of terms in text
+        :param text: string to search
+        :param word_boundary: overrides self.word_boundary if not None
+        :return: list of (start, end, term) tuples in text order
+        """
+        hits = sorted(self.find_all(text, word_boundary=word_boundary), key=lambda hit: (hit[0], -hit[1]))
+        selected = []
+        last_end = 0
+        for hit in hits:
+            if hit[0] >= last_end:
+                selected.append(hit)
+                last_end = hit[1]
+        return selected
+
+    @classmethod
+    def is_at_word_boundary(cls, text, start, end):
+        """True if text[start:end] is not preceded or followed by an alphanumeric character"""
+        if start > 0 and text[start - 1].isalnum():
+            return False
+        if end < len(text) and text[end].isalnum():
+            return False
+        return True
+
+
+class AmiCompiledDictionary(Mapping):
+    """read-only binary form of an AmiDictionary, memory-mapped so that it loads without parsing XML
+
+    written by AmiDictionary.compile() as a sidecar next to the XML file (dict.xml => dict.amidict)
+    and valid only while the SHA-256 of the XML file matches the one stored in the header.
+    Layout (little-endian):
+
+        header      magic, version, flags, xml sha256, counts, title and table offsets
+        entries     fixed records: term, wikidataID, serialized <entry>, first synonym, synonym count
+        terms       fixed records: lowercase key, entry index; sorted by UTF-8 key for binary search
+        synonyms    fixed records: text, xml:lang, type
+        pool        UTF-8 strings referenced by (offset, length) from the tables
+
+    Term lookup, wikidataIDs and synonyms are read directly from the map; the full <entry> is only
+    parsed (by lxml, from its own bytes) when the element is requested.
+    Acts as a Mapping of lowercase term => lxml entry, so it can replace AmiDictionary.entry_by_term.
+
+        compiled = AmiCompiledDictionary.read(AmiCompiledDictionary.get_compiled_path(xml_file))
+        compiled.find_entry_index("cone")
+    """
+    MAGIC = b"AMIDICT\x00"
+    VERSION = 2
+    SUFFIX = ".amidict"
+    IGNORECASE_FLAG = 1
+
+    HEADER = struct.Struct("<8sII32sIIIIIQQQQ")
+    ENTRY_RECORD = struct.Struct("<IIIIIIII")
+    TERM_RECORD = struct.Struct("<III")
+    SYNONYM_RECORD = struct.Struct("<IIIIII")
+
+    def __init__(self):
+        self.mmap = None
+        self.path = None
+        self.version = None
+        self.ignorecase = False
+        self.xml_hash = None
+        self.entry_count = 0
+        self.term_count = 0
+        self.synonym_count = 0
+        self.title = None
+        self.entry_table_offset = 0
+        self.term_table_offset = 0
+        self.synonym_table_offset = 0
+        self.pool_offset = 0
+        self.element_by_index = dict()
+
+    @classmethod
+    def get_compiled_path(cls, xml_file):
+        """
+        :param xml_file: XML dictionary file
+        :return: path of binary sidecar (same stem, SUFFIX)
+        """
+        return Path(xml_file).with_suffix(cls.SUFFIX)
+
+    @classmethod
+    def hash_file(cls, file):
+        """
+        :param file: file to hash
+        :return: SHA-256 digest (bytes) of file content
+        """
+        sha = hashlib.sha256()
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        return sha.digest()
+
+    @classmethod
+    def read_header(cls, compiled_file):
+        """reads only the header of a compiled file
+        :param compiled_file: binary file
+        :return: unpacked header tuple or None if missing, short or of wrong magic/version
+        """
+        try:
+            with open(compiled_file, "rb") as f:
+                data = f.read(cls.HEADER.size)
+        except OSError:
+            return None
+        if len(data) < cls.HEADER.size:
+            return None
+        header = cls.HEADER.unpack(data)
+        if header[0] != cls.MAGIC or header[1] != cls.VERSION:
+            return None
+        return header
+
+    @classmethod
+    def is_current(cls, xml_file, compiled_file=None):
+        """
+        :param xml_file: XML dictionary file
+        :param compiled_file: binary file (default get_compiled_path(xml_file))
+        :return: True if compiled_file exists, has this VERSION and was compiled from the present content of xml_file
+        """
+        compiled_file = cls.get_compiled_path(xml_file) if compiled_file is None else compiled_file
+        header = cls.read_header(compiled_file)
+        if header is None or not Path(xml_file).exists():
+            return False
+        return header[3] == cls.hash_file(xml_file)
+
+    @classmethod
+    def write(cls, entries, compiled_file, xml_hash, title=None, ignorecase=False):
+        """writes entries in compiled form; the file is replaced atomically
+        :param entries: iterable of lxml <entry> elements
+        :param compiled_file: output path
+        :param xml_hash: SHA-256 digest of the XML source (see hash_file)
+        :param title: dictionary title
+        :param ignorecase: flag stored for AmiDictionary.match
+        :return: Path of compiled_file
+        """
+        pool = bytearray()
+        offset_by_string = dict()
+
+        def add_string(string):
+            """adds string to pool (once) and returns (offset, length)"""
+            if string is None:
+                return 0, 0
+            ref = offset_by_string.get(string)
+            if ref is None:
+                data = string.encode("utf-8")
+                ref = (len(pool), len(data))
+                pool.extend(data)
+                offset_by_string[string] = ref
+            return ref
+
+        entry_records = []
+        synonym_records = []
+        index_by_key = dict()
+        for entry in entries:
+            term = entry.get(TERM)
+            if term is None:
+                continue
+            term = term.strip()
+            key = term.lower()
+            if key in index_by_key:
+                logger.warning(f"duplicate terms not allowed {key}")
+                continue
+            index_by_key[key] = len(entry_records)
+            synonym_start = len(synonym_records)
+            for synonym in entry.findall(SYNONYM):
+                text = "".join(synonym.itertext()).strip()
+                synonym_records.append(add_string(text) + add_string(synonym.get(XML_LANG, "")) +
+                                       add_string(synonym.get(TYPE, "")))
+            element_bytes = ET.tostring(entry, encoding="utf-8", with_tail=False)
+            element_ref = (len(pool), len(element_bytes))
+            pool.extend(element_bytes)
+            entry_records.append(add_string(term) + add_string(entry.get(WIKIDATA_ID)) + element_ref +
+                                 (synonym_start, len(synonym_records) - synonym_start))
+        term_records = [add_string(key) + (index,) for key, index in
+                        sorted(index_by_key.items(), key=lambda item: item[0].encode("utf-8"))]
+        title_ref = add_string(title)
+
+        entry_table_offset = cls.HEADER.size
+        term_table_offset = entry_table_offset + len(entry_records) * cls.ENTRY_RECORD.size
+        synonym_table_offset = term_table_offset + len(term_records) * cls.TERM_RECORD.size
+        pool_offset = synonym_table_offset + len(synonym_records) * cls.SYNONYM_RECORD.size
+        header = cls.HEADER.pack(cls.MAGIC, cls.VERSION, cls.IGNORECASE_FLAG if ignorecase else 0, xml_hash,
+                                 len(entry_records), len(term_records), len(synonym_records), *title_ref,
+                                 entry_table_offset, term_table_offset, synonym_table_offset, pool_offset)
+        compiled_file = Path(compiled_file)
+        temp_file = compiled_file.with_name(compiled_file.name + ".tmp")
+        with open(temp_file, "wb") as f:
+            f.write(header)
+            for table, record in [(entry_records, cls.ENTRY_RECORD), (term_records, cls.TERM_RECORD),
+                                  (synonym_records, cls.SYNONYM_RECORD)]:
+                f.write(b"".join(record.pack(*row) for row in table))
+            f.write(pool)
+        os.replace(temp_file, compiled_file)
+        return compiled_file
+
+    @classmethod
+    def read(cls, compiled_file):
+        """memory-maps a compiled dictionary
+        :param compiled_file: file written by write()
+        :return: AmiCompiledDictionary
+        :raises AMIDictError: if file has wrong magic or version
+        """
+        header = cls.read_header(compiled_file)
+        if header is None:
+            raise AMIDictError(f"not a version {cls.VERSION} compiled dictionary: {compiled_file}")
+        compiled = AmiCompiledDictionary()
+        compiled.path = Path(compiled_file)
+        (_, compiled.version, flags, compiled.xml_hash, compiled.entry_count, compiled.term_count,
+         compiled.synonym_count, title_offset, title_length, compiled.entry_table_offset,
+         compiled.term_table_offset, compiled.synonym_table_offset, compiled.pool_offset) = header
+        compiled.ignorecase = bool(flags & cls.IGNORECASE_FLAG)
+        with open(compiled_file, "rb") as f:
+            compiled.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        compiled.title = compiled.get_string(title_offset, title_length) if title_length else None
+        return compiled
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+    def get_bytes(self, offset, length):
+        start = self.pool_offset + offset
+        return self.mmap[start:start + length]
+
+    def get_string(self, offset, length):
+        return self.get_bytes(offset, length).decode("utf-8")
+
+    def get_entry_record(self, index):
+        return self.ENTRY_RECORD.unpack_from(self.mmap, self.entry_table_offset + index * self.ENTRY_RECORD.size)
+
+    def get_term_record(self, position):
+        return self.TERM_RECORD.unpack_from(self.mmap, self.term_table_offset + position * self.TERM_RECORD.size)
+
+    def find_entry_index(self, term):
+        """binary search of the sorted term table
+        :param term: term (any case)
+        :return: index of entry whose lowercase term equals term.lower(), else None
+        """
+        if term is None:
+            return None
+        key = term.strip().lower().encode("utf-8")
+        low, high = 0, self.term_count
+        while low < high:
+            mid = (low + high) // 2
+            key_offset, key_length, index = self.get_term_record(mid)
+            mid_key = self.get_bytes(key_offset, key_length)
+            if mid_key < key:
+                low = mid + 1
+            elif mid_key > key:
+                high = mid
+            else:
+                return index
+        return None
+
+    def get_term(self, index):
+        """:return: term (original case) of entry index"""
+        record = self.get_entry_record(index)
+        return self.get_string(record[0], record[1])
+
+    def get_wikidata_id(self, index):
+        """:return: wikidataID of entry index or None"""
+        record = self.get_entry_record(index)
+        return self.get_string(record[2], record[3]) if record[3] else None
+
+    def get_synonyms(self, index):
+        """
+        :param index: entry index
+        :return: list of (text, lang, type) for <synonym> children; lang and type are "" if absent
+        """
+        record = self.get_entry_record(index)
+        synonyms = []
+        for i in range(record[6], record[6] + record[7]):
+            refs = self.SYNONYM_RECORD.unpack_from(self.mmap, self.synonym_table_offset + i * self.SYNONYM_RECORD.size)
+            synonyms.append(tuple(self.get_string(refs[j], refs[j + 1]) for j in range(0, len(refs), 2)))
+        return synonyms
+
+    def get_element(self, index):
+        """parses (once) the serialized <entry> for index
+        :param index: entry index
+        :return: lxml element (not attached to a dictionary root)
+        """
+        element = self.element_by_index.get(index)
+        if element is None:
+            record = self.get_entry_record(index)
+            element = ET.fromstring(self.get_bytes(record[4], record[5]))
+            self.element_by_index[index] = element
+        return element
+
+    def iter_terms(self):
+        """:return: generator of terms (original case) in entry order"""
+        return (self.get_term(index) for index in range(self.entry_count))
+
+    def get_entry_list(self):
+        """:return: lazy Sequence of entry elements (see AmiCompiledEntryList)"""
+        return AmiCompiledEntryList(self)
+
+    # Mapping of lowercase term => element
+
+    def __getitem__(self, term):
+        index = self.find_entry_index(term)
+        if index is None:
+            raise KeyError(term)
+        return self.get_element(index)
+
+    def __contains__(self, term):
+        return isinstance(term, str) and self.find_entry_index(term) is not None
+
+    def __iter__(self):
+        for position in range(self.term_count):
+            key_offset, key_length, _ = self.get_term_record(position)
+            yield self.get_string(key_offset, key_length)
+
+    def __len__(self):
+        return self.term_count
+
+
+class AmiCompiledEntryList(Sequence):
+    """entries of an AmiCompiledDictionary in document order, parsed only when accessed"""
+
+    def __init__(self, compiled):
+        self.compiled = compiled
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.compiled.get_element(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.compiled.get_element(index)
+
+    def __len__(self):
+        return self.compiled.entry_count
+
+
+class AmiTermIndex:
+    """multilingual index of the terms and synonyms of a dictionary, built once per dictionary
+
+    maps the normalized surface form of every term and name synonym (any language) to its entry key
+    (the lowercase term, as in AmiDictionary.entry_by_term) and each entry key to its label per language
+    (from <synonym xml:lang="..">) and wikidataID, so matching and labelling of hits are dict lookups.
+    Untyped synonyms may be comma-separated lists ("Cone, Conifer cones, Strobilus") and are split;
+    synonyms with a type other than NAME_SYNONYM_TYPES (e.g. wikidata_hits) are not names and are ignored.
+
+        term_index = dictionary.get_or_create_term_index()
+        term_index.get_entry_key("Strobilus")  # 'cone'
+        term_index.get_label("cone", "fr")  # 'cône'
+    """
+    NAME_SYNONYM_TYPES = {"", "abbreviation"}
+    SYNONYM_LIST_RE = re.compile(r",\s+")
+
+    def __init__(self):
+        self.entry_key_by_surface = dict()
+        self.label_by_lang_by_key = dict()
+        self.wikidata_id_by_key = dict()
+        self.pending_synonyms = []  # (key, text, lang) waiting for add_synonym_surfaces()
+
+    @classmethod
+    def normalize(cls, text):
+        """
+        :param text: term or synonym
+        :return: lowercase with whitespace runs collapsed to single spaces, or None if empty
+        """
+        if text is None:
+            return None
+        text = " ".join(text.split()).lower()
+        return text if text else None
+
+    @classmethod
+    def create_from_dictionary(cls, dictionary):
+        """
+        reads terms, wikidataIDs and synonyms from the compiled form if present (no XML parsing), else from entries
+        :param dictionary: AmiDictionary
+        :return: AmiTermIndex
+        """
+        term_index = AmiTermIndex()
+        compiled = dictionary.compiled
+        if compiled is not None:
+            for index in range(compiled.entry_count):
+                term_index.add_entry(compiled.get_term(index), compiled.get_wikidata_id(index),
+                                     compiled.get_synonyms(index))
+        else:
+            for entry in dictionary.entries:
+                if TERM not in entry.attrib:
+                    continue
+                synonyms = [("".join(synonym.itertext()), synonym.get(XML_LANG, ""), synonym.get(TYPE, ""))
+                            for synonym in entry.findall(SYNONYM)]
+                term_index.add_entry(entry.get(TERM), entry.get(WIKIDATA_ID), synonyms)
+        term_index.add_synonym_surfaces()
+        return term_index
+
+    def add_entry(self, term, wikidata_id, synonyms):
+        """
+        adds term as surface form and records labels; synonym surfaces are added by add_synonym_surfaces()
+        so that terms take precedence over synonyms of other entries
+        :param term: term of entry
+        :param wikidata_id: wikidataID or None
+        :param synonyms: list of (text, lang, type); lang and type may be ""
+        """
+        key = self.normalize(term)
+        if key is None or key in self.label_by_lang_by_key:
+            return
+        self.entry_key_by_surface.setdefault(key, key)
+        label_by_lang = dict()
+        self.label_by_lang_by_key[key] = label_by_lang
+        if wikidata_id:
+            self.wikidata_id_by_key[key] = wikidata_id
+        for text, lang, synonym_type in synonyms:
+            text = text.strip()
+            if not text or synonym_type not in self.NAME_SYNONYM_TYPES:
+                continue
+            if lang:
+                # first synonym in a language is its label
+                label_by_lang.setdefault(lang, text)
+            self.pending_synonyms.append((key, text, lang))
+
+    def add_synonym_surfaces(self):
+        """adds synonyms collected by add_entry() as surface forms unless already a term or earlier synonym"""
+        for key, text, lang in self.pending_synonyms:
+            surfaces = [text] if lang else self.SYNONYM_LIST_RE.split(text)
+            for surface in surfaces:
+                surface = self.normalize(surface)
+                if surface is not None:
+                    self.entry_key_by_surface.setdefault(surface, key)
+        self.pending_synonyms.clear()
+
+    def get_entry_key(self, surface):
+        """
+        :param surface: term or synonym in any language (any case)
+        :return: entry key (lowercase term) or None
+        """
+        return self.entry_key_by_surface.get(self.normalize(surface))
+
+    def get_label(self, key, lang):
+        """
+        :param key: entry key (see get_entry_key)
+        :param lang: language code (e.g. 'fr')
+        :return: label in lang or None
+        """
+        label_by_lang = self.label_by_lang_by_key.get(key)
+        return None if label_by_lang is None else label_by_lang.get(lang)
+
+    def get_wikidata_id(self, key):
+        """:return: wikidataID of entry key or None"""
+        return self.wikidata_id_by_key.get(key)
+
+    def __len__(self):
+        return len(self.entry_key_by_surface)
+
+
+class AmiFuzzyTermIndex:
+    """approximate (edit distance) lookup of words against the terms of a dictionary
+
+    symmetric-delete index: every indexed form is stored under all strings made by deleting up to
+    max_distance characters, and a word is looked up through its own deletes, so candidates within
+    max_distance are found with a few dict lookups (no scan of the terms); candidates are verified
+    with a bounded Levenshtein distance. Built once per dictionary and distance (see
+    AmiDictionary.get_or_create_fuzzy_index()).
+
+    Words and terms are folded by normalize() so that typical PDF/OCR variants match at distance 0:
+    ligatures (NFKD), diacritics (as TextUtil.flatten_xml_to_text), soft and hard hyphens and case.
+    Characters dropped by TextUtil.flatten_non_ascii without NFKD ('cne' for 'cône') cost one edit each.
+    Forms shorter than min_length are only matched exactly.
+
+        fuzzy_index = dictionary.get_or_create_fuzzy_index(max_distance=1)
+        fuzzy_index.lookup("flowcr")  # [('flower', 1)]
+        fuzzy_index.lookup("ﬂower")  # [('flower', 0)] (ligature)
+    """
+    DEFAULT_MAX_DISTANCE = 1
+    MIN_LENGTH = 4
+    CACHE_MAX_SIZE = 65536  # lookups kept in hits_by_word; least-recently-used are evicted
+    HYPHEN_RE = re.compile("[\u00ad\u2010\u2011-]")
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, min_length=MIN_LENGTH):
+        """
+        :param max_distance: maximum edit distance of candidates (memory grows steeply with it; 1 or 2)
+        :param min_length: forms shorter than this are not matched approximately
+        """
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self.keys_by_form = dict()
+        self.forms_by_delete = dict()
+        self.hits_by_word = OrderedDict()  # LRU lookup cache (CACHE_MAX_SIZE); words recur within and across sections
+
+    @classmethod
+    def normalize(cls, text):
+        """
+        :param text: word or term
+        :return: NFKD-decomposed lowercase text without combining marks, hyphens or whitespace; None if empty
+        """
+        if text is None:
+            return None
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        text = "".join(cls.HYPHEN_RE.sub("", text).lower().split())
+        return text if text else None
+
+    @classmethod
+    def create_from_surfaces(cls, entry_key_by_surface, max_distance=DEFAULT_MAX_DISTANCE, min_length=MIN_LENGTH):
+        """
+        :param entry_key_by_surface: dict or iterable of (surface, key), e.g. AmiTermIndex.entry_key_by_surface
+        :param max_distance: see __init__
+        :param min_length: see __init__
+        :return: AmiFuzzyTermIndex
+        """
+        fuzzy_index = AmiFuzzyTermIndex(max_distance=max_distance, min_length=min_length)
+        items = entry_key_by_surface.items() if isinstance(entry_key_by_surface, dict) else entry_key_by_surface
+        for surface, key in items:
+            fuzzy_index.add(surface, key)
+        return fuzzy_index
+
+    def add(self, surface, key):
+        """
+        :param surface: term or synonym
+        :param key: value returned by lookup() for surface (normally the lowercase term)
+        """
+        form = self.normalize(surface)
+        if form is None:
+            return
+        keys = self.keys_by_form.setdefault(form, [])
+        if key not in keys:
+            keys.append(key)
+        if len(form) >= self.min_length:
+            for delete in self.create_deletes(form, self.max_distance):
+                self.forms_by_delete.setdefault(delete, set()).add(form)
+        self.hits_by_word.clear()
+
+    @classmethod
+    def create_deletes(cls, form, max_distance):
+        """
+        :param form: normalized string
+        :param max_distance: maximum number of deleted characters
+        :return: set of form and all strings with up to max_distance characters deleted
+        """
+        deletes = {form}
+        edge = {form}
+        for _ in range(max_distance):
+            edge = {text[:i] + text[i + 1:] for text in edge if len(text) > 1 for i in range(len(text))} - deletes
+            deletes |= edge
+        return deletes
+
+    @classmethod
+    def get_distance(cls, text1, text2, max_distance):
+        """Levenshtein distance, abandoned once it must exceed max_distance
+        :return: distance or None if > max_distance
+        """
+        if abs(len(text1) - len(text2)) > max_distance:
+            return None
+        previous = list(range(len(text2) + 1))
+        for i, c1 in enumerate(text1, 1):
+            current = [i]
+            for j, c2 in enumerate(text2, 1):
+                current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (c1 != c2)))
+            if min(current) > max_distance:
+                return None
+            previous = current
+        return previous[-1] if previous[-1] <= max_distance else None
+
+    def lookup(self, word, max_distance=None):
+        """
+        :param word: word from text (any case)
+        :param max_distance: at most self.max_distance (default)
+        :return: list of (key, distance) within max_distance, nearest first; empty if none
+        """
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        cache_key = (word, max_distance)
+        hits = self.hits_by_word.get(cache_key)
+        if hits is not None:
+            self.hits_by_word.move_to_end(cache_key)
+            return hits
+        form = self.normalize(word)
+        distance_by_key = dict()
+        if form is not None:
+            for key in self.keys_by_form.get(form, []):
+                distance_by_key[key] = 0
+            if max_distance > 0 and len(form) >= self.min_length:
+                candidates = set()
+                for delete in self.create_deletes(form, max_distance):
+                    candidates |= self.forms_by_delete.get(delete, set())
+                candidates.discard(form)
+                for candidate in candidates:
+                    distance = self.get_distance(form, candidate, max_distance)
+                    if distance is None:
+                        continue
+                    for key in self.keys_by_form[candidate]:
+                        if distance < distance_by_key.get(key, max_distance + 1):
+                            distance_by_key[key] = distance
+        hits = sorted(distance_by_key.items(), key=lambda hit: (hit[1], hit[0]))
+        self.hits_by_word[cache_key] = hits
+        if len(self.hits_by_word) > self.CACHE_MAX_SIZE:
+            self.hits_by_word.popitem(last=False)
+        return hits
+
+    def match_words(self, words, max_distance=None):
+        """nearest hit for each word; a word ending in a hyphen is first tried joined to the next
+        (hyphenation at line ends)
+        :param words: list of words
+        :param max_distance: see lookup()
+        :return: list of (word, key, distance) (word is the joined text for hyphenated words)
+        """
+        matched = []
+        i = 0
+        while i < len(words):
+            word = words[i]
+            if self.HYPHEN_RE.search(word[-1:]) and i + 1 < len(words):
+                joined = word + words[i + 1]
+                hits = self.lookup(joined, max_distance=max_distance)
+                if hits:
+                    matched.append((joined, hits[0][0], hits[0][1]))
+                    i += 2
+                    continue
+            hits = self.lookup(word, max_distance=max_distance)
+            if hits:
+                matched.append((word, hits[0][0], hits[0][1]))
+            i += 1
+        return matched
+
+    def __len__(self):
+        return len(self.keys_by_form)
+
+
+class AmiDictionaryRegistry:
+    """process-wide cache of AmiDictionary objects read from XML files
+
+    keyed by resolved path, file mtime and ignorecase, so an edited file is re-read;
+    least-recently-used dictionaries are evicted when there are more than max_size.
+    Cached dictionaries are shared, so callers should not edit them (use AmiDictionary.create_from_xml_file()
+    for a private copy)
+
+    If use_compiled is True dictionaries are loaded from their compiled sidecars
+    (AmiDictionary.create_from_compiled_file), which are written on first use.
+
+    Usage:
+        dictionary = AmiDictionaryRegistry.get_dictionary(file)
+        print(AmiDictionaryRegistry.get_stats())
+    """
+    DEFAULT_MAX_SIZE = 32
+
+    max_size = DEFAULT_MAX_SIZE
+    use_compiled = False
+    dictionary_by_key = OrderedDict()
+    lock = threading.RLock()
+    stats = Counter()
+
+    @classmethod
+    def get_dictionary(cls, file, ignorecase=False, compiled=None):
+        """returns cached AmiDictionary for file, reading it if absent or if the file has changed
+        :param file: XML dictionary file
+        :param ignorecase: see AmiDictionary.create_from_xml_file
+        :param compiled: if True read through the compiled sidecar (default cls.use_compiled)
+        :return: AmiDictionary or None if file is None or cannot be read
+        """
+        if file is None:
+            return None
+        path = Path(file).resolve()
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            logging.warning(f"cannot find dictionary path {file}")
+            return None
+        key = (str(path), mtime, ignorecase)
+        with cls.lock:
+            dictionary = cls.dictionary_by_key.get(key)
+            if dictionary is not None:
+                cls.dictionary_by_key.move_to_end(key)
+                cls.stats["hits"] += 1
+                return dictionary
+            cls.stats["misses"] += 1
+            # remove versions of the file with an older mtime
+            for stale_key in [k for k in cls.dictionary_by_key if k[0] == key[0] and k[2] == ignorecase]:
+                del cls.dictionary_by_key[stale_key]
+            compiled = cls.use_compiled if compiled is None else compiled
+            if compiled:
+                dictionary = AmiDictionary.create_from_compiled_file(str(path), ignorecase=ignorecase)
+            else:
+                dictionary = AmiDictionary.create_from_xml_file(str(path), ignorecase=ignorecase)
+            if dictionary is None:
+                return None
+            cls.dictionary_by_key[key] = dictionary
+            while len(cls.dictionary_by_key) > cls.max_size:
+                cls.dictionary_by_key.popitem(last=False)
+                cls.stats["evictions"] += 1
+            return dictionary
+
+    @classmethod
+    def get_stats(cls):
+        """
+        :return: dict with hits, misses, evictions, size and max_size
+        """
+        with cls.lock:
+            return {
+                "hits": cls.stats["hits"],
+                "misses": cls.stats["misses"],
+                "evictions": cls.stats["evictions"],
+                "size": len(cls.dictionary_by_key),
+                "max_size": cls.max_size,
+            }
+
+    @classmethod
+    def set_max_size(cls, max_size):
+        """sets maximum number of cached dictionaries, evicting least-recently-used if necessary"""
+        if max_size < 1:
+            raise ValueError(f"max_size must be positive, found {max_size}")
+        with cls.lock:
+            cls.max_size = max_size
+            while len(cls.dictionary_by_key) > cls.max_size:
+                cls.dictionary_by_key.popitem(last=False)
+                cls.stats["evictions"] += 1
+
+    @classmethod
+    def clear(cls):
+        """empties cache and resets statistics"""
+        with cls.lock:
+            cls.dictionary_by_key.clear()
+            cls.stats.clear()
+
+
 class AmiDictionaries:
     """collection of current and some historic dictionaries"""
 
@@ -1495,7 +2607,7 @@ class AmiDictionaries:
                             key + " in " + str(self.dictionary_dict))
         FileLib.check_exists(file)
         try:
-            dictionary = AmiDictionary.create_from_xml_file(file)
+            dictionary = AmiDictionaryRegistry.get_dictionary(file)
             self.dictionary_dict[key] = dictionary
         except Exception as ex:
             print("Failed to read dictionary", file, ex)
@@ -1522,6 +2634,7 @@ class AmiDictArgs(AbstractArgs):
     def __init__(self):
         """arg_dict is set to default"""
         super().__init__()
+        self.compile = None
         self.dictfile = None
         self.metadata = None
         self.language = None
@@ -1531,6 +2644,8 @@ class AmiDictArgs(AbstractArgs):
         self.synonym = None
         self.validate = None
         self.wikidata = None
+        self.wikidata_dump = None
+        self.wikidata_index = None
         self.wikipedia = None
         self.ami_dict = None
 
@@ -1539,6 +2654,8 @@ class AmiDictArgs(AbstractArgs):
             self.parser = argparse.ArgumentParser()
         """adds arguments to a parser or subparser"""
         self.parser.description = 'AMI dictionary creation, validation, editing'
+        self.parser.add_argument(f"--{COMPILE}", action="store_true",
+                                 help="write/refresh the binary sidecar (dict.amidict) for fast loading of --dict")
         self.parser.add_argument(f"--{DELETE}", type=str, nargs="+",
                                  help="list of entries (terms) to delete ? duplicates (NYI)")
         self.parser.add_argument(f"--{DICT}", type=str, nargs=1,
@@ -1553,6 +2670,10 @@ class AmiDictArgs(AbstractArgs):
                                  help="add sysnonyms (from Wikidata) for terms (NYI)")
         self.parser.add_argument(f"--{VALIDATE}", action="store_true", help="validate dictionary")
         self.parser.add_argument(f"--{WIKIDATA}", type=str, nargs="*", help="add WikidataIDs (NYI)")
+        self.parser.add_argument(f"--{WIKIDATA_DUMP}", type=str, nargs=1,
+                                 help="Wikidata JSON dump (.json, .json.bz2, .json.gz) to stream into --wikidata_index")
+        self.parser.add_argument(f"--{WIKIDATA_INDEX}", type=str, nargs=1,
+                                 help="offline Wikidata index (SQLite) used instead of the web for --wikidata")
         self.parser.add_argument(f"--{WIKIPEDIA}", type=str, nargs="*",
                                  help="add Wikipedia link/s (forces --{WIKIDATA}) (NYI)")
         self.parser.add_argument(f"--{WORDS}", type=str, nargs=1,
@@ -1582,6 +2703,7 @@ class AmiDictArgs(AbstractArgs):
         if not self.arg_dict:
             print(f"no arg_dict given, no actiom")
 
+        self.compile = self.arg_dict.get(COMPILE)
         self.delete = self.arg_dict.get(DELETE)
         self.dictfile = self.arg_dict.get(DICT)
         self.filter = self.arg_dict.get(FILTER)
@@ -1591,9 +2713,21 @@ class AmiDictArgs(AbstractArgs):
         self.synonym = self.arg_dict.get(SYNONYM)
         self.validate = self.arg_dict.get(VALIDATE)
         self.wikidata = self.arg_dict.get(WIKIDATA)
+        self.wikidata_dump = self.arg_dict.get(WIKIDATA_DUMP)
+        wikidata_index = self.arg_dict.get(WIKIDATA_INDEX)
         self.wikipedia = self.arg_dict.get(WIKIPEDIA)
         self.words = self.arg_dict.get(WORDS)
 
+        if self.wikidata_dump:
+            if not wikidata_index:
+                print(f"--{WIKIDATA_DUMP} needs --{WIKIDATA_INDEX}")
+            else:
+                self.wikidata_index = WikidataDumpIndex.build_from_dump(
+                    self.wikidata_dump, wikidata_index, lang=self.language if type(self.language) is str else "en")
+                print(f"indexed {len(self.wikidata_index)} entities in {wikidata_index}")
+        elif wikidata_index:
+            self.wikidata_index = WikidataDumpIndex(wikidata_index)
+
         if self.dictfile:
             if self.ami_dict is not None:
                 with open(self.dictfile, "w") as f:
@@ -1604,6 +2738,9 @@ class AmiDictArgs(AbstractArgs):
                 self.ami_dict = self.build_or_edit_dictionary()
                 if self.ami_dict is None:
                     print(f"failed to read/compile dictionaty {self.dictfile}")
+                elif self.compile:
+                    compiled_file = self.ami_dict.compile(AmiCompiledDictionary.get_compiled_path(self.dictfile))
+                    print(f"compiled dictionary: {compiled_file}")
 
         if self.validate:
             if self.ami_dict is None:
@@ -1650,7 +2787,7 @@ class AmiDictArgs(AbstractArgs):
         desc_counter = Counter()
         hit_dict = dict()
         if self.dictfile is not None and self.ami_dict is not None:
-            wikidata_lookup = WikidataLookup()
+            wikidata_lookup = WikidataLookup(index=self.wikidata_index)
             for entry in self.ami_dict.entries:
                 term = entry.attrib["term"]
                 term_dict = dict()
@@ -1694,7 +2831,7 @@ class AmiDictArgs(AbstractArgs):
 
     def create_hit_dict_for(self, serial, qitem_hit):
         qitem_hit_dict = dict()
-        page = WikidataPage(pqitem=qitem_hit)
+        page = WikidataPage(pqitem=qitem_hit, index=self.wikidata_index)
         description = page.get_description()
         title = page.get_title()
         qitem_hit_dict["title"] = title
@@ -1,23 +1,31 @@
 """Supports parsing, editing, markup, restructing of HTML
 Should have relatively few dependencies"""
 import argparse
+import bisect
 import copy
+import csv
+import glob
+import hashlib
+import itertools
 import json
 import logging
+import os
 import pprint
 import re
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from enum import Enum
 from io import StringIO
 from pathlib import Path
+from types import MappingProxyType
 
 import lxml
 import lxml.etree
 import numpy as np
-import pandas as pd
+import requests
 from lxml.etree import Element, _Element, _ElementTree
 import time
-from sklearn.linear_model import LinearRegression
+from urllib.parse import urlparse
 
 # local
 # from py4ami.ami_dict import AmiDictionary
@@ -89,11 +97,20 @@ STYLES = [
 
 # commandline
 ANNOTATE = "annotate"
+BATCH = "batch"
+BATCH_OUTPUT = "batch_output"
+CHUNK_RE = "chunk_re"
 COLOR = "color"
 DICT = "dict"
 INPATH = "inpath"
+IPCC_ANNOTATE = "ipcc_annotate"
+NODE_RE = "node_re"
 OUTDIR = "outdir"
 OUTPATH = "outpath"
+PROFILE = "profile"
+SEARCH_XPATH = "search_xpath"
+SPLITTER_RE = "splitter_re"
+WORKERS = "workers"
 
 IPCC_CHAP_TOP_REC = re.compile(""
                                "(Chapter\\s?\\d\\d?\\s?:.*$)|"
@@ -207,6 +224,131 @@ top(Pagen) = 50 + (n - 1) * (841 + 47)
             self.p_num_str = p[0] if len(p) == 1 else None
 
 
+class PageGeometryIndex:
+    """
+    page tops and numeric coordinates of the styled elements of a raw (pdfminer) html document
+    built once per document and shared by header/footer removal, line-number removal and page box extraction
+    page lookup bisects the sorted page tops so is log(pages) per element
+    """
+    STYLED_XPATH = ".//*[@style]"
+
+    def __init__(self, page_tops=None):
+        """
+        :param page_tops: page top coordinates (numbers or numeric strings) in any order
+        """
+        self.page_tops = [] if page_tops is None else sorted(float(page_top) for page_top in page_tops)
+        self.coords_by_elem = dict()  # (top, left) of each styled element, read before any cleaning
+        self.page_box_elems = []  # spans with position:absolute and large height (page borders)
+
+    @classmethod
+    def create_from_document(cls, root, page_tops=None, min_page_box_height=300):
+        """
+        reads top and left of all styled elements below root in one pass
+        :param root: raw html element
+        :param page_tops: page top coordinates; if None uses tops of page boxes
+        :param min_page_box_height: absolutely positioned spans higher than this are page boxes
+        :return: PageGeometryIndex
+        """
+        page_index = cls(page_tops)
+        for elem in root.xpath(cls.STYLED_XPATH):
+            css_style = CSSStyle.get_interned_style_of_element(elem)
+            page_index.coords_by_elem[elem] = (css_style.top, css_style.left)
+            if elem.tag == H_SPAN and "position:absolute" in elem.get(CSSStyle.STYLE) and \
+                    css_style.height is not None and css_style.height > min_page_box_height:
+                page_index.page_box_elems.append(elem)
+        if page_tops is None and page_index.page_box_elems:
+            # page box tops and the bottom of the last box
+            boxes = [CSSStyle.get_interned_style_of_element(elem) for elem in page_index.page_box_elems]
+            boxes = sorted((box for box in boxes if box.top is not None), key=lambda box: box.top)
+            page_index.page_tops = [box.top for box in boxes] + [boxes[-1].top + boxes[-1].height] if boxes else []
+        return page_index
+
+    def get_coords(self, elem):
+        """
+        :param elem: element (indexed or not)
+        :return: (top, left), None if missing
+        """
+        coords = self.coords_by_elem.get(elem)
+        if coords is None:
+            css_style = CSSStyle.get_interned_style_of_element(elem)
+            coords = (css_style.top, css_style.left)
+        return coords
+
+    def get_top(self, elem):
+        return self.get_coords(elem)[0]
+
+    def get_left(self, elem):
+        return self.get_coords(elem)[1]
+
+    def get_page_index(self, coord):
+        """
+        :param coord: y-coordinate in document
+        :return: 0-based index of the page starting at or above coord (None if above the first page top
+                 or below the last)
+        """
+        if coord is None:
+            return None
+        i = bisect.bisect_right(self.page_tops, float(coord))
+        if i == 0 or i == len(self.page_tops):
+            return None
+        return i - 1
+
+    def get_page_top(self, coord):
+        """
+        same result as HtmlUtil.get_largest_coord_less_than() with a list of page tops
+        :param coord: y-coordinate in document
+        :return: top of page containing coord or None
+        """
+        i = self.get_page_index(coord)
+        return None if i is None else self.page_tops[i]
+
+    def find_header_footer_elements(self, elems, page_height, header_height, footer_height):
+        """
+        :param elems: elements to test (normally all styled elements still in the tree)
+        :param page_height: distance between page tops
+        :param header_height: elements less than this below the page top are in the header
+        :param footer_height: elements less than this above the page bottom are in the footer
+        :return: list of elements in headers or footers
+        """
+        found = []
+        for elem in elems:
+            top = self.get_top(elem)
+            if not top:
+                continue
+            page_top = self.get_page_top(top)
+            if page_top is None:
+                continue
+            ycoord = top - page_top
+            if ycoord < header_height or ycoord > page_height - footer_height:
+                found.append(elem)
+        return found
+
+
+class TidyRule:
+    """
+    per-element cleaning rule applied by HtmlTidy.apply_rules_in_single_pass
+    func(elem) returns a truthy value if it changed elem, or REMOVED / UNWRAPPED
+    """
+    PRE = "pre"  # applied before the children are visited
+    POST = "post"  # applied after the children (e.g. tests for emptiness)
+
+    REMOVED = "removed"  # element (and subtree) has been removed from the tree
+    UNWRAPPED = "unwrapped"  # element has been removed but its children remain in the parent
+
+    def __init__(self, name, func, order=PRE):
+        """
+        :param name: name for timing and counts
+        :param func: function(elem)
+        :param order: PRE or POST
+        """
+        self.name = name
+        self.func = func
+        self.order = order
+
+    def __str__(self):
+        return f"{self.name} ({self.order})"
+
+
 class HtmlTidy:
     """for tidying PDF / SVG/ OCR parsing
     takes raw HTML (probably scattered words or lines , possibly with coordinates and creates
@@ -231,22 +373,29 @@ class HtmlTidy:
         self.header = 80
         self.footer = 80
         self.page_tops = None
+        self.page_index = None  # PageGeometryIndex, created by extract_page_boxes()
         self.page_boxes = []
         self.raw_elem = None
         self.outdir = None
+        self.rule_timings = Counter()  # seconds spent in each TidyRule
+        self.rule_counts = Counter()  # elements changed by each TidyRule
 
     def tidy_flow(self, raw_html):
         """
         Need to capture page information to compute page coordinates, not document coordinates
         converts raw html to tidy
+        :param raw_html: html string or already parsed root element (avoids holding string and tree)
         """
 
         # TODO check and move to instance of HtmlTidy
 
         if raw_html is None:
             raise ValueError("No HTML")
-        raw_tree = lxml.etree.parse(StringIO(raw_html), lxml.etree.HTMLParser())
-        self.raw_elem = raw_tree.getroot()
+        if type(raw_html) is _Element:
+            self.raw_elem = raw_html
+        else:
+            self.raw_elem = lxml.etree.parse(StringIO(raw_html), lxml.etree.HTMLParser()).getroot()
+            raw_html = None
         self.extract_page_boxes()
 
         self.add_element(self.raw_elem)
@@ -254,10 +403,13 @@ class HtmlTidy:
         # this is set by user
         self.set_remove_flags()
 
+        # ids, tags, line numbers, large fonts, empty elements, styles and newlines in one traversal
         self.remove_unwanted_attributes_and_elements()
         pagesize = None
         if self.marker_xpath:
-            offset, pagesize, page_coords = HtmlUtil.find_constant_coordinate_markers(self.raw_elem, self.marker_xpath)
+            # coordinates were indexed by extract_page_boxes() before the rules changed the styles
+            offset, pagesize, page_coords = HtmlUtil.find_constant_coordinate_markers(
+                self.raw_elem, self.marker_xpath, page_index=self.page_index)
             HtmlUtil.remove_headers_and_footers_using_pdfminer_coords(
                 self.raw_elem,
                 pagesize,
@@ -265,11 +417,10 @@ class HtmlTidy:
                 self.footer,
                 self.marker_xpath,
                 page_tops=self.page_tops,
+                page_index=self.page_index,
             )
-        for att in self.style_attributes_to_remove:
-            HtmlUtil.remove_style_attribute(self.raw_elem, att)
-        HtmlUtil.remove_unwanteds(self.raw_elem, self.unwanteds)
-        HtmlUtil.remove_newlines(self.raw_elem)
+        if self.unwanteds:
+            HtmlUtil.remove_unwanteds(self.raw_elem, self.unwanteds)
         HtmlTree.make_sections_and_output(self.raw_elem, output_dir=self.outdir, recs_by_section=RECS_BY_SECTION)
         htmlstr = lxml.etree.tostring(self.raw_elem, encoding='UTF-8').decode()
         return htmlstr
@@ -277,19 +428,106 @@ class HtmlTidy:
     def remove_unwanted_attributes_and_elements(self):
         """
         remove objects if flags have been set in self
+        ids are first numbered over the whole tree (HtmlUtil.add_generated_ids); they are persisted as anchors
+        so must not depend on what the rules remove. The rules are then applied in a single traversal of
+        self.raw_elem (see create_tidy_rules)
         """
         if self.add_id:
-            HtmlUtil.add_generated_ids(self.raw_elem)
-        for tag in self.descendants_to_remove:
-            lxml.etree.strip_tags(self.raw_elem, [tag])
+            start = time.perf_counter()
+            self.rule_counts["add_id"] += HtmlUtil.add_generated_ids(self.raw_elem)
+            self.rule_timings["add_id"] += time.perf_counter() - start
+        rules = self.create_tidy_rules()
+        self.apply_rules_in_single_pass(self.raw_elem, rules)
+
+    def create_tidy_rules(self):
+        """
+        creates the per-element rules from the flags set in self (ids are added before, see
+        remove_unwanted_attributes_and_elements)
+        order within PRE rules matters: line numbers are detected from @left before styles are removed
+        :return: list of TidyRule
+        """
+        rules = []
+        if self.descendants_to_remove:
+            strip_tags = set(self.descendants_to_remove)
+            rules.append(TidyRule("strip_tags", lambda elem: HtmlUtil.unwrap_element(elem)
+                                  if elem.tag in strip_tags else None))
         if self.remove_lh_line_numbers:
-            HtmlUtil.remove_lh_line_numbers(self.raw_elem)
+            if self.page_index:
+                rules.append(TidyRule("remove_lh_line_numbers",
+                                      lambda elem: HtmlUtil.remove_element_left_of(
+                                          elem, HtmlUtil.LH_LINE_NUMBER_MAX_LEFT, self.page_index)))
+            else:
+                rules.append(TidyRule("remove_lh_line_numbers",
+                                      lambda elem: HtmlUtil.remove_element_with_style(
+                                          elem, f"left<{HtmlUtil.LH_LINE_NUMBER_MAX_LEFT}")))
         if self.remove_large_fonted_elements:
-            HtmlUtil.remove_large_fonted_elements(self.raw_elem)
-        for tag in self.empty_elements_to_remove:
-            HtmlUtil.remove_empty_elements(self.raw_elem, [tag])
+            rules.append(TidyRule("remove_large_fonted_elements",
+                                  lambda elem: HtmlUtil.remove_element_with_style(elem, "font-size>30")))
+        style_names = []
         for style in self.styles_to_remove:
-            HtmlUtil.remove_style(self.raw_elem, [style])
+            style_names.extend(style if type(style) is list else [style])
+        if style_names:
+            rules.append(TidyRule("remove_style", lambda elem: HtmlUtil.remove_style_names(elem, style_names)))
+        if self.style_attributes_to_remove:
+            rules.append(TidyRule("remove_style_attribute",
+                                  lambda elem: HtmlUtil.remove_style_names(
+                                      elem, self.style_attributes_to_remove, only_if_present=True)))
+        if self.empty_elements_to_remove:
+            empty_tags = set(self.empty_elements_to_remove)
+            rules.append(TidyRule("remove_empty_elements", lambda elem: HtmlUtil.remove_element_if_empty(elem)
+                                  if elem.tag in empty_tags else None, order=TidyRule.POST))
+        rules.append(TidyRule("remove_newlines", HtmlUtil.remove_newlines_in_leaf, order=TidyRule.POST))
+        return rules
+
+    def apply_rules_in_single_pass(self, root, rules):
+        """
+        applies rules to every element below root in one depth-first traversal
+        PRE rules are applied in document order before the children, POST rules after them;
+        if a rule removes an element, no further rules are applied to it or its subtree
+        time and change counts for each rule are added to self.rule_timings and self.rule_counts
+        :param root: element to tidy (rules never remove elements without a parent)
+        :param rules: list of TidyRule
+        """
+        pre_rules = [rule for rule in rules if rule.order == TidyRule.PRE]
+        post_rules = [rule for rule in rules if rule.order == TidyRule.POST]
+        stack = [(root, False)]
+        while stack:
+            elem, children_done = stack.pop()
+            if children_done:
+                self._apply_rules(post_rules, elem)
+                continue
+            if not isinstance(elem.tag, str):
+                continue
+            children = list(elem)
+            result = self._apply_rules(pre_rules, elem)
+            if result == TidyRule.REMOVED:
+                continue
+            if result != TidyRule.UNWRAPPED:
+                stack.append((elem, True))
+            for child in reversed(children):
+                stack.append((child, False))
+
+    def _apply_rules(self, rules, elem):
+        """
+        applies rules in order, stopping if elem is removed
+        :return: REMOVED, UNWRAPPED or None
+        """
+        for rule in rules:
+            start = time.perf_counter()
+            result = rule.func(elem)
+            self.rule_timings[rule.name] += time.perf_counter() - start
+            if result:
+                self.rule_counts[rule.name] += 1
+            if result == TidyRule.REMOVED or result == TidyRule.UNWRAPPED:
+                return result
+        return None
+
+    def get_rule_report(self):
+        """
+        :return: list of (rule_name, seconds, count) sorted by decreasing time
+        """
+        return [(name, self.rule_timings[name], self.rule_counts[name])
+                for name, _ in self.rule_timings.most_common()]
 
     def set_remove_flags(self):
         """
@@ -322,13 +560,14 @@ class HtmlTidy:
 
         if self.raw_elem is None:
             return
-        style_spans = self.raw_elem.xpath("//span[contains(@style,'position:absolute')]")
-        for style_span in style_spans:
-            css_style = CSSStyle.create_css_style_from_attribute_of_body_element(style_span)
-            if css_style.height > self.MIN_PAGE_BOX_HEIGHT:
-                page_box = PageBox(css_style=css_style)
-                page_box.add_style_span_and_page_number(style_span)
-                self.page_boxes.append(page_box)
+        # coordinates of all styled elements are read once here and reused by the later cleaning
+        self.page_index = PageGeometryIndex.create_from_document(
+            self.raw_elem, page_tops=self.page_tops, min_page_box_height=self.MIN_PAGE_BOX_HEIGHT)
+        for style_span in self.page_index.page_box_elems:
+            css_style = CSSStyle.get_interned_style_of_element(style_span)
+            page_box = PageBox(css_style=css_style)
+            page_box.add_style_span_and_page_number(style_span)
+            self.page_boxes.append(page_box)
 
         self.extract_page_numbers()
 
@@ -343,11 +582,11 @@ class HtmlTidy:
                 """
         for elem_with_pageno in elem_with_pagenos:
             getparent = elem_with_pageno.getparent()
-            css = CSSStyle.create_css_style_from_attribute_of_body_element(getparent)
+            css = CSSStyle.get_interned_style_of_element(getparent)
             prev_elem = getparent.getprevious()
             height = -1 if css_last is None else css.top - css_last.top
-            prev_style = CSSStyle.create_css_style_from_attribute_of_body_element(prev_elem)
-            if not prev_style:
+            prev_style = CSSStyle.get_interned_style_of_element(prev_elem)
+            if prev_elem is None:
                 logging.warning(f" no previous style")
             bbox = None if prev_style is None else prev_style.create_bbox()
             css_last = css
@@ -511,6 +750,8 @@ class HtmlGroup:
         (".footnote", [("background", "#ffddff;")]),
     ]
 
+    SECTION_LOCATORS = ["section", "sub_section", "sub_sub_section"]
+
     @classmethod
     def generate_lowercase_letter_id(cls, i):
         "make id of form a,b,c, ... aa, ab, ac ... ba, bb, ... zz , @.str(i)"
@@ -531,33 +772,100 @@ class HtmlGroup:
         fenceposts = html_elem.xpath(f".//span[starts-with(@class,'{parent_locator}')]")
         print(f"{locator}: {len(sections)}")
         if len(sections) > 0:
-            parent = sections[0].getparent()
-            for section in sections:
-                print(f"section {section.attrib['id']}")
-
-                cls.group_siblings_between_fenceposts(fenceposts, style=style, debug=debug)
+            if debug:
+                for section in sections:
+                    print(f"section {section.attrib.get('id')}")
+            cls.group_siblings_between_fenceposts(fenceposts, style=style, debug=debug)
 
     @classmethod
     def group_siblings_between_fenceposts(cls, fenceposts, style=None, debug=False):
-        for i, fencepost in enumerate(fenceposts):
-            fencepost_followers = fencepost.xpath("following-sibling::div[span]")
+        """
+        wraps each fencepost and its following div[span] siblings (up to the next fencepost) in a new div
+        each sibling is visited once and fencepost membership is a set lookup, so this is linear
+        :param fenceposts: elements starting each group
+        :param style: style of container divs
+        """
+        fencepost_set = set(fenceposts)
+        for fencepost in fenceposts:
+            follower = fencepost.getnext()
             container_div = lxml.etree.Element("div")
-            container_div.attrib["style"] = style
+            if style:
+                container_div.attrib["style"] = style
             fencepost.addprevious(container_div)
             container_div.append(fencepost)
-            title = fencepost.xpath("span")[0].attrib.get("id")
+            title_spans = fencepost.xpath("span")
+            title = title_spans[0].attrib.get("id") if len(title_spans) > 0 else None
             if title:
                 container_div.attrib["title"] = title
-            for follower in fencepost_followers:
-                if follower in fenceposts:
-                    id = follower.xpath("./span")[0].attrib.get("id")
+            while follower is not None:
+                next_follower = follower.getnext()
+                if follower in fencepost_set:
                     if debug:
-                        print(f" id {id}")
+                        print(f" id {follower.get('id')}")
                     break
-                else:
+                if follower.tag == "div" and follower.find("span") is not None:
                     if debug:
                         print(f"moved follower {follower} to {container_div.attrib.get('title')}")
                     container_div.append(follower)
+                follower = next_follower
+
+    @classmethod
+    def get_section_level(cls, div, locators=None):
+        """
+        level of a title div, from the class of its first child span with a class
+        :param div: element to test
+        :param locators: class prefixes for levels 1, 2, 3... (default SECTION_LOCATORS)
+        :return: 1-based level or None if div is not a title div
+        """
+        if locators is None:
+            locators = cls.SECTION_LOCATORS
+        for span in div.iterchildren("span"):
+            clazz = span.attrib.get("class")
+            if clazz:
+                for level, locator in enumerate(locators, start=1):
+                    if clazz.startswith(locator):
+                        return level
+                return None
+        return None
+
+    @classmethod
+    def group_children_by_level(cls, parent, get_level, styles=None, debug=False):
+        """
+        single-pass, stack-based grouping of the children of parent into nested divs
+        a child with a level opens a new container div (closing all containers at the same or deeper level);
+        following children are moved into the innermost open container
+        children before the first title child are left in place
+        :param parent: element whose children are grouped
+        :param get_level: function(child) returning 1-based level of title children, else None
+        :param styles: optional list of container styles indexed by level - 1
+        :return: list of outermost container divs
+        """
+        stack = []
+        containers = []
+        for child in list(parent):
+            level = get_level(child) if isinstance(child.tag, str) else None
+            if level is None:
+                if stack:
+                    stack[-1][1].append(child)
+                continue
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            container_div = lxml.etree.Element("div")
+            if styles and level <= len(styles):
+                container_div.attrib["style"] = styles[level - 1]
+            ids = child.xpath("./span/@id")
+            if ids:
+                container_div.attrib["title"] = ids[0]
+            if stack:
+                stack[-1][1].append(container_div)
+            else:
+                child.addprevious(container_div)
+                containers.append(container_div)
+            container_div.append(child)
+            stack.append((level, container_div))
+            if debug:
+                print(f"level {level}: {container_div.attrib.get('title')}")
+        return containers
 
         """I'm working with lxml in Python and wish to group a flat set of <div> elements into a tree based on their class attributes
 I have a set of sections <div> that are all children of <body> which must be arranged in a tree structure. Some of the divs contain just a title-string (title-divs) indicating the level in tree; this is indicated by a class attribute of "section", "sub_section", "sub_sub_section", etc. Any divs following title-divs belong to the same level, until a following title-div is reached. Please create code that:
@@ -899,8 +1207,8 @@ Free Research Preview. ChatGPT may produce inaccurate information about people,
                 span0 = HtmlGroup.get_last_span(div0)
                 span1 = HtmlGroup.get_first_span(div)
                 if span0 is not None and span1 is not None:
-                    style0 = CSSStyle.create_css_style_from_attribute_of_body_element(span0)
-                    style1 = CSSStyle.create_css_style_from_attribute_of_body_element(span0)
+                    style0 = CSSStyle.get_interned_style_of_element(span0)
+                    style1 = CSSStyle.get_interned_style_of_element(span0)
                     if style0 == style1:
                         if span1 is not None and len(span1.text) > 0 and span1.text[0].islower():
                             print(f" joined second_span {span1.text}")
@@ -959,17 +1267,36 @@ Free Research Preview. ChatGPT may produce inaccurate information about people,
             HtmlLib.write_html_file(new_html, outfile, debug=True)
 
     @classmethod
-    def group_nested_siblings(cls, html_elem, styles=None):
+    def group_nested_siblings(cls, html_elem, styles=None, locators=None, debug=False):
+        """
+        groups title divs (section, sub_section, sub_sub_section...) and their followers into nested divs
+        walks the document once to find parents of title divs and then each parent's children once
+        :param html_elem: document to group
+        :param styles: container styles indexed by level - 1
+        :param locators: class prefixes for levels (default SECTION_LOCATORS)
+        :return: list of outermost container divs
+        """
         if styles is None:
             styles = [
             "border : solid purple 2px; margin:2px;",
             "border : dashed green 1.5px; margin:1.5px;",
             "border : dotted blue 1px; margin:1px;",
             ]
+        if locators is None:
+            locators = cls.SECTION_LOCATORS
+
+        def get_level(elem):
+            return cls.get_section_level(elem, locators=locators) if elem.tag == "div" else None
 
-        HtmlGroup.group_siblings(html_elem, locator="section", style=styles[0])
-        HtmlGroup.group_siblings(html_elem, locator="sub_section", style=styles[1], debug=True)
-        HtmlGroup.group_siblings(html_elem, locator="sub_sub_section", style=styles[2])
+        parents = dict()
+        for div in html_elem.iter("div"):
+            parent = div.getparent()
+            if parent is not None and parent not in parents and get_level(div) is not None:
+                parents[parent] = True
+        containers = []
+        for parent in parents:
+            containers.extend(cls.group_children_by_level(parent, get_level, styles=styles, debug=debug))
+        return containers
 
     @classmethod
     def annotate_ipcc_targets(cls, html_elem):
@@ -1031,9 +1358,7 @@ Free Research Preview. ChatGPT may produce inaccurate information about people,
         html_elem = lxml.etree.parse(str(input_html)).getroot()
         annotator = HtmlAnnotator.create_ipcc_annotator()
         HtmlStyle.add_head_styles(html_elem, styles)
-        spans = html_elem.xpath(".//span")
-        for span in spans:
-            annotator.run_commands(span)
+        annotator.annotate_elements(html_elem)
         HtmlGroup.group_nested_siblings(html_elem, styles=None)
         HtmlLib.write_html_file(html_elem, outfile, debug=True)
 
@@ -1042,6 +1367,7 @@ Free Research Preview. ChatGPT may produce inaccurate information about people,
 class HtmlUtil:
     SCRIPT_FACT = 0.9  # maybe sholdn't be here; avoid circular
     MARKER = "marker"
+    LH_LINE_NUMBER_MAX_LEFT = 49  # elements left of this (px) are line numbers
 
 
     @classmethod
@@ -1059,6 +1385,54 @@ class HtmlUtil:
                 for el in elems:
                     cls.remove_elem_keep_tail(el)
 
+    @classmethod
+    def remove_element_if_empty(cls, elem):
+        """
+        per-element equivalent of remove_empty_elements:
+        removes elem (keeping tail) if it has no non-whitespace text and no child of the same tag with children
+        :param elem: element to test
+        :return: TidyRule.REMOVED if removed else None
+        """
+        if elem.getparent() is None:
+            return None
+        for child in elem.iterchildren(elem.tag):
+            if len(child) > 0:
+                return None
+        for text in elem.itertext():
+            if text.strip(" \t\r\n"):
+                return None
+        cls.remove_elem_keep_tail(elem)
+        return TidyRule.REMOVED
+
+    @classmethod
+    def unwrap_element(cls, elem):
+        """
+        removes elem but keeps its text, children and tail in place (as lxml.etree.strip_tags)
+        :param elem: element to unwrap
+        :return: TidyRule.UNWRAPPED (None if elem has no parent)
+        """
+        parent = elem.getparent()
+        if parent is None:
+            return None
+        previous = elem.getprevious()
+        if elem.text:
+            if previous is not None:
+                previous.tail = (previous.tail or '') + elem.text
+            else:
+                parent.text = (parent.text or '') + elem.text
+        for child in list(elem):
+            elem.addprevious(child)
+        tail = elem.tail
+        elem.tail = None
+        if tail:
+            previous = elem.getprevious()
+            if previous is not None:
+                previous.tail = (previous.tail or '') + tail
+            else:
+                parent.text = (parent.text or '') + tail
+        parent.remove(elem)
+        return TidyRule.UNWRAPPED
+
     @classmethod
     def remove_elem_keep_tail(cls, el):
         """
@@ -1122,6 +1496,54 @@ class HtmlUtil:
                                                                  id_counter=id_counter)
         return new_elems, id_counter
 
+    @classmethod
+    def split_span_at_offsets(cls, elemx, offsets, copy_atts=True, id_root=None, id_counter=0, new_tags=None):
+        """splits an elem (normally span) into 2n+1 siblings at n (start, end) offsets in a single pass
+        produces the same structure as recursive split_span_at_match (re_pref, re_match ... re_post)
+        but does not re-scan the text
+        :param elemx: elem to split (must have a parent (e.g. div)
+        :param offsets: sorted, non-overlapping (start, end) pairs into the text content of elemx
+        :param copy_atts: if True copy atts from elem
+        :param id_root: auto-generate ids building on id_root
+        :param id_counter: counter for ids
+        :param new_tags: new_element tags (default span, span, span) for prefix, match, postfix
+        :return: list of new elems, id_counter
+        """
+        if not new_tags:
+            new_tags = [H_SPAN, H_SPAN, H_SPAN]
+        assert elemx is not None
+        new_elems = []
+        if not offsets:
+            return new_elems, id_counter
+        parent = elemx.getparent()
+        assert parent is not None, f"No parent for elemx"
+        textx = HtmlUtil.get_text_content(elemx)
+        pieces = []
+        last_end = 0
+        for start, end in offsets:
+            if start > last_end:
+                pieces.append((new_tags[0], "re_pref", textx[last_end:start]))
+            pieces.append((new_tags[1], "re_match", textx[start:end]))
+            last_end = end
+        if last_end < len(textx):
+            pieces.append((new_tags[2], "re_post", textx[last_end:]))
+
+        anchor = elemx
+        for tag, clazz, text in pieces:
+            new_elem = lxml.etree.Element(tag)
+            if copy_atts:
+                for k, v in elemx.attrib.items():
+                    new_elem.attrib[k] = v
+            new_elem.attrib["class"] = clazz
+            new_elem.text = text
+            id_counter = cls.add_id_increment_counter(id_counter, id_root, new_elem)
+            anchor.addnext(new_elem)
+            anchor = new_elem
+            new_elems.append(new_elem)
+        anchor.tail = elemx.tail
+        parent.remove(elemx)
+        return new_elems, id_counter
+
     @classmethod
     def add_id_increment_counter(cls, id_counter, id_root, html_elem):
         if id_root:
@@ -1287,13 +1709,13 @@ class HtmlUtil:
             return None
         if not script_factor:
             script_factor = HtmlUtil.SCRIPT_FACT
-        if not last_span:
+        if last_span is None:
             last_span = span.xpath("preceding::span")
             if len(last_span) == 0:
                 return None
             last_span = last_span[-1]
-        csss = CSSStyle.create_css_style_from_attribute_of_body_element(span)
-        last_csss = CSSStyle.create_css_style_from_attribute_of_body_element(last_span)
+        csss = CSSStyle.get_interned_style_of_element(span)
+        last_csss = CSSStyle.get_interned_style_of_element(last_span)
         font_size = csss.font_size
         last_font_size = last_csss.font_size
         # print(f"this, last {font_size, span.text, last_font_size, last_span.text}")
@@ -1333,11 +1755,13 @@ class HtmlUtil:
     @classmethod
     def add_generated_ids(cls, root_elem):
         """adds IDs to all elements in document order
-        :param root_elem: element defining tree of subelements"""
+        :param root_elem: element defining tree of subelements
+        :return: number of elements"""
         xpath = "//*"
         elems = root_elem.xpath(xpath)
         for i, el in enumerate(elems):
             el.attrib[A_ID] = A_ID + str(i)
+        return len(elems)
     @classmethod
     def join_spans_in_same_div(cls, span0, span1, addspace=True, remove=True):
         """
@@ -1406,7 +1830,7 @@ class HtmlUtil:
             els = [elem]
         elems = []
         for el in els:
-            css_style = CSSStyle.create_css_style_from_attribute_of_body_element(el)
+            css_style = CSSStyle.get_interned_style_of_element(el)
             if condition:
                 if css_style.obeys(condition):
                     if remove:
@@ -1414,7 +1838,7 @@ class HtmlUtil:
 
     @classmethod
     def remove_headers_and_footers_using_pdfminer_coords(cls, ref_elem, pagesize, header_height, footer_height,
-                                                         marker_xpath, page_tops=None):
+                                                         marker_xpath, page_tops=None, page_index=None):
         """
         NOT COMPLETE - there are no footers because of the coordinate system.
 
@@ -1422,53 +1846,37 @@ class HtmlUtil:
 
         the @top represents the y-coordinate from the start of the document (pdfminer?).
         this means we have to subtract pagesizes from it.
+        :param page_tops: page tops (used if page_index is None)
+        :param page_index: PageGeometryIndex for ref_elem's document; created if None
         """
         debug = False
-        elems = ref_elem.xpath(marker_xpath)
+        if pagesize is None:
+            logging.warning(f"no pagesize, cannot remove headers and footers")
+            return
+        if page_index is None:
+            page_index = PageGeometryIndex.create_from_document(ref_elem, page_tops=page_tops)
 
-        last_top = 0
-        for elem in ref_elem.xpath("//*[@style]"):
-            ycoord0 = HtmlUtil.get_y0(elem)
-            if not ycoord0:
-                continue
+        elems = page_index.find_header_footer_elements(
+            ref_elem.xpath("//*[@style]"), pagesize[0], header_height, footer_height)
+        for elem in elems:
             text = XmlLib.get_text(elem).strip()
-            page_top_y = HtmlUtil.get_largest_coord_less_than(page_tops, ycoord0)
-            if page_top_y is None:
-                print(f"cannot find page top {ycoord0}")
-                continue
-            page_top_y = float(page_top_y)
-            ycoord = ycoord0 - page_top_y
-
-            # if re.match("Page\s\d+", text):
-            #     print(f"text: {text} {float(top0) - float(top)} {top0} {top}")
-            #     last_top = top0
-
-            # print(f"TOP {ycoord0} {ycoord} {pagesize} {ycoord % pagesize}")
-            in_top = ycoord < header_height
-            if in_top:
-                if debug:
-                    print(f"TOP  {text}")
-            in_bottom = ycoord > pagesize[0] - footer_height
-            if in_bottom:
-                if debug:
-                    print(f"BOTTOM  {text}")
-            if in_top or in_bottom:
-                if len(text.strip()) > 0:
-                    logging.warning(f"removing top text {text}")
-                cls.remove_elem_keep_tail(elem)
-            else:
-                # skipped
-                pass
+            if debug:
+                print(f"HEADER/FOOTER  {text}")
+            if len(text) > 0:
+                logging.warning(f"removing top text {text}")
+            cls.remove_elem_keep_tail(elem)
 
     @classmethod
     def get_largest_coord_less_than(cls, page_tops, coord):
         """
         iterate through sorted list of page_tops and find the largest less than coord
-        :param page_tops: sorted increasing list of page tops
+        :param page_tops: sorted increasing list of page tops or PageGeometryIndex (bisects)
         :param coord: actual coordinate
         """
         if page_tops is None or coord is None:
             return None
+        if isinstance(page_tops, PageGeometryIndex):
+            return page_tops.get_page_top(coord)
         for i, page_top in enumerate(page_tops):
             if float(page_top) > float(coord):
                 if i == 0:
@@ -1477,11 +1885,79 @@ class HtmlUtil:
         return None
 
     @classmethod
-    def remove_lh_line_numbers(cls, ref_elem):
-        cls.find_elements_with_style(ref_elem, ".//*[@style]", "left<49", remove=True)
+    def remove_lh_line_numbers(cls, ref_elem, page_index=None):
         """
         Maybe move to HTMLTidy
+        :param page_index: PageGeometryIndex with cached left coordinates (optional)
+        """
+        if page_index is None:
+            cls.find_elements_with_style(ref_elem, ".//*[@style]", f"left<{cls.LH_LINE_NUMBER_MAX_LEFT}",
+                                         remove=True)
+            return
+        for elem in ref_elem.xpath(".//*[@style]"):
+            cls.remove_element_left_of(elem, cls.LH_LINE_NUMBER_MAX_LEFT, page_index)
+
+    @classmethod
+    def remove_element_left_of(cls, elem, max_left, page_index):
+        """
+        as remove_element_with_style(elem, "left<max_left") but uses cached coordinates
+        :param elem: element; ignored if it has no @style
+        :param max_left: remove if left is less than this
+        :param page_index: PageGeometryIndex
+        :return: TidyRule.REMOVED if removed else None
+        """
+        if not elem.get(CSSStyle.STYLE) or elem.getparent() is None:
+            return None
+        left = page_index.get_left(elem)
+        if left is not None and left < max_left:
+            cls.remove_elem_keep_tail(elem)
+            return TidyRule.REMOVED
+        return None
+
+    @classmethod
+    def remove_element_with_style(cls, elem, condition):
+        """
+        per-element equivalent of find_elements_with_style(..., remove=True)
+        :param elem: element; ignored if it has no @style
+        :param condition: style condition (e.g. "left<49")
+        :return: TidyRule.REMOVED if removed else None
+        """
+        if not elem.get(CSSStyle.STYLE) or elem.getparent() is None:
+            return None
+        if CSSStyle.get_interned_style_of_element(elem).obeys(condition):
+            cls.remove_elem_keep_tail(elem)
+            return TidyRule.REMOVED
+        return None
+
+    @classmethod
+    def remove_style_names(cls, elem, names, only_if_present=False):
+        """
+        per-element equivalent of remove_style (and remove_style_attribute if only_if_present)
+        :param elem: element; ignored if it has no @style
+        :param names: css names to remove
+        :param only_if_present: only rewrite @style if one of names is present
+        :return: True if @style was rewritten
+        """
+        style = elem.get(CSSStyle.STYLE)
+        if style is None:
+            return False
+        css_style = CSSStyle.create_css_style_from_attribute_of_body_element(elem)
+        if only_if_present and not any(css_style.name_value_dict.get(name) for name in names):
+            return False
+        css_style.remove(names)
+        css_style.apply_to(elem)
+        return True
+
+    @classmethod
+    def remove_newlines_in_leaf(cls, elem):
+        """
+        per-element equivalent of remove_newlines
+        :return: True if text changed
         """
+        if len(elem) == 0 and elem.text and "\n" in elem.text:
+            elem.text = elem.text.replace("\n", "")
+            return True
+        return False
 
     @classmethod
     def remove_style_attribute(cls, ref_elem, style_name):
@@ -1504,10 +1980,11 @@ class HtmlUtil:
         cls.find_elements_with_style(ref_elem, ".//*[@style]", "font-size>30", remove=True)
 
     @classmethod
-    def find_constant_coordinate_markers(cls, ref_elem, xpath, style="top"):
+    def find_constant_coordinate_markers(cls, ref_elem, xpath, style="top", page_index=None):
         """
         finds a line with constant difference from top of page
 <div style="top: 50px;"><a name="1">Page 1</a></div>
+        :param page_index: PageGeometryIndex; if given, cached coordinates are used for style "top"
         """
         """
         Maybe move to HTMLTidy
@@ -1516,7 +1993,12 @@ class HtmlUtil:
         elems = ref_elem.xpath(xpath)
         coords = []
         for elem in elems:
-            css_style = CSSStyle.create_css_style_from_attribute_of_body_element(elem)
+            if page_index is not None and style == CSSStyle.TOP:
+                coord = page_index.get_top(elem)
+                if coord is not None:
+                    coords.append(coord)
+                continue
+            css_style = CSSStyle.get_interned_style_of_element(elem)
             coord = css_style.name_value_dict.get(style)
             if coord:
                 try:
@@ -1528,6 +2010,8 @@ class HtmlUtil:
         np_coords = np.array(coords)
 
         x = np.array(range(np_coords.size)).reshape((-1, 1))
+        # sklearn takes ~1 s to import so is only imported here
+        from sklearn.linear_model import LinearRegression
         model = LinearRegression().fit(x, coords)
         r_sq = model.score(x, coords)
         if r_sq < 0.98:
@@ -1679,6 +2163,26 @@ class HtmlAnnotator:
         for command in self.commands:
             command.run_command(target_elem)
 
+    def compile(self, profile=False):
+        """
+        compiles the current commands into an AnnotatorPlan
+        :param profile: record matches and time for each command
+        :return: AnnotatorPlan
+        """
+        return AnnotatorPlan(self.commands, profile=profile)
+
+    def annotate_elements(self, html_elem, xpath=".//span", profile=False):
+        """
+        runs all commands on the elements of html_elem selected by xpath in a single traversal
+        :param html_elem: document (or subtree) to annotate
+        :param xpath: selects elements to annotate (default all spans)
+        :param profile: record matches and time for each command
+        :return: the AnnotatorPlan used (has profile report)
+        """
+        plan = self.compile(profile=profile)
+        plan.run(html_elem.xpath(xpath), all_spans=(xpath == ".//span"))
+        return plan
+
     @classmethod
     def create_ipcc_annotator(cls):
         """a set of general operations for IPCC"""
@@ -1807,6 +2311,17 @@ class AnnotatorCommand:
         except Exception as e:
             print(f"match fail {e}")
             return
+        if match:
+            self.apply_match(elem, match)
+
+    # class AnnotatorCommand
+
+    def apply_match(self, elem, match):
+        """
+        annotates (or deletes) elem after a successful regex match
+        :param elem: matched element
+        :param match: regex match on elem.text
+        """
         if match:
             if self.delete:
                 self.remove_elem(elem)
@@ -1848,19 +2363,21 @@ class AnnotatorCommand:
                 classes.append(html_class)
                 elem.attrib["class"] = " ".join(classes)
 
-    def run_subscript(self, span):
-        is_sub = HtmlUtil.annotate_script_type(span, SScript.SUB, ydown=False)
+    def run_subscript(self, span, last_span=None):
+        is_sub = HtmlUtil.annotate_script_type(span, SScript.SUB, last_span=last_span, ydown=False)
         if is_sub:
             span.attrib["title"] = "subscript_{span.text}"
             print(f"SUB {span.text}")
+        return is_sub
 
     # class AnnotatorCommand
 
-    def run_superscript(self, span):
-        is_super = HtmlUtil.annotate_script_type(span, SScript.SUP, ydown=False)
+    def run_superscript(self, span, last_span=None):
+        is_super = HtmlUtil.annotate_script_type(span, SScript.SUP, last_span=last_span, ydown=False)
         if is_super:
             span.attrib["title"] = f"superscript_{span.text}"
             # print(f"SUPER {span.text}")
+        return is_super
 
     # class AnnotatorCommand
 
@@ -1940,11 +2457,181 @@ class AnnotatorCommand:
         parent.remove(elem)
 
 
+class AnnotatorPlan:
+    """compiled form of the AnnotatorCommands of an HtmlAnnotator
+
+    all per-element commands (regex, script, relative xpath, group_xpath) are applied, in command order,
+    during one traversal of the elements; processing of an element stops if a command deletes it
+    adjacent relative xpath commands with the same class are merged into one compiled XPath union
+    absolute xpath commands (starting with "/") select from the whole document so are run once, after the traversal
+    group_xpath commands are run once per parent element, not once per child
+    if profile is set, matches and time are recorded for each command
+
+    plan = annotator.compile(profile=True)
+    plan.run(html_elem.xpath(".//span"))
+    plan.print_profile()
+    """
+
+    def __init__(self, commands, profile=False):
+        self.profile = profile
+        self.matches = Counter()
+        self.timings = Counter()
+        self.element_steps = []  # list of (name, function(elem) returning number of matches)
+        self.document_steps = []  # list of (name, function(root) returning number of matches)
+        self.previous_span = None  # only set if the traversal visits all spans in document order
+        self._compile(commands)
+
+    # class AnnotatorPlan
+
+    @classmethod
+    def get_command_name(cls, i, command):
+        return f"{i}:{command.html_class or command.desc or 'command'}"
+
+    def _compile(self, commands):
+        merged_xpath = None  # (key, name, list of xpaths, command) for adjacent relative xpath commands
+        for i, command in enumerate(commands):
+            name = self.get_command_name(i, command)
+            is_relative_xpath = not command.re and command.xpath and not command.xpath.lstrip().startswith("/")
+            if merged_xpath and not (is_relative_xpath and merged_xpath[0] == (command.html_class, command.delete)):
+                self._add_xpath_step(*merged_xpath[1:])
+                merged_xpath = None
+            if command.re:
+                self.element_steps.append((name, self._create_regex_step(command)))
+            elif command.xpath:
+                if is_relative_xpath:
+                    if merged_xpath:
+                        merged_xpath[2].append(command.xpath)
+                    else:
+                        merged_xpath = ((command.html_class, command.delete), name, [command.xpath], command)
+                else:
+                    self.document_steps.append((name, self._create_xpath_step(command, [command.xpath])))
+            elif command.script in ["sub", "super"]:
+                self.element_steps.append((name, self._create_script_step(command)))
+            elif command.group_xpath is not None:
+                self.element_steps.append((name, self._create_group_step(command)))
+        if merged_xpath:
+            self._add_xpath_step(*merged_xpath[1:])
+
+    def _add_xpath_step(self, name, xpaths, command):
+        self.element_steps.append((name, self._create_xpath_step(command, xpaths)))
+
+    @classmethod
+    def _create_regex_step(cls, command):
+        regex = command.re
+
+        def regex_step(elem):
+            text = elem.text
+            if text is None:
+                return 0
+            match = regex.match(text)
+            if not match:
+                return 0
+            command.apply_match(elem, match)
+            return 1
+        return regex_step
+
+    @classmethod
+    def _create_xpath_step(cls, command, xpaths):
+        """compiles the union of xpaths once"""
+        xpath = xpaths[0] if len(xpaths) == 1 else " | ".join(f"({xp})" for xp in xpaths)
+        try:
+            compiled_xpath = lxml.etree.XPath(xpath)
+        except lxml.etree.XPathSyntaxError as e:
+            raise ValueError(f"Cannot compile xpath {xpath} because {e}")
+
+        def xpath_step(elem):
+            xp_elems = compiled_xpath(elem)
+            for xp_elem in xp_elems:
+                if command.delete:
+                    xp_elem.getparent().remove(xp_elem)
+                    return 1
+                if command.html_class:
+                    command.update_class(xp_elem, command.html_class)
+            return len(xp_elems)
+        return xpath_step
+
+    def _create_script_step(self, command):
+        """uses the span preceding elem in the traversal instead of evaluating preceding::span for every span"""
+        script_func = command.run_subscript if command.script == "sub" else command.run_superscript
+
+        def script_step(elem):
+            return 1 if script_func(elem, last_span=self.get_preceding_span(elem)) else 0
+        return script_step
+
+    def get_preceding_span(self, elem):
+        """
+        last span before elem in document order (as xpath preceding::span)
+        uses the previous span of the traversal if valid, else evaluates the xpath
+        """
+        previous_span = self.previous_span
+        if previous_span is None or previous_span.getparent() is None or \
+                any(ancestor is previous_span for ancestor in elem.iterancestors()):
+            preceding_spans = elem.xpath("preceding::span")
+            previous_span = preceding_spans[-1] if len(preceding_spans) > 0 else None
+        return previous_span
+
+    @classmethod
+    def _create_group_step(cls, command):
+        seen_parents = set()
+
+        def group_step(elem):
+            parent = elem.getparent()
+            if parent is None or parent in seen_parents:
+                return 0
+            seen_parents.add(parent)
+            command.run_group_xpath(elem)
+            return 1
+        return group_step
+
+    # class AnnotatorPlan
+
+    def run(self, elems, all_spans=False):
+        """
+        runs the plan on elems (normally all spans of a document)
+        :param elems: list of elements in document order
+        :param all_spans: elems are all the spans of a (sub)tree, so the preceding span is known
+        """
+        root = None
+        self.previous_span = None
+        for elem in elems:
+            if root is None:
+                root = elem.getroottree().getroot()
+            for name, step in self.element_steps:
+                self._run_step(name, step, elem)
+                if elem.getparent() is None:
+                    break
+            if all_spans and elem.getparent() is not None:
+                self.previous_span = elem
+        if root is not None:
+            for name, step in self.document_steps:
+                self._run_step(name, step, root)
+
+    def _run_step(self, name, step, elem):
+        if not self.profile:
+            step(elem)
+            return
+        start = time.perf_counter()
+        self.matches[name] += step(elem)
+        self.timings[name] += time.perf_counter() - start
+
+    def get_profile_report(self):
+        """
+        :return: list of (command_name, matches, seconds) in command order
+        """
+        names = [name for name, _ in self.element_steps + self.document_steps]
+        names = sorted(names, key=lambda name: int(name.split(":")[0]))
+        return [(name, self.matches[name], self.timings[name]) for name in names]
+
+    def print_profile(self):
+        for name, matches, seconds in self.get_profile_report():
+            print(f"{name:40s} matches: {matches:8d} time: {seconds:8.3f}s")
+
 
 class HtmlStyle:
     """
     methods to process style attributes and <style> elements
     """
+    GENERATED_CLASSREF_RE = re.compile(r"\.s\d+")  # classes created by add_element_with_unique_style
 
     @classmethod
     def get_style(cls, elem):
@@ -1974,13 +2661,18 @@ class HtmlStyle:
         """
         Finds all elements with @style attribute and extacts the tdxt styles to <head>
         Also sets body styles to normal
+        Styles are deduplicated as they are seen; each distinct text style gets one
+        <style> in <head> and one class (s0, s1... in order of first occurrence)
+        Classes generated by an earlier run (s0, s1... in <head>) are reused
         :param html_elem: total html object to normalize. Must have <head> and <body>
+        :return: dict mapping extracted style values onto classrefs (without dot)
         """
         HtmlStyle.remove_empty_styles(html_elem)
+        head = html_elem.xpath("/html/head")[0]
+        classref_by_style = HtmlStyle.create_classref_by_head_style(head)
         styled_elems = html_elem.xpath(".//*[@style]")
-        for i, styled_elem in enumerate(styled_elems):
-            classref = f"s{i}"
-            HtmlStyle.add_element_with_style(classref, html_elem, styled_elem)
+        for styled_elem in styled_elems:
+            HtmlStyle.add_element_with_unique_style(head, styled_elem, classref_by_style)
         body = html_elem.xpath("/html/body")
         if len(body) != 1:
             raise ValueError(f"document should have exactly 1 body tag")
@@ -1992,6 +2684,64 @@ class HtmlStyle:
             "opacity: 1; "
             "color: black;"
         )
+        return classref_by_style
+
+    # class HtmlStyle
+
+    @classmethod
+    def create_classref_by_head_style(cls, head):
+        """
+        indexes the generated class styles already in head (as written by add_element_with_unique_style,
+        e.g. <style>.s3 {font-size: 9px;}</style>); other styles are ignored; the first class with a given
+        style wins
+        :param head: <head> of the document
+        :return: dict of classrefs (without dot) indexed by style value
+        """
+        classref_by_style = dict()
+        for style in head.xpath("./style"):
+            style_s = style.text.strip() if style.text else ""
+            classref = style_s.split()[0] if style_s else ""
+            if not cls.GENERATED_CLASSREF_RE.fullmatch(classref):
+                continue
+            value = style_s[len(classref):].strip()
+            classref_by_style.setdefault(value, classref[1:])
+        return classref_by_style
+
+    # class HtmlStyle
+
+    @classmethod
+    def add_element_with_unique_style(cls, head, styled_elem, classref_by_style):
+        """
+        extracts the text style of styled_elem and replaces it by a class.
+        If the text style has not been seen before, creates a new classref and adds
+        a <style> to head; otherwise reuses the existing classref.
+        :param head: <head> of the document
+        :param styled_elem: element with @style
+        :param classref_by_style: dict of classrefs indexed by extracted style value (updated)
+        :return: classref used (None if element has no style)
+        """
+        elem_style = HtmlStyle.get_style(styled_elem)
+        if elem_style is None or elem_style == "":
+            return None
+        css = CSSStyle.create_css_style_from_css_string(elem_style)
+        extracted_style, retained_style = css.extract_text_styles()
+        if not extracted_style.get_css_value().strip():
+            return None  # no text style, e.g. the retained style of an already normalized element
+        style_value = "{" + extracted_style.get_css_value().strip() + "}"
+        classref = classref_by_style.get(style_value)
+        if classref is None:
+            classref = f"s{len(classref_by_style)}"
+            if classref in classref_by_style.values():  # head classes need not be numbered contiguously
+                used_classrefs = set(classref_by_style.values())
+                classref = next(f"s{n}" for n in itertools.count(len(classref_by_style))
+                                if f"s{n}" not in used_classrefs)
+            classref_by_style[style_value] = classref
+            extracted_style_elem = extracted_style.create_html_style_element(classref)
+            extracted_style_elem.attrib[CLASSREF] = "." + classref
+            head.append(extracted_style_elem)
+        HtmlStyle.set_style(styled_elem, retained_style.get_css_value())
+        HtmlClass.set_class_on_element(styled_elem, classref, replace=False)
+        return classref
 
     # class HtmlStyle
 
@@ -2064,17 +2814,12 @@ class HtmlStyle:
         delete redundant classrefs and styles
         map document instamces of styles onto normalized classrefs
         :param html_elem: html document to normalize
+        :return: dict mapping extracted style values onto classrefs
 
-        Should be in an object
-
-
+        Styles are deduplicated during extraction (single traversal), so no
+        redundant <style>s or classrefs are created and none need deleting.
         """
-        cls.extract_all_text_styles_to_head(html_elem)
-        style_to_classref_set = cls.normalize_head_styles(html_elem)
-        classref_index = cls.create_classref_index(style_to_classref_set)
-        deletable_classrefs = cls.get_redundant_classrefs(classref_index)
-        cls.delete_redundant_styles(deletable_classrefs, html_elem)
-        cls.normalize_classrefs_on_elements(html_elem, classref_index)
+        return cls.extract_all_text_styles_to_head(html_elem)
 
     # class HtmlStyle
 
@@ -2381,7 +3126,7 @@ class HtmlTree:
         for div in divs:
             spans = div.xpath("./span")
             if spans:
-                css_style = CSSStyle.create_css_style_from_attribute_of_body_element(spans[0])
+                css_style = CSSStyle.get_interned_style_of_element(spans[0])
                 if not (is_bold and css_style.is_bold_name()):
                     continue
                 if not (font_size_range and cls.in_range(css_style.font_size, font_size_range)):
@@ -2436,7 +3181,7 @@ class HtmlTree:
                 except Exception as e:
                     logging.error(f"BUG skipped")
                 continue
-            css_style = CSSStyle.create_css_style_from_attribute_of_body_element(spans[0])  # normally comes first
+            css_style = CSSStyle.get_interned_style_of_element(spans[0])  # normally comes first
             # check weight, if none append to siblings
             if not (is_bold and css_style.is_bold_name()):
                 current_div.append(div)
@@ -2532,66 +3277,77 @@ class HTMLSearcher:
         self.dictx = dict() if dictx is None else copy.deepcopy(dictx)
 
     def search_path_chunk_node(self, html_path):
+        """
+        finds elements in html_path with the XPATH xpaths and searches their texts for chunks and nodes
+        :param html_path: html file
+        :return: list of dicts with element id, chunk and nodes (see select_chunks_subchunks_nodes)
+        """
+        html_path = Path(html_path)
         assert html_path.exists(), f"{html_path} should exist"
         tree = lxml.etree.parse(str(html_path))
 
         self.xpaths = self.xpath_dict.get(self.XPATH)
         if not self.xpaths:
             raise ValueError(f"ERROR must give xpath")
+        if type(self.xpaths) is str:
+            self.xpaths = [self.xpaths]
+        self.element_list = list()
         for xpath in self.xpaths:
             try:
                 match_elements = tree.xpath(xpath)
             except Exception as e:
                 raise ValueError(f"ERROR xpath {xpath} {e}")
-
-        self.element_list = list()
-        for xpath in self.xpaths:
-            match_elements = tree.xpath(xpath)
             for match_element in match_elements:
                 t = type(match_element)
                 if t is not _Element:
                     raise ValueError(f"not an element {t} {match_element}")
                 self.element_list.append(match_element)
 
+        results = []
         for element in self.element_list:
             for text in element.xpath("./text()"):
-                pass
-                # nodestr = self.select_chunks_subchunks_nodes(text)
+                for node_dict in self.select_chunks_subchunks_nodes(text):
+                    node_dict[A_ID] = element.get(A_ID)
+                    results.append(node_dict)
+        return results
 
     def select_chunks_subchunks_nodes(self, text, splitter_re=None, node_re=None):
-        # chunk_re, splitter_re, node_re_liat, add_unmatched = False):
         """
-        Move to a class and refactor to use dictionary
-        NOT YET USED
-        :param splitter_re: regex for splitting smaller chunks
-        :param node_re: regex to find hypernodes
+        finds chunks in text with the CHUNK_RE regexes, splits each chunk with the splitter regexes
+        and assigns the split nodes to the first named subnode regex they match
+        :param text: text to search
+        :param splitter_re: regex for splitting smaller chunks (default the SPLITTER_RE regexes)
+        :param node_re: regex to find hypernodes (default the named regexes from add_subnode_key_re())
+        :return: list of dicts {"chunk": chunk, "nodes": {name: [node, ...]}}
         """
 
-        chunk_res = self.chunk_dict.get(self.CHUNK_RE)
-        splitter_res = self.splitter_dict.get(self.SPLITTER_RE)
-        node_res = self.chunk_node_dict.get(self.SUBNODE_RE)
-
-        add_unmatched = self.chunk_node_dict.get(self.UNMATCHED)
-        ptr = 0
-        while True:
-            for chunk_re in chunk_res:
-                match = re.search(chunk_re, text[ptr:])
-                if not match:
-                    break
-                ptr += match.span()[1]
-                nodestr = match.group(1)
-
-                nodes = re.split(splitter_re, nodestr)
+        chunk_res = self.chunk_dict.get(self.CHUNK_RE) or []
+        splitter_res = [splitter_re] if splitter_re else self.splitter_dict.get(self.SPLITTER_RE) or []
+        if node_re:
+            node_res_by_name = {node_re: [node_re]}
+        else:
+            node_res_by_name = {name: res for name, res in self.chunk_dict.items()
+                                if name not in (self.CHUNK_RE, self.UNMATCHED)}
+        add_unmatched = self.chunk_dict.get(self.UNMATCHED)
+
+        results = []
+        for chunk_re in chunk_res:
+            for match in re.finditer(chunk_re, text):
+                chunk = match.group(1) if match.groups() else match.group(0)
+                nodes = [chunk]
+                for splitter in splitter_res:
+                    nodes = [subnode for node in nodes for subnode in re.split(splitter, node)]
                 node_dict = defaultdict(list)
                 for node in nodes:
-                    m = re.search(node_re, node)
-                    if m:
-                        node_dict[node_re].append(node)
-                    if not m and add_unmatched:
+                    name = next((name for name, res in node_res_by_name.items()
+                                 if any(re.search(regex, node) for regex in res)), None)
+                    if name:
+                        node_dict[name].append(node)
+                    elif add_unmatched:
                         node_dict[self.UNMATCHED].append(node)
-                for item in node_dict.items():
-                    # print(f"item {item}")
-                    pass
+                if node_dict:
+                    results.append({"chunk": chunk, "nodes": dict(node_dict)})
+        return results
 
     def add_xpath(self, title, xpath):
         """
@@ -2668,17 +3424,92 @@ class HTMLSearcher:
         the_dict[key].append(value)
 
 
+class BatchRecordWriter:
+    """
+    streams batch result records (dicts) to a JSON lines (default) or CSV (suffix .csv) file
+    each record is flushed as soon as it is written so the output grows as workers finish
+    """
+    FIELDS = ["inpath", "task", "dict", "outpath", "matches", "hits", "seconds", "error"]
+
+    def __init__(self, path):
+        """
+        :param path: output file; parent directories are created
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.is_csv = self.path.suffix.lower() == ".csv"
+        self.file = open(self.path, "w", encoding="UTF-8", newline="")
+        self.csv_writer = None
+        if self.is_csv:
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=self.FIELDS, extrasaction="ignore")
+            self.csv_writer.writeheader()
+        self.count = 0
+
+    def write(self, record):
+        """
+        writes one record; in CSV nested values (hits) are serialized as JSON
+        :param record: dict with (some of) FIELDS
+        """
+        if self.is_csv:
+            row = {key: json.dumps(value) if isinstance(value, (dict, list)) else value
+                   for key, value in record.items()}
+            self.csv_writer.writerow(row)
+        else:
+            self.file.write(json.dumps(record, default=str) + "\n")
+        self.file.flush()
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @classmethod
+    def read_records(cls, path):
+        """
+        reads records written by BatchRecordWriter (CSV values are strings, hits is decoded)
+        :param path: JSON lines or CSV file
+        :return: list of dicts
+        """
+        path = Path(path)
+        with open(path, "r", encoding="UTF-8", newline="") as f:
+            if path.suffix.lower() == ".csv":
+                records = list(csv.DictReader(f))
+                for record in records:
+                    if record.get("hits"):
+                        record["hits"] = json.loads(record["hits"])
+                return records
+            return [json.loads(line) for line in f if line.strip()]
+
+
 class HTMLArgs(AbstractArgs):
     """Parse args to analyze, edit and annotate HTML"""
 
+    BATCH_DIR_GLOB = "*/fulltext.html"  # files in a --batch directory (one subdirectory per chapter)
+    ANNOTATE_TASK = "annotate"
+    IPCC_ANNOTATE_TASK = "ipcc_annotate"
+    SEARCH_TASK = "search"
+
     def __init__(self):
         """arg_dict is set to default"""
         super().__init__()
+        self.annotate = False
+        self.batch = None
+        self.batch_output = None
+        self.color = None
         self.dictfile = None
         self.inpath = None
+        self.ipcc_annotate = False
         self.outpath = None
         self.outstem = None
         self.outdir = None
+        self.profile = False
+        self.search_dict = None
+        self.workers = 1
         self.arg_dict = None
 
     def add_arguments(self):
@@ -2688,16 +3519,35 @@ class HTMLArgs(AbstractArgs):
         self.parser.description = 'HTML editing analysing annotation'
         self.parser.add_argument(f"--{ANNOTATE}", action="store_true",
                                  help="annotate HTML file with dictionary")
+        self.parser.add_argument(f"--{BATCH}", type=str, nargs="+",
+                                 help=f"html files, globs or directories (containing {self.BATCH_DIR_GLOB})"
+                                      f" to process in batch (needs --{OUTDIR})")
+        self.parser.add_argument(f"--{BATCH_OUTPUT}", type=str, nargs=1,
+                                 help="merged batch results, JSON lines (default) or CSV (suffix .csv)")
+        self.parser.add_argument(f"--{CHUNK_RE}", type=str, nargs="+",
+                                 help="regex(es) for chunks in text of --search_xpath elements (group 1 if present)")
         self.parser.add_argument(f"--{COLOR}", type=str, nargs=1,
                                  help="colour for annotation")
-        self.parser.add_argument(f"--{DICT}", type=str, nargs=1,
-                                 help="dictionary for annotation")
+        self.parser.add_argument(f"--{DICT}", type=str, nargs="+",
+                                 help="dictionary (or dictionaries in batch) for annotation")
         self.parser.add_argument(f"--{INPATH}", type=str, nargs=1,
                                  help="input html file")
+        self.parser.add_argument(f"--{IPCC_ANNOTATE}", action="store_true",
+                                 help="annotate spans with IPCC commands (sections, confidence, targets...)")
+        self.parser.add_argument(f"--{NODE_RE}", type=str, nargs=1,
+                                 help="regex for nodes in split chunks")
         self.parser.add_argument(f"--{OUTPATH}", type=str, nargs=1,
                                  help="output html file")
         self.parser.add_argument(f"--{OUTDIR}", type=str, nargs=1,
                                  help="output directory")
+        self.parser.add_argument(f"--{PROFILE}", action="store_true",
+                                 help="report matches and time for each annotation command")
+        self.parser.add_argument(f"--{SEARCH_XPATH}", type=str, nargs="+",
+                                 help="xpath(s) for elements to search with --chunk_re in batch")
+        self.parser.add_argument(f"--{SPLITTER_RE}", type=str, nargs=1,
+                                 help="regex to split chunks into nodes")
+        self.parser.add_argument(f"--{WORKERS}", type=int,
+                                 help="number of processes for batch", default=1)
         self.parser.epilog = "==============="
 
     """python -m py4ami.pyamix HTML --annotate 
@@ -2718,14 +3568,37 @@ class HTMLArgs(AbstractArgs):
             return
 
         self.annotate = self.arg_dict.get(ANNOTATE)
+        self.batch = self.arg_dict.get(BATCH)
+        self.batch_output = self.arg_dict.get(BATCH_OUTPUT)
         self.color = self.arg_dict.get(COLOR)
         self.dictfile = self.arg_dict.get(DICT)
         self.inpath = self.arg_dict.get(INPATH)
+        self.ipcc_annotate = self.arg_dict.get(IPCC_ANNOTATE)
         self.outdir = self.arg_dict.get(OUTDIR)
         self.outpath = self.arg_dict.get(OUTPATH)
-
+        self.profile = self.arg_dict.get(PROFILE)
+        workers = self.arg_dict.get(WORKERS)
+        self.workers = workers if workers else 1
+        search_xpath = self.arg_dict.get(SEARCH_XPATH)
+        self.search_dict = None
+        if search_xpath:
+            self.search_dict = {
+                SEARCH_XPATH: search_xpath,
+                CHUNK_RE: self.arg_dict.get(CHUNK_RE),
+                SPLITTER_RE: self.arg_dict.get(SPLITTER_RE),
+                NODE_RE: self.arg_dict.get(NODE_RE),
+            }
+
+        if self.batch:
+            self.run_batch()
+            return
+        if type(self.dictfile) is list:
+            logging.error(f"only one dictionary allowed without --{BATCH}")
+            return
         if self.annotate:
             self.annotate_with_dict()
+        if self.ipcc_annotate:
+            self.annotate_with_ipcc_commands()
 
     # class AmiDictArgs:
 
@@ -2734,6 +3607,8 @@ class HTMLArgs(AbstractArgs):
         """returns a new COPY of the default dictionary"""
         arg_dict = dict()
         arg_dict[DICT] = None
+        arg_dict[PROFILE] = False
+        arg_dict[WORKERS] = 1
         return arg_dict
 
     @property
@@ -2762,6 +3637,214 @@ class HTMLArgs(AbstractArgs):
         self.ami_dict = AmiDictionary.create_from_xml_file(self.dictfile)
         self.ami_dict.markup_html_from_dictionary(self.inpath, self.outpath, self.color)
 
+    def annotate_with_ipcc_commands(self):
+        """annotates all spans in inpath with HtmlAnnotator.create_ipcc_annotator() in one traversal
+        :return: AnnotatorPlan (has profile report if self.profile)
+        """
+        if not self.inpath:
+            logging.error(f"no input file to annotate given")
+            return None
+        if not self.outpath:
+            logging.error(f"no output file given")
+            return None
+        plan = self.annotate_file_with_ipcc_commands(self.inpath, self.outpath, profile=self.profile)
+        if self.profile:
+            plan.print_profile()
+        return plan
+
+    @classmethod
+    def annotate_file_with_ipcc_commands(cls, inpath, outpath, profile=False):
+        """
+        annotates all spans in inpath with HtmlAnnotator.create_ipcc_annotator() and writes outpath
+        :param inpath: html file
+        :param outpath: annotated html file
+        :param profile: record matches and times in plan
+        :return: AnnotatorPlan
+        """
+        html_elem = lxml.etree.parse(str(inpath)).getroot()
+        annotator = HtmlAnnotator.create_ipcc_annotator()
+        HtmlStyle.add_head_styles(html_elem, HtmlGroup.DEFAULT_STYLES)
+        plan = annotator.annotate_elements(html_elem, profile=profile)
+        HtmlLib.write_html_file(html_elem, outpath, debug=True)
+        return plan
+
+    # class HTMLArgs:
+
+    @classmethod
+    def expand_batch_paths(cls, batch):
+        """
+        expands files, globs and directories (using BATCH_DIR_GLOB) into sorted unique html paths
+        :param batch: str or list of str
+        :return: list of Paths
+        """
+        if type(batch) is not list:
+            batch = [batch]
+        paths = set()
+        for item in batch:
+            item = str(item)
+            if Path(item).is_dir():
+                paths.update(Path(item).glob(cls.BATCH_DIR_GLOB))
+            elif glob.has_magic(item):
+                paths.update(Path(file) for file in glob.glob(item, recursive=True))
+            elif Path(item).exists():
+                paths.add(Path(item))
+            else:
+                logging.warning(f"batch input {item} does not exist")
+        return sorted(paths)
+
+    def create_batch_tasks(self, inpaths):
+        """
+        one task per (file, dictionary) for --annotate, per file for --ipcc_annotate and --search_xpath
+        outputs are written to outdir/<parent_dir>/<stem>_<dict_stem>.html (or _ipcc.html) where parent_dir
+        is relative to the batch root (see get_batch_root), e.g. outdir/wg1/Chapter07/fulltext_ipcc.html
+        :param inpaths: html files
+        :return: list of kwargs dicts for run_batch_task()
+        :except: ValueError if two tasks would write the same output
+        """
+        dictfiles = self.dictfile if type(self.dictfile) is list else [self.dictfile] if self.dictfile else []
+        outdir = Path(self.outdir) if self.outdir else None
+        batch_root = self.get_batch_root(inpaths)
+        tasks = []
+        inpath_by_outpath = dict()
+
+        def make_outpath(inpath, suffix):
+            outpath = Path(outdir, inpath.resolve().parent.relative_to(batch_root), f"{inpath.stem}_{suffix}.html")
+            if outpath in inpath_by_outpath:
+                raise ValueError(f"{inpath} and {inpath_by_outpath[outpath]} would both write {outpath}")
+            inpath_by_outpath[outpath] = inpath
+            return outpath
+
+        for inpath in inpaths:
+            if self.annotate:
+                for dictfile in dictfiles:
+                    outpath = make_outpath(inpath, Path(dictfile).stem)
+                    tasks.append(dict(task=self.ANNOTATE_TASK, inpath=inpath, outpath=outpath,
+                                      dictfile=dictfile, color=self.color))
+            if self.ipcc_annotate:
+                outpath = make_outpath(inpath, "ipcc")
+                tasks.append(dict(task=self.IPCC_ANNOTATE_TASK, inpath=inpath, outpath=outpath))
+            if self.search_dict:
+                tasks.append(dict(task=self.SEARCH_TASK, inpath=inpath, search_dict=self.search_dict))
+        return tasks
+
+    @classmethod
+    def get_batch_root(cls, inpaths):
+        """
+        common ancestor of the directories containing the chapter directories, so that outputs keep at least
+        the chapter directory (Chapter06/fulltext.html) and same-named chapters in different reports
+        (wg1/Chapter07, wg3/Chapter07) stay apart
+        :param inpaths: html files
+        :return: resolved Path (None if no inpaths)
+        """
+        if not inpaths:
+            return None
+        return Path(os.path.commonpath([Path(inpath).resolve().parent.parent for inpath in inpaths]))
+
+    def run_batch(self):
+        """
+        runs annotation/search over all self.batch files, in a process pool if self.workers > 1,
+        streaming each record to self.batch_output as its task finishes
+        :return: list of records in completion order
+        """
+        if (self.annotate or self.ipcc_annotate) and not self.outdir:
+            logging.error(f"--{BATCH} annotation needs --{OUTDIR}")
+            return None
+        if self.annotate and not self.dictfile:
+            logging.error(f"no dictionary given")
+            return None
+        inpaths = self.expand_batch_paths(self.batch)
+        tasks = self.create_batch_tasks(inpaths)
+        if not tasks:
+            logging.error(f"no batch tasks for {self.batch} (need --{ANNOTATE}, --{IPCC_ANNOTATE} or --{SEARCH_XPATH})")
+            return None
+        batch_output = self.batch_output
+        if not batch_output:
+            batch_output = Path(self.outdir if self.outdir else ".", "batch.jsonl")
+        records = []
+        with BatchRecordWriter(batch_output) as writer:
+            if self.workers > 1:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    futures = [executor.submit(HTMLArgs.run_batch_task, **task) for task in tasks]
+                    for future in as_completed(futures):
+                        record = future.result()
+                        writer.write(record)
+                        records.append(record)
+            else:
+                for task in tasks:
+                    record = self.run_batch_task(**task)
+                    writer.write(record)
+                    records.append(record)
+        logging.info(f"wrote {len(records)} batch records to {batch_output}")
+        return records
+
+    @classmethod
+    def run_batch_task(cls, task, inpath, outpath=None, dictfile=None, color=None, search_dict=None):
+        """
+        worker for run_batch(); runs one task and never raises (errors are reported in the record)
+        :param task: ANNOTATE_TASK, IPCC_ANNOTATE_TASK or SEARCH_TASK
+        :param inpath: html file
+        :param outpath: annotated html file (annotate tasks)
+        :param dictfile: dictionary (ANNOTATE_TASK)
+        :param color: background colour for annotation
+        :param search_dict: SEARCH_XPATH, CHUNK_RE, SPLITTER_RE, NODE_RE values (SEARCH_TASK)
+        :return: record dict with BatchRecordWriter.FIELDS
+        """
+        from py4ami.ami_dict import AmiDictionary  # horrible
+
+        record = {
+            "inpath": str(inpath),
+            "task": task,
+            "dict": str(dictfile) if dictfile else None,
+            "outpath": str(outpath) if outpath else None,
+            "matches": 0,
+            "hits": None,
+            "seconds": None,
+            "error": None,
+        }
+        start = time.perf_counter()
+        try:
+            if outpath:
+                Path(outpath).parent.mkdir(exist_ok=True, parents=True)
+            if task == cls.ANNOTATE_TASK:
+                ami_dict = AmiDictionary.create_from_xml_file(dictfile)
+                id_dict, multidict = ami_dict.markup_html_from_dictionary(inpath, outpath, color)
+                record["hits"] = {term: len(ids) for term, ids in multidict.items()}
+                record["matches"] = sum(record["hits"].values())
+            elif task == cls.IPCC_ANNOTATE_TASK:
+                plan = cls.annotate_file_with_ipcc_commands(inpath, outpath, profile=True)
+                record["hits"] = {name: count for name, count, seconds in plan.get_profile_report()}
+                record["matches"] = sum(record["hits"].values())
+            elif task == cls.SEARCH_TASK:
+                html_searcher = cls.create_html_searcher(search_dict)
+                record["hits"] = html_searcher.search_path_chunk_node(inpath)
+                record["matches"] = len(record["hits"])
+            else:
+                raise ValueError(f"unknown batch task {task}")
+        except Exception as e:
+            logging.error(f"batch {task} failed for {inpath}: {e}")
+            record["error"] = str(e)
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        return record
+
+    @classmethod
+    def create_html_searcher(cls, search_dict):
+        """
+        :param search_dict: SEARCH_XPATH, CHUNK_RE, SPLITTER_RE, NODE_RE values (str or list)
+        :return: HTMLSearcher
+        """
+        def as_list(value):
+            return [] if not value else value if type(value) is list else [value]
+
+        html_searcher = HTMLSearcher(xpath_dict={HTMLSearcher.XPATH: as_list(search_dict.get(SEARCH_XPATH))})
+        for chunk_re in as_list(search_dict.get(CHUNK_RE)):
+            html_searcher.add_chunk_re(chunk_re)
+        for splitter_re in as_list(search_dict.get(SPLITTER_RE)):
+            html_searcher.add_splitter_re(splitter_re)
+        for node_re in as_list(search_dict.get(NODE_RE)):
+            html_searcher.add_subnode_key_re(NODE_RE, node_re)
+        html_searcher.set_unmatched_flag(not search_dict.get(NODE_RE))
+        return html_searcher
+
 
 packages = ["WGI", "WG1", "WGII", "WG2", "WGIII", "WG3", "SRCCL", "SR1.5", "SR15", "SROCC"]
 subpackages = ["Chapter", "SPM", "TS", "ES"]
@@ -3034,19 +4117,25 @@ class IPCCTargetLink:
         repository = self.link_factory.target.repository
         target_url = f"{site}/{username}/{repository}/{branch}/{filepath}"
         # print(f"target_url {target_url}")
-        try:
-            html = XmlLib.read_xml_element_from_github(github_url=target_url, url_cache=url_cache)
-        except Exception as e:
-            # print(f"failed to read HTML {e}")
-            pass
-        if html is None:
-            # print(f"failed to read HTML")
-            return None, None
-        # print(f"looking for ID {id}")
-        sections = html.xpath(f"//*[@id='{id}']")
+        if url_cache is not None:
+            # copies only the target subtrees, not the whole document
+            section_parents = url_cache.read_elements_by_id(target_url, id, parent=True)
+            if section_parents is None:
+                return None, None
+        else:
+            try:
+                html = XmlLib.read_xml_element_from_github(github_url=target_url)
+            except Exception as e:
+                # print(f"failed to read HTML {e}")
+                pass
+            if html is None:
+                # print(f"failed to read HTML")
+                return None, None
+            # print(f"looking for ID {id}")
+            section_parents = [section.getparent() for section in html.xpath(f"//*[@id='{id}']")]
         target_text = ""
-        for i, section in enumerate(sections):
-            target_text +=  ("" if i == 0  else "SEP") + ''.join(section.getparent().itertext())
+        for i, section_parent in enumerate(section_parents):
+            target_text +=  ("" if i == 0  else "SEP") + ''.join(section_parent.itertext())
         return (id, target_text) if target_text else (None, None)
 
     def make_report_chapter_id(self, ipcc_link, wg_dict):
@@ -3091,7 +4180,8 @@ class IPCCTargetLink:
         return (idx, target_text)
 
     @classmethod
-    def read_links_from_span_and_follow_to_ipcc_repository_KEY(cls, anchor_div, leaf_name, link_factory, span_with_curly_ids):
+    def read_links_from_span_and_follow_to_ipcc_repository_KEY(cls, anchor_div, leaf_name, link_factory, span_with_curly_ids,
+                                                                url_cache=None):
         """
         reads a span in an chor_div and extracts curly link_ids
         splits the curly content into target ids (curly_count)
@@ -3100,6 +4190,7 @@ class IPCCTargetLink:
         returns a table with (<= curly_count
 
         :param anchor_div: if not None adds an anchor
+        :param url_cache: URLCache shared between calls (created if None)
         """
         if anchor_div is None:
             raise ValueError(f" anchor_div must not be None")
@@ -3122,7 +4213,8 @@ class IPCCTargetLink:
             ipcc_ids = re.split(",|;", links_text)
             anchor_span_link = lxml.etree.SubElement(anchor_div, "span")
             anchor_span_link.attrib["id"] = anchor_id
-            url_cache = URLCache()
+            if url_cache is None:
+                url_cache = URLCache()
             parent_div = span_with_curly_ids.getparent()
             anchor_text = ''.join(parent_div.itertext())
             # print (f" ipcc_ids {ipcc_ids}")
@@ -3136,6 +4228,7 @@ class IPCCTargetLink:
         if target_to_anchor_table:
             # this is just debug
             # print(f"**ROWS**{len(target_to_anchor_table)}\n{target_to_anchor_table}")
+            import pandas as pd
             anchor_target_df = pd.DataFrame(target_to_anchor_table, columns=["a_id", "a_text", "ipcc_id", "t_id", "t_text"])
             # print(f"anchor_to_target dataframe:\n {anchor_target_df}")
         # print(f"bad links {bad_links}")
@@ -3147,16 +4240,19 @@ class IPCCTargetLink:
         bad_link_set = set()
         table.append(["anchor_text", "anchor_id", "target_id", "target_text"])
         curly_re = re.compile(".*\{(P<curly>[.^\}]*)\}.*")
+        url_cache = URLCache()
         for div in divs:
-            cls.follow_ids_in_curly_links(bad_link_set, curly_re, div, leaf_name, link_factory, table)
+            cls.follow_ids_in_curly_links(bad_link_set, curly_re, div, leaf_name, link_factory, table,
+                                          url_cache=url_cache)
             IPCCAnchor.create_confidences(div)
         print(f" table {len(table)}")
         print(f"bad_link_set {bad_link_set}")
+        import pandas as pd
         df = pd.DataFrame(table)
         return df
 
     @classmethod
-    def follow_ids_in_curly_links(cls, bad_link_set, curly_re, div, leaf_name, link_factory, table):
+    def follow_ids_in_curly_links(cls, bad_link_set, curly_re, div, leaf_name, link_factory, table, url_cache=None):
         id_spans = div.xpath("./span[@id]")
         anchor_id = None if len(id_spans) == 0 else id_spans[0].attrib.get("id")
         # print(f"anchor_id {anchor_id}")
@@ -3167,7 +4263,8 @@ class IPCCTargetLink:
                 print(f"match group {match.group('curly')}")
             rows, bad_links = IPCCTargetLink.read_links_from_span_and_follow_to_ipcc_repository_KEY(div, leaf_name,
                                                                                                     link_factory,
-                                                                                                    span)
+                                                                                                    span,
+                                                                                                    url_cache=url_cache)
             bad_link_set.update(bad_links)
             if rows:
                 table.extend(rows)
@@ -3305,25 +4402,149 @@ class LinkFactory:
 
 
 class URLCache:
-    def __init__(self):
-        self.url_dict = dict()
-
-    def read_xml_element_from_github(self, github_url, delay=1):
+    """
+    caches parsed documents read from URLs (normally raw GitHub HTML)
+    memory tier is an LRU of at most max_size parsed trees (with lazily built @id indexes);
+    optional disk tier (cache_dir) keeps the raw bytes and ETag of each URL, so later runs need no network
+    the politeness delay is per host and only applied before real network fetches
+    """
+    DEFAULT_MAX_SIZE = 32
+    DEFAULT_DELAY = 1
+    TIMEOUT = 30
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, cache_dir=None, delay=DEFAULT_DELAY, revalidate=False):
+        """
+        :param max_size: maximum number of parsed documents held in memory
+        :param cache_dir: directory for raw bytes; if None no disk tier
+        :param delay: minimum seconds between network fetches to the same host
+        :param revalidate: if True, disk entries are revalidated with If-None-Match (ETag)
+        """
+        self.url_dict = OrderedDict()
+        self.id_index_by_url = dict()
+        self.max_size = max_size
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self.delay = delay
+        self.revalidate = revalidate
+        self.last_fetch_by_host = dict()
+        self.stats = Counter()
+
+    def read_xml_element_from_github(self, github_url, delay=None, copy_element=True):
         """retrieves and parses content of URL. Caches it if found
-        returns a deepcopy as elemnt is likely to be edited"""
-        html_elem = self.url_dict.get(github_url)
+        returns a deepcopy as elemnt is likely to be edited
+        :param delay: politeness delay for this fetch (default self.delay)
+        :param copy_element: if False returns the shared cached tree, which must not be edited
+        """
+        html_elem = self.get_element(github_url, delay=delay)
         if html_elem is None:
-            try:
-                html_elem = XmlLib.read_xml_element_from_github(github_url=github_url)
-                time.sleep(delay)
-            except Exception as e:
-                print(f"cannot read {github_url} because {e}")
-                return None
-            self.url_dict[github_url] = html_elem
-        else:
-            # print(f" found in cache!")
-            pass
-        return copy.deepcopy(html_elem)
+            return None
+        return copy.deepcopy(html_elem) if copy_element else html_elem
+
+    def read_elements_by_id(self, github_url, id, parent=False, delay=None):
+        """
+        copies of the elements with given @id (or of their parents) in the document at github_url
+        only these subtrees are copied, not the whole document
+        :param github_url: url of document
+        :param id: value of @id
+        :param parent: if True copy the parents of the elements
+        :return: list of copied elements (None if document cannot be read)
+        """
+        html_elem = self.get_element(github_url, delay=delay)
+        if html_elem is None:
+            return None
+        id_index = self.id_index_by_url.get(github_url)
+        if id_index is None:
+            id_index = defaultdict(list)
+            for elem in html_elem.iter():
+                elem_id = elem.get("id") if isinstance(elem.tag, str) else None
+                if elem_id is not None:
+                    id_index[elem_id].append(elem)
+            self.id_index_by_url[github_url] = id_index
+        elems = id_index.get(id, [])
+        if parent:
+            elems = [elem.getparent() for elem in elems if elem.getparent() is not None]
+        return [copy.deepcopy(elem) for elem in elems]
+
+    def get_element(self, github_url, delay=None):
+        """
+        parsed (shared) document from memory, disk or network
+        :return: root element or None if it cannot be read
+        """
+        html_elem = self.url_dict.get(github_url)
+        if html_elem is not None:
+            self.url_dict.move_to_end(github_url)
+            self.stats["hits"] += 1
+            return html_elem
+        self.stats["misses"] += 1
+        try:
+            content = self.read_content(github_url, delay=delay)
+            html_elem = lxml.etree.fromstring(content)
+        except Exception as e:
+            print(f"cannot read {github_url} because {e}")
+            return None
+        self.url_dict[github_url] = html_elem
+        while len(self.url_dict) > self.max_size:
+            url, _ = self.url_dict.popitem(last=False)
+            self.id_index_by_url.pop(url, None)
+            self.stats["evictions"] += 1
+        return html_elem
+
+    def read_content(self, url, delay=None):
+        """
+        raw bytes of url from disk tier if present, else from network (and saved to disk tier)
+        :raises ValueError: if the server does not return the content
+        """
+        content_path, meta_path = self.get_disk_paths(url)
+        etag = None
+        if content_path is not None and content_path.exists():
+            if not self.revalidate:
+                self.stats["disk_hits"] += 1
+                return content_path.read_bytes()
+            if meta_path.exists():
+                etag = json.loads(meta_path.read_text()).get("etag")
+        headers = {"If-None-Match": etag} if etag else {}
+        self.wait_for_host(url, delay=delay)
+        try:
+            response = requests.get(url, headers=headers, timeout=self.TIMEOUT)
+        finally:
+            self.last_fetch_by_host[urlparse(url).netloc] = time.monotonic()
+        self.stats["fetches"] += 1
+        if response.status_code == 304 and content_path is not None and content_path.exists():
+            self.stats["disk_hits"] += 1
+            return content_path.read_bytes()
+        if response.status_code != 200:
+            raise ValueError(f"HTTP {response.status_code}")
+        content = response.content
+        if content_path is not None:
+            content_path.parent.mkdir(exist_ok=True, parents=True)
+            content_path.write_bytes(content)
+            meta_path.write_text(json.dumps({"url": url, "etag": response.headers.get("ETag")}))
+        return content
+
+    def wait_for_host(self, url, delay=None):
+        """sleeps until at least delay seconds have passed since the last fetch from the host of url"""
+        delay = self.delay if delay is None else delay
+        last_fetch = self.last_fetch_by_host.get(urlparse(url).netloc)
+        if delay and last_fetch is not None:
+            wait = last_fetch + delay - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+    def get_disk_paths(self, url):
+        """
+        :return: (content_path, metadata_path) for url, or (None, None) if there is no disk tier
+        """
+        if self.cache_dir is None:
+            return None, None
+        key = hashlib.sha256(url.encode("UTF-8")).hexdigest()
+        return Path(self.cache_dir, f"{key}.html"), Path(self.cache_dir, f"{key}.json")
+
+    def get_stats(self):
+        """
+        :return: dict of hits, misses, evictions, disk_hits, fetches and size
+        """
+        stats = {key: self.stats[key] for key in ["hits", "misses", "evictions", "disk_hits", "fetches"]}
+        stats["size"] = len(self.url_dict)
+        return stats
 
 
 class TargetExtractor:
@@ -3581,6 +4802,179 @@ class TargetExtractor:
         common_node = [n for n in node_counter.most_common() if n[1] > 1]
         return common_node
 
+
+class TargetIndex:
+    """
+    inverted index of IPCC source->target links over many chapter files
+    each chapter's rows (from TargetExtractor.extract_ipcc_fulltext_into_source_target_table) are
+    persisted in a JSON sidecar next to the HTML (or in index_dir) and only recomputed when the HTML changes
+    indexes: target -> [(chapter, paragraph_id)], chapter -> Counter(target), source -> Counter(target)
+
+    index = TargetIndex(corpus_dir=ipcc_dir)
+    for file in files:
+        index.add_chapter_file(file)
+    df = index.get_sources_for_target("WGI SPM A.1")
+
+    chapters are keyed by the path of their directory relative to corpus_dir (e.g. "wg1/Chapter07"), so
+    chapters in same-named directories of different reports are kept apart
+    """
+    COLUMNS = ['id', 'source', 'target', 'package', 'section', 'object', 'subsection', 'source_text']
+    CHAPTER = "chapter"
+    SUFFIX = ".targets.json"
+
+    def __init__(self, index_dir=None, corpus_dir=None):
+        """
+        :param index_dir: directory for sidecars; if None they are written next to each HTML file
+        :param corpus_dir: root of the chapter files; if None chapters are keyed by their resolved directory
+        """
+        self.index_dir = None if index_dir is None else Path(index_dir)
+        self.corpus_dir = None if corpus_dir is None else Path(corpus_dir).resolve()
+        self.rows_by_chapter = dict()
+        self.file_by_chapter = dict()
+        self.paragraphs_by_target = defaultdict(list)
+        self.targets_by_chapter = defaultdict(Counter)
+        self.targets_by_source = defaultdict(Counter)
+        self.extracted_chapters = []  # chapters whose HTML was (re)scanned rather than read from sidecar
+
+    # class TargetIndex
+
+    def get_chapter_key(self, file):
+        """
+        :param file: chapter HTML
+        :return: directory of file relative to corpus_dir (or resolved, if no corpus_dir) in posix form
+        """
+        chapter_dir = Path(file).resolve().parent
+        if self.corpus_dir is not None:
+            try:
+                return chapter_dir.relative_to(self.corpus_dir).as_posix()
+            except ValueError:
+                raise ValueError(f"{file} is not under corpus_dir {self.corpus_dir}")
+        return chapter_dir.as_posix()
+
+    def get_sidecar_path(self, file, chapter):
+        """
+        :return: sidecar next to file or, with index_dir, at index_dir/<chapter>.targets.json
+            (chapter keys containing '/' give subdirectories)
+        """
+        if self.index_dir is None:
+            return Path(Path(file).parent, Path(file).stem + self.SUFFIX)
+        chapter_path = Path(chapter)
+        if chapter_path.is_absolute():
+            chapter_path = chapter_path.relative_to(chapter_path.anchor)
+        return Path(self.index_dir, str(chapter_path) + self.SUFFIX)
+
+    @classmethod
+    def get_file_signature(cls, file):
+        stat = Path(file).stat()
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def add_chapter_file(self, file, chapter=None):
+        """
+        adds (or replaces) the rows of one chapter, using its sidecar if the HTML has not changed
+        :param file: chapter HTML (e.g. .../LongerReport/fulltext.html)
+        :param chapter: chapter name (default: get_chapter_key(file))
+        :return: list of rows for chapter
+        """
+        file = Path(file)
+        if not file.exists():
+            raise FileNotFoundError(f"{file} does not exist")
+        chapter = self.get_chapter_key(file) if chapter is None else chapter
+        previous_file = self.file_by_chapter.get(chapter)
+        if previous_file is not None and previous_file != file.resolve():
+            logging.warning(f"chapter {chapter} from {previous_file} replaced by {file}")
+        signature = self.get_file_signature(file)
+        sidecar = self.get_sidecar_path(file, chapter)
+        rows = None
+        if sidecar.exists():
+            with open(sidecar, "r", encoding="UTF-8") as f:
+                sidecar_json = json.load(f)
+            if sidecar_json.get("signature") == signature and sidecar_json.get("columns") == self.COLUMNS:
+                rows = sidecar_json.get("rows")
+        if rows is None:
+            rows = TargetExtractor.extract_ipcc_fulltext_into_source_target_table(file)
+            self.extracted_chapters.append(chapter)
+            sidecar.parent.mkdir(exist_ok=True, parents=True)
+            with open(sidecar, "w", encoding="UTF-8") as f:
+                json.dump({"file": str(file), "signature": signature, "columns": self.COLUMNS, "rows": rows}, f)
+        self.remove_chapter(chapter)
+        self.rows_by_chapter[chapter] = rows
+        self.file_by_chapter[chapter] = file.resolve()
+        self._index_rows(chapter, rows)
+        return rows
+
+    def _index_rows(self, chapter, rows):
+        id_col, source_col, target_col = [self.COLUMNS.index(col) for col in ['id', 'source', 'target']]
+        for row in rows:
+            target = row[target_col]
+            self.paragraphs_by_target[target].append((chapter, row[id_col]))
+            self.targets_by_chapter[chapter][target] += 1
+            self.targets_by_source[row[source_col]][target] += 1
+
+    def remove_chapter(self, chapter):
+        """removes chapter and its entries from the indexes"""
+        self.file_by_chapter.pop(chapter, None)
+        rows = self.rows_by_chapter.pop(chapter, None)
+        if not rows:
+            return
+        source_col, target_col = [self.COLUMNS.index(col) for col in ['source', 'target']]
+        for row in rows:
+            target = row[target_col]
+            paragraphs = [p for p in self.paragraphs_by_target[target] if p[0] != chapter]
+            if paragraphs:
+                self.paragraphs_by_target[target] = paragraphs
+            else:
+                self.paragraphs_by_target.pop(target, None)
+            source_targets = self.targets_by_source[row[source_col]]
+            source_targets[target] -= 1
+            if source_targets[target] <= 0:
+                del source_targets[target]
+        self.targets_by_chapter.pop(chapter, None)
+
+    # class TargetIndex
+
+    def get_table(self, chapters=None):
+        """
+        :param chapters: list of chapters (default all)
+        :return: DataFrame of all rows with COLUMNS + 'chapter'
+        """
+        import pandas as pd
+        chapters = self.rows_by_chapter.keys() if chapters is None else chapters
+        table = [list(row) + [chapter] for chapter in chapters for row in self.rows_by_chapter.get(chapter, [])]
+        return pd.DataFrame(table, columns=self.COLUMNS + [self.CHAPTER])
+
+    def get_sources_for_target(self, target):
+        """
+        :return: DataFrame (chapter, id) of paragraphs linking to target
+        """
+        import pandas as pd
+        return pd.DataFrame(self.paragraphs_by_target.get(target, []), columns=[self.CHAPTER, "id"])
+
+    def get_target_counts(self, chapter=None):
+        """
+        :param chapter: restrict to chapter (default all chapters)
+        :return: DataFrame (target, count) sorted by decreasing count
+        """
+        import pandas as pd
+        if chapter is not None:
+            counter = self.targets_by_chapter.get(chapter, Counter())
+        else:
+            counter = Counter()
+            for chapter_counter in self.targets_by_chapter.values():
+                counter.update(chapter_counter)
+        return pd.DataFrame(counter.most_common(), columns=["target", "count"])
+
+    def find_commonest_targets(self, min_count=2):
+        """index equivalent of TargetExtractor.find_commonest_in_node_lists(table, node_name="target")"""
+        return [(target, len(paragraphs)) for target, paragraphs in
+                sorted(self.paragraphs_by_target.items(), key=lambda item: -len(item[1]))
+                if len(paragraphs) >= min_count]
+
+    def find_commonest_sources(self, min_count=2):
+        """index equivalent of TargetExtractor.find_commonest_in_node_lists(table, node_name="source")"""
+        counts = Counter({source: sum(targets.values()) for source, targets in self.targets_by_source.items()})
+        return [item for item in counts.most_common() if item[1] >= min_count]
+
+
 ID = "id"
 OBJECT ="object"
 STARTEND = "start_end"
@@ -3732,6 +5126,11 @@ class CSSStyle:
 
     TEXT_STYLE_COMPONENTS = [FONT_STYLE, FONT_WEIGHT, FONT_FAMILY, FONT_SIZE, COLOR, OPACITY]
 
+    # interned FrozenCSSStyles by style string (see get_interned_style)
+    INTERN_MAX_SIZE = 4096
+    interned_style_by_string = OrderedDict()
+    intern_stats = Counter()
+
     def __init__(self):
         self.name_value_dict = dict()
 
@@ -3759,6 +5158,60 @@ class CSSStyle:
 
     #    class CSSStyle:
 
+    @classmethod
+    def get_interned_style(cls, style_str):
+        """returns the shared, immutable FrozenCSSStyle for style_str, parsing it only on first use
+        least-recently-used styles are evicted beyond INTERN_MAX_SIZE
+        use this (not create_css_style_from_attribute_of_body_element) when the style is only read
+        :param style_str: value of style attribute (None is treated as "")
+        :return: FrozenCSSStyle
+        """
+        style_str = style_str if style_str else ""
+        frozen_style = cls.interned_style_by_string.get(style_str)
+        if frozen_style is not None:
+            cls.interned_style_by_string.move_to_end(style_str)
+            cls.intern_stats["hits"] += 1
+            return frozen_style
+        cls.intern_stats["misses"] += 1
+        frozen_style = FrozenCSSStyle(style_str)
+        cls.interned_style_by_string[style_str] = frozen_style
+        if len(cls.interned_style_by_string) > cls.INTERN_MAX_SIZE:
+            cls.interned_style_by_string.popitem(last=False)
+            cls.intern_stats["evictions"] += 1
+        return frozen_style
+
+    @classmethod
+    def get_interned_style_of_element(cls, elem):
+        """FrozenCSSStyle for style attribute of elem (see get_interned_style)
+        :param elem: element; if None returns None
+        """
+        if elem is None:
+            return None
+        return cls.get_interned_style(elem.get(CSSStyle.STYLE))
+
+    @classmethod
+    def get_intern_stats(cls):
+        """
+        :return: dict of hits, misses, evictions, size and hit_rate of interned styles
+        """
+        hits = cls.intern_stats["hits"]
+        misses = cls.intern_stats["misses"]
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": cls.intern_stats["evictions"],
+            "size": len(cls.interned_style_by_string),
+            "hit_rate": hits / (hits + misses) if hits + misses > 0 else None,
+        }
+
+    @classmethod
+    def clear_interned_styles(cls):
+        """empties interned styles and resets statistics"""
+        cls.interned_style_by_string.clear()
+        cls.intern_stats.clear()
+
+    #    class CSSStyle:
+
     @classmethod
     def create_dict_from_name_value_array_string(cls, style_str, remove_curly=True):
         """
@@ -4294,12 +5747,8 @@ class CSSStyle:
         """
         :return: x0, x1, y0, y1
         """
-        csss = cls.create_css_style_from_attribute_of_body_element(elem)
-        x0 = csss.get_numeric_attval("x0")
-        x1 = csss.get_numeric_attval("x1")
-        y0 = csss.get_numeric_attval("y0")
-        y1 = csss.get_numeric_attval("y1")
-        return (x0, y0, x1, y1)
+        csss = cls.get_interned_style_of_element(elem)
+        return (csss.x0, csss.y0, csss.x1, csss.y1)
 
     @classmethod
     def get_x0(cls, elem):
@@ -4320,6 +5769,89 @@ class CSSStyle:
 
 
 
+class FrozenCSSStyle:
+    """immutable parsed style attribute, shared by all elements with the same style string
+    created by CSSStyle.get_interned_style(); has the read-only API of CSSStyle
+    with commonly used values (font, bold, coordinates) computed once.
+    Non-numeric values of numeric properties give None.
+    Use to_css_style() for an editable copy
+    """
+    __slots__ = ("style_str", "name_value_dict", "font_family", "font_size", "is_bold", "is_italic",
+                 "_is_bold_name", "left", "top", "width", "height", "bottom", "x0", "y0", "x1", "y1")
+
+    def __init__(self, style_str):
+        """
+        :param style_str: value of style attribute
+        :except: KeyError for malformed style (see CSSStyle.create_dict_from_name_value_array_string)
+        """
+        css_style = CSSStyle()
+        css_style.name_value_dict = CSSStyle.create_dict_from_name_value_array_string(style_str)
+        setattr_ = object.__setattr__
+        setattr_(self, "style_str", style_str)
+        setattr_(self, "name_value_dict", MappingProxyType(css_style.name_value_dict))
+        setattr_(self, "font_family", css_style.font_family)
+        setattr_(self, "is_bold", css_style.is_bold)
+        setattr_(self, "is_italic", css_style.is_italic)
+        setattr_(self, "_is_bold_name", css_style.is_bold_name())
+        for name, css_name in [("font_size", CSSStyle.FONT_SIZE), ("left", CSSStyle.LEFT), ("top", CSSStyle.TOP),
+                               ("width", CSSStyle.WIDTH), ("height", CSSStyle.HEIGHT),
+                               ("bottom", CSSStyle.BOTTOM), ("x0", "x0"), ("y0", "y0"), ("x1", "x1"), ("y1", "y1")]:
+            try:
+                value = css_style.get_numeric_attval(css_name)
+            except ValueError:
+                value = None
+            setattr_(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"FrozenCSSStyle is immutable; cannot set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"FrozenCSSStyle is immutable; cannot delete {name}")
+
+    def __eq__(self, other):
+        if isinstance(other, (FrozenCSSStyle, CSSStyle)):
+            return dict(self.name_value_dict) == dict(other.name_value_dict)
+        return False
+
+    def __hash__(self):
+        return hash(frozenset(self.name_value_dict.items()))
+
+    def __str__(self):
+        return CSSStyle.__str__(self)
+
+    def get_attribute(self, property):
+        return self.name_value_dict.get(property)
+
+    def attval(self, name):
+        return self.name_value_dict.get(name)
+
+    def get_numeric_attval(self, name, decimal=1):
+        return CSSStyle.get_numeric_attval(self, name, decimal=decimal)
+
+    def get_font_style_attributes(self):
+        return CSSStyle.get_font_style_attributes(self)
+
+    def get_css_value(self):
+        return CSSStyle.get_css_value(self)
+
+    def is_bold_name(self):
+        return self._is_bold_name
+
+    def obeys(self, condition):
+        return CSSStyle.obeys(self, condition)
+
+    def create_bbox(self):
+        return CSSStyle.create_bbox(self)
+
+    def to_css_style(self):
+        """
+        :return: new mutable CSSStyle with the same values
+        """
+        css_style = CSSStyle()
+        css_style.name_value_dict = dict(self.name_value_dict)
+        return css_style
+
+
 class CSSConverter:
     """
     turns CCS styles into html classes
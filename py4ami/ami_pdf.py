@@ -5,18 +5,22 @@ from binascii import b2a_hex
 import copy
 import json
 import logging
+import math
 import os.path
 import re
 import statistics
 import sys
 import textwrap
+import time
 import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from io import BytesIO, StringIO
 from pathlib import Path
 from typing import Container
 
 import lxml
 import lxml.html
+import numpy as np
 import pdfplumber
 from PIL import Image
 from lxml import etree
@@ -434,57 +438,72 @@ class AmiPage:
     @classmethod
     # TODO should be new class
     def chars_to_spans(cls, bbox, input_pdf, page_no):
+        """opens input_pdf and creates raw HTML for a single page
+        for many pages use iterate_pdf_pages() and chars_to_spans_from_pdf_page() to avoid re-opening the PDF
+        :param bbox: clip page (may be None)
+        :param input_pdf: PDF file
+        :param page_no: 0-based page number
+        :return: html element
+        """
         with pdfplumber.open(input_pdf) as pdf:
-            pdf_page = pdf.pages[page_no]
-            ami_page = AmiPage()
-            # print(f"crop: {page0.cropbox} media {page0.mediabox}, bbox {page0.bbox}")
-            # print(f"rotation: {page0.rotation} doctop {page0.initial_doctop}")
-            # print(f"width {page0.width} height {page0.height}")
-            # print(f"text {page0.extract_text()[:2]}")
-            # print(f"words {page0.extract_words()[:3]}")
-            #
-            # print(f"char {page0.chars[:1]}")
-            span = None
-            span_list = []
-            maxchars = 999999
-            ndec_coord = 3  # decimals for coords
-            ndec_fontsize = 2
-            html = HtmlUtil.create_skeleton_html()
-            top_div = lxml.etree.SubElement(html.xpath(H_BODY)[0], H_DIV)
-            top_div.attrib["class"] = "top"
-            for ch in pdf_page.chars[:maxchars]:
-                if cls.skip_rotated_text(ch):
-                    continue
-                x0, x1, y0, y1 = cls.get_xy_tuple(ch, ndec_coord)
-                if bbox and not bbox.contains_point((x0, y0)):
-                    # print(f" outside box: {x0, y0}")
-                    continue
+            return cls.chars_to_spans_from_pdf_page(bbox, pdf.pages[page_no])
 
-                text_style = TextStyle()
-                text_style.set_font_family(ch.get(P_FONTNAME))
-                text_style.set_font_size(ch.get(P_HEIGHT), ndec=ndec_fontsize)
-                text_style.stroke = ch.get(P_STROKING_COLOR)
-                text_style.fill = ch.get(P_NON_STROKING_COLOR)
-
-                # style or y0 changes
-                if not span or not span.text_style or span.text_style != text_style or span.y0 != y0:
-                    # cls.debug_span_changed(span, text_style, y0)
-                    span = AmiSpan()
-                    span_list.append(span)
-                    span.text_style = text_style
-                    span.y0 = y0
-                    span.x0 = x0  # set left x
-                span.x1 = x1  # update right x, including width
-                span.string += ch.get(P_TEXT)
-
-            # top_div = lxml.etree.Element(H_DIV)
-            div = lxml.etree.SubElement(top_div, H_DIV)
-            last_span = None
-            for span in span_list:
-                if last_span is None or last_span.y0 != span.y0:
-                    div = lxml.etree.SubElement(top_div, H_DIV)
-                last_span = span
-                span.create_and_add_to(div)
+    @classmethod
+    def chars_to_spans_from_pdf_page(cls, bbox, pdf_page):
+        """creates raw HTML (divs of styled spans) from the chars in an open pdfplumber page
+        :param bbox: clip page (may be None)
+        :param pdf_page: pdfplumber page
+        :return: html element
+        """
+        ami_page = AmiPage()
+        # print(f"crop: {page0.cropbox} media {page0.mediabox}, bbox {page0.bbox}")
+        # print(f"rotation: {page0.rotation} doctop {page0.initial_doctop}")
+        # print(f"width {page0.width} height {page0.height}")
+        # print(f"text {page0.extract_text()[:2]}")
+        # print(f"words {page0.extract_words()[:3]}")
+        #
+        # print(f"char {page0.chars[:1]}")
+        span = None
+        span_list = []
+        maxchars = 999999
+        ndec_coord = 3  # decimals for coords
+        ndec_fontsize = 2
+        html = HtmlUtil.create_skeleton_html()
+        top_div = lxml.etree.SubElement(html.xpath(H_BODY)[0], H_DIV)
+        top_div.attrib["class"] = "top"
+        for ch in pdf_page.chars[:maxchars]:
+            if cls.skip_rotated_text(ch):
+                continue
+            x0, x1, y0, y1 = cls.get_xy_tuple(ch, ndec_coord)
+            if bbox and not bbox.contains_point((x0, y0)):
+                # print(f" outside box: {x0, y0}")
+                continue
+
+            text_style = TextStyle()
+            text_style.set_font_family(ch.get(P_FONTNAME))
+            text_style.set_font_size(ch.get(P_HEIGHT), ndec=ndec_fontsize)
+            text_style.stroke = ch.get(P_STROKING_COLOR)
+            text_style.fill = ch.get(P_NON_STROKING_COLOR)
+
+            # style or y0 changes
+            if not span or not span.text_style or span.text_style != text_style or span.y0 != y0:
+                # cls.debug_span_changed(span, text_style, y0)
+                span = AmiSpan()
+                span_list.append(span)
+                span.text_style = text_style
+                span.y0 = y0
+                span.x0 = x0  # set left x
+            span.x1 = x1  # update right x, including width
+            span.string += ch.get(P_TEXT)
+
+        # top_div = lxml.etree.Element(H_DIV)
+        div = lxml.etree.SubElement(top_div, H_DIV)
+        last_span = None
+        for span in span_list:
+            if last_span is None or last_span.y0 != span.y0:
+                div = lxml.etree.SubElement(top_div, H_DIV)
+            last_span = span
+            span.create_and_add_to(div)
         for ch in pdf_page.chars[:maxchars]:
             col = ch.get('non_stroking_color')
             if col:
@@ -520,51 +539,135 @@ class AmiPage:
     def create_page_from_pdf_html(cls, path):
         logging.error("NOT YET WRITTEN")
 
+    @classmethod
+    def iterate_pdf_pages(cls, input_pdf, range_list=None):
+        """opens input_pdf once and yields its pages lazily
+        after the caller has processed each page its cached objects (chars, etc.) are released
+        so memory does not grow with page count
+        :param input_pdf: PDF file
+        :param range_list: list of ranges (or single range) of 1-based page numbers; None means all
+        :return: generator of (0-based page_no, pdfplumber page)
+        """
+        with pdfplumber.open(input_pdf) as pdf:
+            for page_no, pdf_page in enumerate(pdf.pages):  # 0-based page_no
+                if range_list is not None and not Util.range_list_contains_int(page_no + 1, range_list):
+                    continue
+                logging.debug(f"accept page {page_no}")
+                try:
+                    yield page_no, pdf_page
+                finally:
+                    pdf_page.flush_cache()
+
     @classmethod
     def create_html_pages_pdfplumber(cls,
                                      bbox=DEFAULT_BBOX,
                                      input_pdf=None,
                                      output_dir=None,
                                      output_stem=None,
-                                     range_list=range(1,9999999)):
+                                     range_list=range(1,9999999),
+                                     workers=1,
+                                     total_stem=None):
         """create HTML pages from PDF
         USED
-        uses pdfminer routines (AmiPage.chars_to_spans)
+        uses pdfminer routines (AmiPage.chars_to_spans_from_pdf_page)
         will need further tuning to generate structured HTML
-        uses AmiPage.chars_to_spans()
+        streams pages from a single open of the PDF (AmiPage.iterate_pdf_pages())
 
         :param bbox: clip page (default is none)
         :param input_pdf: required PDF
         :param output_dir: output dicrectory
         :param output_stem: output filestem
-        :param page_nos: list of 2-tuples containing allowed ranges (e.g.  [(2,3), (5, 12)]
+        :param range_list: list of ranges of 1-based pages (e.g.  [range(2,4), range(5, 13)]
+        :param workers: if > 1 distribute chunks of pages across a pool of worker processes
+        :param total_stem: stem of the file into which pages are merged in page order (None: do not merge)
+        :return: dict of conversion time (seconds) by 0-based page_no; failed pages are omitted
+            (empty if input_pdf or output_dir is missing)
 
         creates Raw HTML
         """
         if not input_pdf or not Path(input_pdf).exists():
-            logging.logger.error(f"must have not-null, existing pdf {input_pdf} ")
-            return
+            logging.error(f"must have not-null, existing pdf {input_pdf} ")
+            return dict()
         if not output_dir:
-            logging.logger.error(f"must have not-null output_dir ")
-            return
+            logging.error(f"must have not-null output_dir ")
+            return dict()
 
         Path(output_dir).mkdir(exist_ok=True, parents=True)
-        with pdfplumber.open(input_pdf) as pdf:
-            page_count = len(pdf.pages)
-        for page_no in range(page_count):  # 0-based page_no
-            page_1based = page_no + 1 # 1-based
-
-            logging.debug(f"testing page {page_no}")
-        # for page_no in page_nos:
-            if not Util.range_list_contains_int(page_no + 1, range_list):
+        if workers and workers > 1:
+            page_times = AmiPage.create_html_pages_pdfplumber_parallel(bbox, input_pdf, output_dir, output_stem,
+                                                                       range_list, workers)
+            if total_stem:
+                AmiPage.write_total_html_pages(output_dir, output_stem, page_times.keys(), total_stem)
+            return page_times
+        page_times = dict()
+        for page_no, pdf_page in AmiPage.iterate_pdf_pages(input_pdf, range_list=range_list):
+            start = time.perf_counter()
+            try:
+                html = AmiPage.chars_to_spans_from_pdf_page(bbox, pdf_page)
+            except Exception as e:
+                logging.error(f"cannot convert page {page_no}, skipped: {e}")
                 continue
-            logging.debug(f"accept page {page_no}")
-            html = AmiPage.chars_to_spans(bbox, input_pdf, page_no)
             output_html = Path(output_dir, f"{output_stem}_{page_no}.html")
             with open(output_html, "wb") as f:
                 f.write(lxml.etree.tostring(html))
                 print(f" wrote html {output_html}")
                 # assert output_html.exists()
+            page_times[page_no] = time.perf_counter() - start
+            logging.info(f"page {page_no} converted in {page_times[page_no]:.3f} s")
+        if total_stem:
+            AmiPage.write_total_html_pages(output_dir, output_stem, page_times.keys(), total_stem)
+        return page_times
+
+    @classmethod
+    def write_total_html_pages(cls, output_dir, output_stem, page_nos, total_stem="total_pages"):
+        """merges the bodies of <output_stem>_<page_no>.html into <total_stem>.html in page order
+        :param output_dir: directory with page files
+        :param output_stem: stem of page files
+        :param page_nos: 0-based page numbers of the converted pages (failed pages are left out by the caller)
+        :param total_stem: stem of merged file
+        :return: path of merged file
+        """
+        total_html = HtmlLib.create_html_with_empty_head_body()
+        total_body = HtmlLib.get_body(total_html)
+        for page_no in sorted(page_nos):
+            page_file = Path(output_dir, f"{output_stem}_{page_no}.html")
+            try:
+                html_page = lxml.etree.parse(str(page_file)).getroot()
+            except Exception as e:
+                logging.error(f"could not read {page_file}, omitted from {total_stem}: {e}")
+                continue
+            for body_elem in HtmlLib.get_body(html_page).xpath("*"):
+                total_body.append(body_elem)
+        path = Path(output_dir, f"{total_stem}.html")
+        XmlLib.write_xml(total_html, path)
+        print(f" wrote html {path}")
+        return path
+
+    @classmethod
+    def create_html_pages_pdfplumber_parallel(cls, bbox, input_pdf, output_dir, output_stem, range_list, workers):
+        """as create_html_pages_pdfplumber() but each worker process converts a contiguous chunk of pages
+        :return: dict of conversion time (seconds) by 0-based page_no, in page order
+        """
+        with pdfplumber.open(input_pdf) as pdf:
+            page_count = len(pdf.pages)
+        page_numbers = [page_no for page_no in range(1, page_count + 1)
+                        if range_list is None or Util.range_list_contains_int(page_no, range_list)]
+        chunk_size = max(1, math.ceil(len(page_numbers) / (workers * AmiPDFPlumber.CHUNKS_PER_WORKER)))
+        page_times = dict()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            future_to_chunk = dict()
+            for start in range(0, len(page_numbers), chunk_size):
+                chunk = page_numbers[start:start + chunk_size]
+                future = executor.submit(AmiPage.create_html_pages_pdfplumber, bbox=bbox, input_pdf=input_pdf,
+                                         output_dir=output_dir, output_stem=output_stem,
+                                         range_list=[range(page_no, page_no + 1) for page_no in chunk], workers=1)
+                future_to_chunk[future] = chunk
+            for future in as_completed(future_to_chunk):
+                try:
+                    page_times.update(future.result())
+                except Exception as e:
+                    logging.error(f"worker failed on pages {future_to_chunk[future]}: {e}")
+        return dict(sorted(page_times.items()))
 
 class AmiSect:
     """Transformation of an Html Page to sections
@@ -762,6 +865,7 @@ PDF2HTML = "pdf2html"
 IMAGEDIR = "imagedir"
 RESOLUTION = "resolution"
 TEMPLATE = "template"
+WORKERS = "workers"
 
 
 class PDFArgs(AbstractArgs):
@@ -793,6 +897,7 @@ class PDFArgs(AbstractArgs):
         self.raw_html = None
         self.flow = None
         self.unwanteds = None
+        self.workers = 1
 
     """
     def __init__(self):
@@ -822,6 +927,7 @@ class PDFArgs(AbstractArgs):
         self.raw_html = None
         self.flow = None
         self.unwanteds = None
+        self.workers = 1
 
     def add_arguments(self):
         """creates adds the arguments for pyami commandline
@@ -869,6 +975,7 @@ class PDFArgs(AbstractArgs):
         self.parser.add_argument("--pages", type=str, nargs="+", help="reads '_2 4_6 8 11_' as 1-2, 4-6, 8, 11-end ; all ranges inclusive (not yet debugged)", default=ALL_PAGES)
         self.parser.add_argument("--resolution", type=int, nargs=1, help="resolution of output images (if imagedir)", default=400)
         self.parser.add_argument("--template", type=str, nargs=1, help="file to parse specific type of document (NYI)")
+        self.parser.add_argument("--workers", type=int, help="number of processes for page conversion (--pdf2html pdfplumber)", default=1)
         return self.parser
 
     # class PDFArgs:
@@ -898,6 +1005,22 @@ class PDFArgs(AbstractArgs):
         self.create_consistent_output_filenames_and_dirs()
         self.calculate_headers_footers()
 
+        if self.pdf2html == "pdfplumber":
+            # pages are converted independently, so any number of workers gives the same files
+            AmiPage.create_html_pages_pdfplumber(
+                          bbox=AmiPage.DEFAULT_BBOX,
+                          input_pdf=self.inpath,
+                          output_dir=self.outdir,
+                          output_stem=self.outstem,
+                          range_list=self.pages,
+                          workers=self.workers,
+                          total_stem="total_pages"
+            )
+            return
+        if self.workers > 1:
+            # the newstyle converter tidies the whole document as one flow and cannot be split into pages
+            raise ValueError(f"--workers {self.workers} needs --pdf2html pdfplumber")
+
         newstyle = True
         if newstyle:
             infile = self.arg_dict.get(INFILE)
@@ -921,17 +1044,6 @@ class PDFArgs(AbstractArgs):
             return
 
 
-        if self.pdf2html:
-            self.create_consistent_output_filenames_and_dirs()
-            # range_list = self.create_range_list()
-            AmiPage.create_html_pages_pdfplumber(
-                          bbox=AmiPage.DEFAULT_BBOX,
-                          input_pdf=self.inpath,
-                          output_dir=self.outdir,
-                          output_stem=self.outstem,
-                          range_list=self.pages
-            )
-
 
     def check_input(self):
         if not self.inpath:
@@ -1006,6 +1118,8 @@ class PDFArgs(AbstractArgs):
         logging.info(f"pages {pages}")
 
         self.pdf2html = self.arg_dict.get(PDF2HTML)
+        workers = self.arg_dict.get(WORKERS)
+        self.workers = workers if workers else 1
 
             # self.convert_write(maxpage=maxpage, outdir=outdir, outstem=outstem, fmt=fmt, inpath=inpath, flow=True)
 
@@ -1035,6 +1149,7 @@ class PDFArgs(AbstractArgs):
         arg_dict[PAGES] = None
         arg_dict[PDF2HTML] = None
         arg_dict[FLOW] = True
+        arg_dict[WORKERS] = 1
         return arg_dict
 
     @classmethod
@@ -1905,15 +2020,32 @@ class AmiPlumberJson:
     """
     holds PDFPlumberJSON object
     """
-    def __init__(self, pdf_json):
+    def __init__(self, pdf_json, page_json_generator=None):
+        """
+        :param pdf_json: whole-document pdfplumber JSON (may be None if page_json_generator is given)
+        :param page_json_generator: lazy source of per-page JSON dicts (see AmiPDFPlumber.iterate_page_json)
+        """
         self.pdf_json = pdf_json
+        self.page_json_generator = page_json_generator
         self.json_pages = None
 
     def get_ami_json_pages(self):
+        """list of all pages; materializes a lazy generator so prefer iterate_ami_json_pages()"""
         if not self.json_pages:
-            self.json_pages = [AmiPlumberJsonPage(p) for p in self.pdf_json['pages']]
+            if self.pdf_json is None and self.page_json_generator is not None:
+                self.json_pages = list(self.iterate_ami_json_pages())
+            else:
+                self.json_pages = [AmiPlumberJsonPage(p) for p in self.pdf_json['pages']]
         return self.json_pages
 
+    def iterate_ami_json_pages(self):
+        """yields AmiPlumberJsonPages one at a time; only one page is held if lazy"""
+        if self.pdf_json is None and self.page_json_generator is not None and not self.json_pages:
+            for page_json in self.page_json_generator:
+                yield AmiPlumberJsonPage(page_json)
+        else:
+            yield from self.get_ami_json_pages()
+
     @property
     def keys(self):
         return self.pdf_json.keys if self.pdf_json else None
@@ -1937,6 +2069,8 @@ class RegionClipper:
 
 
 class AmiPlumberJsonPage:
+    FONT_CACHE = dict()  # (AmiFont, CSSStyle) by pdfplumber fontname, shared by all pages
+
     def __init__(self, page):
         self.page = page
 
@@ -1954,6 +2088,121 @@ class AmiPlumberJsonPage:
     # AmiPlumberJsonPage:
 
     def get_spans(self, epsilon=0.1, ):
+        """
+        creates spans of characters with the same font style on the same line (y0 within epsilon of span start)
+        columnar: chars are loaded into arrays, span breaks are found by vectorized comparisons
+        and lxml spans are created once per span (same result as get_spans_by_char())
+        :param epsilon: maximum y0 difference from first char of span
+        :return: list of spans
+        """
+        char_dicts = self.get_chars()
+        if char_dicts is None:
+            return []
+        columns = self.create_char_columns(char_dicts)
+        if columns is None:
+            return self.get_spans_by_char(epsilon=epsilon)
+        texts, x1s, y0, style_ids, whitespace = columns
+        nchars = len(texts)
+        if nchars == 0:
+            return []
+
+        # breaks among non-whitespace chars: style change, or y0 more than epsilon from span start
+        ink = np.flatnonzero(~whitespace)
+        if ink.size == 0:
+            return []
+        ink_y0 = y0[ink]
+        style_change = np.ones(ink.size, dtype=bool)
+        style_change[1:] = style_ids[ink[1:]] != style_ids[ink[:-1]]
+        y_moved = np.ones(ink.size, dtype=bool)
+        y_moved[1:] = ink_y0[1:] != ink_y0[:-1]
+        is_break = style_change.copy()
+        # chars with unchanged style and y0 cannot break; the others are compared with their span start
+        anchor_y0 = None
+        for k in np.flatnonzero(style_change | y_moved):
+            if is_break[k] or abs(anchor_y0 - ink_y0[k]) > epsilon:
+                is_break[k] = True
+                anchor_y0 = ink_y0[k]
+        starts = ink[is_break]
+
+        # every char belongs to the latest span started at or before it
+        is_start = np.zeros(nchars, dtype=bool)
+        is_start[starts] = True
+        span_of_char = np.cumsum(is_start) - 1
+        start_y0 = np.where(span_of_char >= 0, y0[starts[np.maximum(span_of_char, 0)]], np.nan)
+        included = span_of_char >= 0
+        included &= ~whitespace | (np.abs(y0 - start_y0) <= epsilon)
+
+        spanlist = []
+        chars_by_span = np.split(np.flatnonzero(included), np.searchsorted(np.flatnonzero(included), starts[1:]))
+        for start, char_indexes in zip(starts, chars_by_span):
+            span = lxml.etree.Element("span")
+            spanlist.append(span)
+            char_dict = char_dicts[start]
+            css, text = AmiPDFPlumber.create_char_css(char_dict)
+            ami_font, css_style = self.get_ami_font_and_style(char_dict.get(PLUMB_FONTNAME))
+            coords = AmiPDFPlumber.get_coords(char_dict)
+            span_text = "".join(texts[i] for i in char_indexes)
+            try:
+                span.text = span_text
+            except ValueError:
+                # characters not allowed in XML are replaced one by one
+                self.add_span_attributes(coords, css, css_style, span, text)
+                for i in char_indexes[1:]:
+                    self.add_character_and_update_right_coord(span, texts[i], x1s[i])
+            else:
+                self.add_span_attributes(coords, css, css_style, span, span_text)
+                span.attrib["x1"] = str(x1s[char_indexes[-1]])
+        return spanlist
+
+    def create_char_columns(self, char_dicts):
+        """
+        loads the upright chars at the start of the page into columns
+        :param char_dicts: pdfplumber chars
+        :return: (texts, x1s, y0 array, style_id array, whitespace array) or None if a char cannot be handled
+                 (missing coordinates or text)
+        :except: ValueError if an object is not a char (as AmiPDFPlumber.create_char_css)
+        """
+        texts = []
+        x1s = []
+        y0s = []
+        style_ids = []
+        style_id_by_key = dict()
+        for char_dict in char_dicts:
+            obj_type = char_dict.get(CH_OBJECT_TYPE)
+            if obj_type != CH_CHAR:
+                raise ValueError(f" not a char {obj_type}")
+            if AmiPDFPlumber.get_int(char_dict, CH_UPRIGHT) != 1:
+                break  # the remaining chars are ignored
+            text = char_dict.get("text")
+            x1 = AmiPDFPlumber.get_float(char_dict, PL_X1)
+            y0 = AmiPDFPlumber.get_float(char_dict, PL_Y0)
+            if text is None or x1 is None or y0 is None:
+                return None
+            key = self.get_font_style_key(char_dict)
+            style_id = style_id_by_key.get(key)
+            if style_id is None:
+                style_id = style_id_by_key[key] = len(style_id_by_key)
+            texts.append(text)
+            x1s.append(x1)
+            y0s.append(y0)
+            style_ids.append(style_id)
+        whitespace = np.array([text.strip() == "" for text in texts], dtype=bool)
+        return texts, x1s, np.array(y0s, dtype=float), np.array(style_ids, dtype=int), whitespace
+
+    @classmethod
+    def get_font_style_key(cls, char_dict):
+        """
+        hashable equivalent of CSSStyle.get_font_style_attributes() of AmiPDFPlumber.create_char_css(char_dict)
+        (size, nonstroke colour, stroke colour, fontname)
+        """
+        values = (AmiPDFPlumber.get_float(char_dict, PLUMB_SIZE), char_dict.get(PLUMB_NONSTROKE),
+                  char_dict.get(PLUMB_STROKE), char_dict.get(PLUMB_FONTNAME))
+        return repr(tuple(value if value and len(str(value)) > 0 else None for value in values))
+
+    def get_spans_by_char(self, epsilon=0.1, ):
+        """
+        original character-by-character version of get_spans()
+        """
         spanlist = []
         char_dicts = self.get_chars()
         if char_dicts is None:
@@ -2028,13 +2277,21 @@ class AmiPlumberJsonPage:
     # AmiPlumberJsonPage:
 
     def get_ami_font_and_style(self, fontname):
-        ami_font = AmiFont.extract_name_weight_style_stretched_as_font(fontname)
-        css_style = CSSStyle()
-        if ami_font.is_bold:
-            css_style.set_attribute(CSSStyle.FONT_WEIGHT, CSSStyle.BOLD)
-        if ami_font.is_italic:
-            css_style.set_attribute(CSSStyle.FONT_STYLE, CSSStyle.ITALIC)
-        return ami_font, css_style
+        """
+        parses fontname once per distinct name (cached in FONT_CACHE; do not edit the results)
+        :param fontname: pdfplumber fontname
+        :return: (AmiFont, CSSStyle with font-weight and font-style)
+        """
+        font_and_style = AmiPlumberJsonPage.FONT_CACHE.get(fontname)
+        if font_and_style is None:
+            ami_font = AmiFont.extract_name_weight_style_stretched_as_font(fontname)
+            css_style = CSSStyle()
+            if ami_font.is_bold:
+                css_style.set_attribute(CSSStyle.FONT_WEIGHT, CSSStyle.BOLD)
+            if ami_font.is_italic:
+                css_style.set_attribute(CSSStyle.FONT_STYLE, CSSStyle.ITALIC)
+            font_and_style = AmiPlumberJsonPage.FONT_CACHE[fontname] = (ami_font, css_style)
+        return font_and_style
 
     # AmiPlumberJsonPage:
 
@@ -2089,12 +2346,8 @@ class AmiPlumberJsonPage:
     # AmiPlumberJsonPage:
 
     def extract_coords_and_font_properties(self, span):
-        csss = CSSStyle.create_css_style_from_attribute_of_body_element(span)
-        font_size = csss.get_numeric_attval(CSSStyle.FONT_SIZE)
-        y0 = csss.get_numeric_attval("y0")
-        y1 = csss.get_numeric_attval("y1")
-        x1 = csss.get_numeric_attval("x1")
-        return font_size, y0, y1
+        csss = CSSStyle.get_interned_style_of_element(span)
+        return csss.font_size, csss.y0, csss.y1
 
     # AmiPlumberJsonPage:
 
@@ -2166,10 +2419,8 @@ class AmiPlumberJsonPage:
         """
         if elem is None:
             return None, None
-        csss = CSSStyle.create_css_style_from_attribute_of_body_element(elem)
-        font_size = csss.get_numeric_attval(CSSStyle.FONT_SIZE)
-        font_family = csss.get_attribute(CSSStyle.FONT_FAMILY)
-        return font_family, font_size
+        csss = CSSStyle.get_interned_style_of_element(elem)
+        return csss.font_family, csss.font_size
 
 
 PLUMB_FONTNAME = "fontname"
@@ -2190,6 +2441,11 @@ PLUMB_CHARS = "chars"
 PLUMB_RECTS = "rects"
 PLUMB_IMAGES = "images"
 PLUMB_ANNOTS = "annots"
+# page and char attributes used by AmiPlumberJsonPage (other pdfplumber attributes are not extracted by lazy pages)
+PLUMB_PAGE_KEYS = [PLUMB_PAGE_NUMBER, PLUMB_INITIAL_DOCTOP, PLUMB_ROTATION, PLUMB_CROPBOX, PLUMB_MEDIABOX, PLUMB_BBOX,
+                   PLUMB_WIDTH, PLUMB_HEIGHT]
+PLUMB_CHAR_KEYS = ["object_type", "upright", "x0", "y0", "x1", "y1", "top", PLUMB_FONTNAME, PLUMB_WIDTH, PLUMB_SIZE,
+                   PLUMB_NONSTROKE, PLUMB_STROKE, "text"]
 
 CH_CHAR = "char"
 CH_OBJECT_TYPE = "object_type"
@@ -2205,6 +2461,8 @@ class AmiPDFPlumber:
     """
     uses PDFPlumber (>=0.9.0) to parse PDF ane hold intermediates
     """
+    CHUNKS_PER_WORKER = 4  # smaller chunks balance load across workers; each chunk opens the PDF once
+
     def __init__(self, param_dict=None):
         """
         :param parse_dict: python dict to control pasr
@@ -2243,6 +2501,59 @@ class AmiPDFPlumber:
 
     # AmiPDFPlumber
 
+    def create_ami_plumber_json_lazy(self, path, pages=None) -> object:
+        """
+        creates an AmiPlumberJson whose pages are extracted one at a time (bounded memory)
+        :param path: path to read
+        :param pages: list of page numbers to read
+        """
+        pdfplumber_pdf = self.create_pdfplumber_pdf(path, pages=pages)
+        return AmiPlumberJson(None, page_json_generator=self.iterate_page_json(pdfplumber_pdf))
+
+    # AmiPDFPlumber
+
+    @classmethod
+    def iterate_page_json(cls, pdfplumber_pdf):
+        """
+        generator of JSON-like dicts for each page, equivalent to pdfplumber to_json() pages
+        but containing only PLUMB_PAGE_KEYS and chars with PLUMB_CHAR_KEYS;
+        page caches are released after extraction and the pdf is closed at the end
+        :param pdfplumber_pdf: open pdfplumber pdf
+        """
+        try:
+            for pdf_page in pdfplumber_pdf.pages:
+                page_json = {key: cls.to_json_value(getattr(pdf_page, key, None)) for key in PLUMB_PAGE_KEYS}
+                page_json[PLUMB_CHARS] = [cls.extract_char_json(char) for char in pdf_page.chars]
+                pdf_page.flush_cache()
+                yield page_json
+        finally:
+            pdfplumber_pdf.close()
+
+    # AmiPDFPlumber
+
+    @classmethod
+    def extract_char_json(cls, char):
+        """
+        JSON-compatible subset of pdfplumber char (see PLUMB_CHAR_KEYS)
+        """
+        return {key: cls.to_json_value(char.get(key)) for key in PLUMB_CHAR_KEYS}
+
+    @classmethod
+    def to_json_value(cls, value):
+        """converts pdfplumber values to the types produced by to_json() (tuples to lists, bools to ints, decimals to floats)"""
+        if isinstance(value, (tuple, list)):
+            return [cls.to_json_value(v) for v in value]
+        if isinstance(value, bool):
+            return int(value)
+        if value is None or isinstance(value, (int, float, str)):
+            return value
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return str(value)
+
+    # AmiPDFPlumber
+
     def debug_page(self, page, imagedir=None):
         json_page = page.page
         for key in json_page.keys():
@@ -2438,15 +2749,39 @@ class AmiPDFPlumber:
 
     # AmiPDFPlumber
 
-    def create_html_pages(self, input_pdf, output_page_dir, pages=None, debug=False, outstem="total_pages"):
-        ami_plumber_json = self.create_ami_plumber_json(input_pdf, pages=pages)
-        ami_json_pages = ami_plumber_json.get_ami_json_pages()
+    def create_html_pages(self, input_pdf, output_page_dir, pages=None, debug=False, outstem="total_pages", lazy=True,
+                          workers=1):
+        """
+        converts PDF to page_<n>.html files and a concatenated <outstem>.html
+        :param input_pdf: PDF to read
+        :param output_page_dir: directory for output
+        :param pages: list of page numbers to read
+        :param debug: print headers/footers and filenames
+        :param outstem: stem of concatenated file
+        :param lazy: if True extract pages one at a time (bounded memory, pages written as soon as converted);
+            else create whole-document JSON first
+        :param workers: if > 1 convert chunks of pages in a pool of worker processes (see create_html_pages_parallel)
+        """
+        if workers and workers > 1:
+            self.create_html_pages_parallel(input_pdf, output_page_dir, pages=pages, debug=debug, outstem=outstem,
+                                            workers=workers)
+            return
+        if lazy:
+            ami_plumber_json = self.create_ami_plumber_json_lazy(input_pdf, pages=pages)
+        else:
+            ami_plumber_json = self.create_ami_plumber_json(input_pdf, pages=pages)
         total_html = HtmlLib.create_html_with_empty_head_body()
 
         total_html_page_body = HtmlLib.get_body(total_html)
-        for i, ami_json_page in enumerate(ami_json_pages):
+        page_count = 0
+        for i, ami_json_page in enumerate(ami_plumber_json.iterate_ami_json_pages()):
+            page_count += 1
             print(f"==============PAGE {i+1}================")
-            html_page, footer_span_list, header_span_list = ami_json_page.create_html_page_and_header_footer(self)
+            try:
+                html_page, footer_span_list, header_span_list = ami_json_page.create_html_page_and_header_footer(self)
+            except Exception as e:
+                logging.error(f"cannot convert page {i + 1}, skipped: {e}")
+                continue
             if debug:
                 ami_json_page.print_header_footer_lists(footer_span_list, header_span_list)
             try:
@@ -2460,13 +2795,19 @@ class AmiPDFPlumber:
             body_elems = HtmlLib.get_body(html_page).xpath("*")
             for body_elem in body_elems:
                 total_html_page_body.append(body_elem)
-        for i, _ in enumerate(ami_json_pages):
+        for i in range(page_count):
             page_file = Path(output_page_dir, f"page_{i + 1}.html")
             try:
                 html_elem = lxml.etree.parse(str(page_file))
             except Exception as e:
                 print(f"could not read XML {page_file} because {e}")
 
+        self.write_total_html(total_html, output_page_dir, outstem, debug=debug)
+
+    # AmiPDFPlumber
+
+    def write_total_html(self, total_html, output_page_dir, outstem, debug=False):
+        """adds debug styles to concatenated pages and writes <outstem>.html"""
         path = Path(output_page_dir, f"{outstem}.html")
         HtmlStyle.add_head_styles(
             total_html,
@@ -2479,6 +2820,104 @@ class AmiPDFPlumber:
         if debug:
             print(f"wrote html {path}")
         # print(f"encoding {FileLib.get_encoding(path)}")
+        return path
+
+    # AmiPDFPlumber
+
+    def create_html_pages_parallel(self, input_pdf, output_page_dir, pages=None, debug=False, outstem="total_pages",
+                                   workers=2):
+        """
+        as create_html_pages() but distributes chunks of pages across a pool of worker processes
+        each worker opens the PDF once and writes page_<n>.html for its chunk;
+        the page files are then merged into <outstem>.html in page order.
+        pages which fail (in conversion or in a crashed worker) are logged and omitted
+        :param input_pdf: PDF to read
+        :param output_page_dir: directory for output
+        :param pages: list of page numbers to read (None means all)
+        :param debug: print headers/footers and filenames
+        :param outstem: stem of concatenated file
+        :param workers: number of worker processes
+        :return: list of serial numbers of pages which could not be converted
+        """
+        page_numbers = self.get_page_numbers(input_pdf, pages)
+        Path(output_page_dir).mkdir(exist_ok=True, parents=True)
+        chunk_size = max(1, math.ceil(len(page_numbers) / (workers * AmiPDFPlumber.CHUNKS_PER_WORKER)))
+        serial_by_page = {page_no: serial for serial, page_no in enumerate(page_numbers, start=1)}
+        failed = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            future_to_chunk = dict()
+            for start in range(0, len(page_numbers), chunk_size):
+                chunk = page_numbers[start:start + chunk_size]
+                future = executor.submit(AmiPDFPlumber.write_html_page_chunk,
+                                         input_pdf, output_page_dir, chunk, start + 1, self.param_dict, debug)
+                future_to_chunk[future] = chunk
+            for future in as_completed(future_to_chunk):
+                chunk = future_to_chunk[future]
+                try:
+                    failed.extend(future.result())
+                except Exception as e:
+                    logging.error(f"worker failed on pages {chunk}: {e}")
+                    failed.extend(serial_by_page[page_no] for page_no in chunk)
+
+        total_html = HtmlLib.create_html_with_empty_head_body()
+        total_html_page_body = HtmlLib.get_body(total_html)
+        for serial in range(1, len(page_numbers) + 1):
+            if serial in failed:
+                continue
+            page_file = Path(output_page_dir, f"page_{serial}.html")
+            try:
+                html_page = lxml.etree.parse(str(page_file)).getroot()
+            except Exception as e:
+                print(f"could not read XML {page_file} because {e}")
+                failed.append(serial)
+                continue
+            for body_elem in HtmlLib.get_body(html_page).xpath("*"):
+                total_html_page_body.append(body_elem)
+        if failed:
+            logging.warning(f"pages not converted: {sorted(failed)}")
+        self.write_total_html(total_html, output_page_dir, outstem, debug=debug)
+        return sorted(failed)
+
+    # AmiPDFPlumber
+
+    @classmethod
+    def get_page_numbers(cls, input_pdf, pages=None):
+        """sorted 1-based page numbers in input_pdf, restricted to pages if given"""
+        with pdfplumber.open(input_pdf) as pdf:
+            page_count = len(pdf.pages)
+        if not pages:
+            return list(range(1, page_count + 1))
+        return sorted(set(page_no for page_no in pages if 1 <= page_no <= page_count))
+
+    # AmiPDFPlumber
+
+    @classmethod
+    def write_html_page_chunk(cls, input_pdf, output_page_dir, page_numbers, first_serial, param_dict, debug=False):
+        """
+        worker for create_html_pages_parallel(); converts a chunk of pages from a single open of the PDF
+        and writes page_<serial>.html for each
+        :param input_pdf: PDF to read
+        :param output_page_dir: directory for output
+        :param page_numbers: 1-based page numbers in the chunk
+        :param first_serial: serial number (in the whole conversion) of the first page in chunk
+        :param param_dict: parameters for AmiPDFPlumber
+        :param debug: print headers/footers
+        :return: serial numbers of pages that failed
+        """
+        ami_pdfplumber = AmiPDFPlumber(param_dict=param_dict)
+        ami_plumber_json = ami_pdfplumber.create_ami_plumber_json_lazy(input_pdf, pages=page_numbers)
+        failed = []
+        for serial, ami_json_page in enumerate(ami_plumber_json.iterate_ami_json_pages(), start=first_serial):
+            try:
+                html_page, footer_span_list, header_span_list = \
+                    ami_json_page.create_html_page_and_header_footer(ami_pdfplumber)
+                if debug:
+                    ami_json_page.print_header_footer_lists(footer_span_list, header_span_list)
+                XmlLib.write_xml(html_page, Path(output_page_dir, f"page_{serial}.html"))
+            except Exception as e:
+                logging.error(f"cannot convert page {serial}, skipped: {e}")
+                failed.append(serial)
+        return failed
 
     # AmiPDFPlumber
 
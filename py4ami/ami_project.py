@@ -7,6 +7,7 @@ import textwrap
 import time
 import traceback
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 import requests
@@ -279,7 +280,8 @@ class CProject(CContainer):
                                                       keep=True,
                                                       max_ctree_len=50,
                                                       max_flag=20,
-                                                      skip_exists=True):
+                                                      skip_exists=True,
+                                                      workers=1):
         CProject.download_hrefs_in_url(weburl=weburl, target_dir=target_dir, suffixes=suffix,
                                                   maxsave=maxsave, sleep=sleep,
                                                   skip_exists=skip_exists)
@@ -288,7 +290,7 @@ class CProject(CContainer):
 
         cproject.make_cproject_from_pdfs(keep=keep, max_ctree_len=max_ctree_len, max_flag=max_flag)
 
-        cproject.pdf2html_in_ctrees()
+        cproject.pdf2html_in_ctrees(workers=workers)
 
     def make_cproject_from_pdfs(self, keep=True, files=None, max_ctree_len=24, max_flag=50):
         """makes directory for each PDF with safe names
@@ -385,11 +387,15 @@ class CProject(CContainer):
         cls.logger.warning(f"failed CTree {f}")
         return False
 
-    def pdf2html_in_ctrees(self, maxtree=9999, maxpage=9999):
+    def pdf2html_in_ctrees(self, maxtree=9999, maxpage=9999, workers=1):
         """converts PDF to HTML
         Iterates over CTrees
         NOTE: based on IPCC reports. Needs generalising
         USER facing
+        :param maxtree: maximum number of CTrees
+        :param maxpage: maximum pages per PDF
+        :param workers: if > 1 convert whole PDFs in a pool of worker processes
+        :return: list of CTree directories whose conversion failed
         """
         """ does the same as:
         python3 -m py4ami.ami_pdf --inpath ../pt195/PMC6747965/fulltext.pdf --outdir ../pt195/PMC6747965/out/ 
@@ -397,18 +403,46 @@ class CProject(CContainer):
         Iterates over CTrees
         """
 
+        ctree_dirs = []
         for i, ctree in enumerate(self.get_ctrees()):
             if i > maxtree:
                 print(f"maximum number of CTress {i}")
                 break
-            pdf_args = PDFArgs()
-            fmt = "HTML"
-            outpath, out_html = pdf_args.convert_write(
-                outdir=(Path(ctree.dirx, "html")),
-                outstem="fulltext",
-                inpath=f"{Path(ctree.dirx, 'fulltext.pdf')}",
-                flow=True,
-                maxpage=maxpage)
+            ctree_dirs.append(ctree.dirx)
+        failed = []
+        if workers and workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                future_to_dir = {executor.submit(CProject.pdf2html_in_ctree, ctree_dir, maxpage): ctree_dir
+                                 for ctree_dir in ctree_dirs}
+                for future in as_completed(future_to_dir):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        self.logger.error(f"cannot convert PDF in {future_to_dir[future]}: {e}")
+                        failed.append(future_to_dir[future])
+        else:
+            for ctree_dir in ctree_dirs:
+                try:
+                    CProject.pdf2html_in_ctree(ctree_dir, maxpage)
+                except Exception as e:
+                    self.logger.error(f"cannot convert PDF in {ctree_dir}: {e}")
+                    failed.append(ctree_dir)
+        return failed
+
+    @classmethod
+    def pdf2html_in_ctree(cls, ctree_dir, maxpage=9999):
+        """converts fulltext.pdf in ctree_dir to html/fulltext.html (also the worker for pdf2html_in_ctrees())
+        :param ctree_dir: CTree directory
+        :param maxpage: maximum pages to convert
+        :return: (outpath, out_html) from PDFArgs.convert_write()
+        """
+        pdf_args = PDFArgs()
+        return pdf_args.convert_write(
+            outdir=(Path(ctree_dir, "html")),
+            outstem="fulltext",
+            inpath=f"{Path(ctree_dir, 'fulltext.pdf')}",
+            flow=True,
+            maxpage=maxpage)
 
 
 class CTree(CContainer):
@@ -600,7 +634,9 @@ class ProjectArgs(AbstractArgs):
     MAKE = "make"
     MAXLEN = "max_len"
     MAXFLAG = "max_flag"
+    PDF2HTML = "pdf2html"
     PROJECT = "project"
+    WORKERS = "workers"
 
     def __init__(self):
         """arg_dict is set to default"""
@@ -638,6 +674,10 @@ class ProjectArgs(AbstractArgs):
 
         self.parser.add_argument(f"--{ProjectArgs.MAXFLAG}", type=int, nargs=1, default=20,
                                  help="max number of disambiguation flags '_")
+        self.parser.add_argument(f"--{ProjectArgs.PDF2HTML}", action='store_true',
+                                 help="convert fulltext.pdf in each CTree to html/")
+        self.parser.add_argument(f"--{ProjectArgs.WORKERS}", type=int, default=1,
+                                 help="number of processes for --pdf2html (one CTree per task)")
         return self.parser
 
     # class ProjectArgs:
@@ -655,6 +695,8 @@ class ProjectArgs(AbstractArgs):
             maxflag = self.arg_dict.get(ProjectArgs.MAXFLAG)
             keep = self.arg_dict.get(ProjectArgs.KEEP)
             files = self.arg_dict.get(ProjectArgs.FILE)
+            pdf2html = self.arg_dict.get(ProjectArgs.PDF2HTML)
+            workers = self.arg_dict.get(ProjectArgs.WORKERS)
 
             if not project_name:
                 raise ValueError("no --project given")
@@ -664,6 +706,10 @@ class ProjectArgs(AbstractArgs):
             project = CProject(project_name)
             if make_project:
                 project.make_cproject_from_pdfs(files=files, max_ctree_len=maxlen, max_flag=maxflag, keep=keep)
+            if pdf2html:
+                failed = project.pdf2html_in_ctrees(workers=workers if workers else 1)
+                if failed:
+                    logging.warning(f"PDF not converted in {failed}")
 
     # class ProjectArgs:
 
@@ -674,6 +720,7 @@ class ProjectArgs(AbstractArgs):
         arg_dict[ProjectArgs.FORMATS] = ['PDF']
         arg_dict[ProjectArgs.MAXLEN] = 40
         arg_dict[ProjectArgs.MAXFLAG] = 20
+        arg_dict[ProjectArgs.WORKERS] = 1
         return arg_dict
 
     @property
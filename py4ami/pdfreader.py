@@ -1,5 +1,6 @@
 import io
 import logging
+from enum import Enum
 from pathlib import Path
 
 from pdfminer3.converter import TextConverter
@@ -218,3 +219,20 @@ if __name__ == "__main__":
 #     imageWriter = ImageWriter('pathToSaveImages/..')
 #     converter = TextConverter(pdf_resource_manager, converted_text, codec='utf-8', laparams=layout_params,
 #                               imagewriter=imageWriter)
+
+
+class Converter(Enum):
+
+    def __init__(self, converter_class, intype, outtype, indir=".", outdir="."):
+        self.intype = intype
+        self.indir = indir
+        self.outtype = outtype
+        self.outdir = outdir
+
+    PDF2SVG = (Pdf2SvgConverter, "pdf", "svg", ".", "svg")
+    # PDF2TXT = (PdfReader, Filetype.F_PDF, Filetype.F_TXT, ".", ".")
+    XML2HTML = (Xml2HtmlConverter, "pdf", "html", ".", ".")
+    XML2TXT = (Xml2TxtConverter, "xml", "txt", ".", ".")
+    SVG2PAGE = (Svg2PageConverter, "svg", "html", "svg", "page")
+    PAGE2SECT = (Page2SectConverter, "html", "html", "page", "sect")
+    # TXT2SENT = (Txt2SentSplitter, Filetype.F_TXT, Filetype.F_TXT, ".", "sent")
@@ -1,4 +1,5 @@
 import ast
+import importlib
 import logging
 import sys
 import os
@@ -14,21 +15,11 @@ import argparse
 from enum import Enum
 from abc import ABC, abstractmethod
 # local
-from py4ami.ami_dict import AmiDictionary, AmiDictArgs
-from py4ami.ami_convert import ConvType, Converters
-from py4ami.ami_sections import AMIAbsSection
-from py4ami.ami_gui import GUIArgs
-from py4ami.ami_html import HTMLArgs
-from py4ami.examples import Examples
+# subcommand modules (ami_dict, ami_html, ami_pdf, ami_project, ami_gui ...) pull in large libraries
+# (pandas, sklearn, matplotlib, tkinter, pdfminer, nltk) and are imported only when used
 from py4ami.file_lib import FileLib
-from py4ami.pdfreader import Svg2PageConverter, Page2SectConverter, Xml2HtmlConverter, Xml2TxtConverter, Pdf2SvgConverter
-from py4ami.ami_pdf import PDFArgs
-from py4ami.ami_project import CProject, CTree, CSubDir, ProjectArgs
 from py4ami.symbol import SymbolIni
-from py4ami.text_lib import TextUtil, DSLParser
-from py4ami.util import AmiLogger, Util
-from py4ami.wikimedia import WikidataLookup
-from py4ami.xml_lib import XmlLib
+from py4ami.util import AmiLogger, Util, ImportProfiler
 
 class SubParser(Enum):
     DICT = "DICT"
@@ -93,6 +84,17 @@ class PyAMI:
     HTML_PARSER = "HTML"
     PDF_PARSER = "PDF"
     PROJECT_PARSER = "PROJECT"
+    GUI_PARSER = "GUI"
+
+    # subcommand => (module, AbstractArgs subclass, help); the module is imported only for the subcommand run
+    SUBCOMMANDS = {
+        DICT_PARSER: ("py4ami.ami_dict", "AmiDictArgs", "create/edit/search dictionaries"),
+        GUI_PARSER: ("py4ami.ami_gui", "GUIArgs", "run tkinter GUI (prototype)"),
+        HTML_PARSER: ("py4ami.ami_html", "HTMLArgs", "create/edit HTML"),
+        PDF_PARSER: ("py4ami.ami_pdf", "PDFArgs", "convert PDF into HTML and images"),
+        PROJECT_PARSER: ("py4ami.ami_project", "ProjectArgs", "create and transform a corpus of documents"),
+    }
+    IMPORT_PROFILE = "--import-profile"
 
     logger = logging.getLogger("pyami")
     symbol_ini = None
@@ -123,7 +125,6 @@ class PyAMI:
         self.wikipedia_lookup = None
         self.hit_counter = None
         self.symbol_ini = SymbolIni(self)
-        self.set_funcs()
         self.show_symbols = False
         self.ami_dictionary = None
         self.proj = None  # current project in searches
@@ -148,8 +149,10 @@ class PyAMI:
         }
 
     def set_funcs(self):
-        """initializes func_dict
+        """initializes func_dict (on first use, as the converters import pdfminer)
         """
+        from py4ami.pdfreader import Svg2PageConverter, Xml2HtmlConverter, Pdf2SvgConverter
+        from py4ami.xml_lib import XmlLib
         # 1:1 methods
         # tuple of func+file_extnsion
         self.func_dict[self.XML2TXT] = (XmlLib.remove_all_tags, ".xml.txt")
@@ -160,8 +163,30 @@ class PyAMI:
         # self.func_dict[self.TXT2SENT] = (TextUtil.split_into_sentences, ".sen.txt")
         # 1:n methods
 
-    def create_arg_parser(self):
+    @classmethod
+    def get_subcommand(cls, arglist):
+        """
+        :param arglist: commandline as list of strings
+        :return: first arg that is a subcommand (key of SUBCOMMANDS) or None
+        """
+        return next((arg for arg in arglist if arg in cls.SUBCOMMANDS), None) if arglist else None
+
+    @classmethod
+    def create_abstract_args(cls, subcommand):
+        """imports the module for subcommand and creates its AbstractArgs
+        :param subcommand: key of SUBCOMMANDS
+        :return: AbstractArgs subclass instance (AmiDictArgs, HTMLArgs ...) or None if subcommand is None
+        """
+        if not subcommand:
+            return None
+        module_name, class_name, _ = cls.SUBCOMMANDS[subcommand]
+        return getattr(importlib.import_module(module_name), class_name)()
+
+    def create_arg_parser(self, subcommand=None):
         """creates adds the arguments for pyami commandline
+
+        :param subcommand: only this subcommand gets its full subparser (and has its module imported);
+            the others are listed with their help but have no arguments
         """
 
         def run_dict(self):
@@ -180,11 +205,10 @@ class PyAMI:
             description=f'py4ami: V{version} call with ONE of subcommands (DICT,GUI,HTML,PDF,PROJECT), e.g. py4ami PDF --help'
         )
 
-        # apply_choices = [self.PDF2TXT, self.PDF2SVG, self.SVG2XML, self.TXT2SENT, self.XML2HTML, self.XML2TXT]
-        apply_choices = ConvType.list_values()
-        self.logger.debug(f"ch {apply_choices}")
         parser.add_argument('-v', '--version', action="store_true",
                             help=f"show version {version}")
+        parser.add_argument(self.IMPORT_PROFILE, action="store_true",
+                            help="report time taken to import each module (may be given anywhere on the commandline)")
         parser.formatter_class = argparse.RawDescriptionHelpFormatter
         parser.description = textwrap.dedent(
             'Py4AMI: create, manipulate, use CProject \n'
@@ -277,11 +301,11 @@ class PyAMI:
 
         subparsers = parser.add_subparsers(help='subcommands', dest="command")
 
-        dict_parser = AmiDictArgs().make_sub_parser(subparsers)
-        gui_parser = GUIArgs().make_sub_parser(subparsers)
-        html_parser = HTMLArgs().make_sub_parser(subparsers)
-        pdf_parser = PDFArgs().make_sub_parser(subparsers)
-        project_parser = ProjectArgs().make_sub_parser(subparsers)
+        for name, (_, _, subcommand_help) in self.SUBCOMMANDS.items():
+            if name == subcommand:
+                self.create_abstract_args(name).make_sub_parser(subparsers)
+            else:
+                subparsers.add_parser(name, help=subcommand_help)
 
         parser.epilog = "other entry points run as 'python -m py4ami.ami_dict args' also ami_pdf, ami_project"
         parser.epilog = """run:
@@ -356,7 +380,22 @@ class PyAMI:
         if not arglist:
             self.logger.warning("No args, running --help")
             arglist = ["--help"]
-        parser = self.create_arg_parser()
+        import_profiler = None
+        if self.IMPORT_PROFILE in arglist:
+            arglist = [arg for arg in arglist if arg != self.IMPORT_PROFILE]
+            import_profiler = ImportProfiler.start()
+        try:
+            self.parse_and_run_subcommand(arglist)
+        finally:
+            if import_profiler is not None:
+                import_profiler.stop()
+                import_profiler.print_report()
+
+    def parse_and_run_subcommand(self, arglist):
+        """creates parser for the subcommand in arglist, then substitutes and runs args
+        :param arglist: commandline as list of strings
+        """
+        parser = self.create_arg_parser(subcommand=self.get_subcommand(arglist))
         self.args = self.make_substitutions_create_arg_tuples(arglist, parser)
         self.logger.debug("ARGS before substitution: " + str(self.args))
         # this may be redundant
@@ -401,7 +440,6 @@ class PyAMI:
          """
         # print(f"RUN ARGUMENTS on {self} {self.args}")
         # path workflow
-        self.wikipedia_lookup = WikidataLookup()
         self.logger.debug(f"commandline args {self.args}")
         subparser_type = self.args.get("command")
         logging.debug(f" COMMAND: {subparser_type} {self.args}")
@@ -411,19 +449,7 @@ class PyAMI:
         #     print(f"FUNC {f_func}")
         #     aa = f_func()
         #     print(f"aa {aa}")
-        # messy - we need to use polymorphism
-        if not subparser_type:
-            abstract_args = None
-        elif subparser_type == "DICT":
-            abstract_args = AmiDictArgs()
-        elif subparser_type == "GUI":
-            abstract_args = GUIArgs()
-        elif subparser_type == "HTML":
-            abstract_args = HTMLArgs()
-        elif subparser_type == "PDF":
-            abstract_args = PDFArgs()
-        elif subparser_type == "PROJECT":
-            abstract_args = ProjectArgs()
+        abstract_args = self.create_abstract_args(subparser_type)
 
         if abstract_args:
             abstract_args.parse_and_process1(self.args)
@@ -431,7 +457,9 @@ class PyAMI:
             self.run_core_mathods()
 
     def run_core_mathods(self):
+        from py4ami.wikimedia import WikidataLookup
         logging.debug(f"run_core")
+        self.wikipedia_lookup = WikidataLookup()
         # mainly obsolete
         if self.VERSION in self.args and self.args[self.VERSION] is not None:
             self.print_version()
@@ -443,6 +471,7 @@ class PyAMI:
             example_args = self.args[self.EXAMPLES]
             if example_args is not None:
                 self.logger.debug(f" examples args: {example_args}")
+                from py4ami.examples import Examples
                 Examples(self).run_examples(example_args)
         if self.COPY in self.args and not self.args[self.COPY] is None:
             self.logger.warning(f"COPY {self.args[self.COPY]}")
@@ -623,6 +652,8 @@ class PyAMI:
 
     def run_proj(self):
         """ project-related commands"""
+        from py4ami.ami_convert import Converters
+        from py4ami.ami_project import CProject
         self.proj = self.args[self.PROJ]
         if not self.proj:
             self.logger.error(f"--proj must be given")
@@ -765,6 +796,7 @@ class PyAMI:
 
     def split(self, typex):
         """ split fulltext.xml into sections"""
+        from py4ami.ami_sections import AMIAbsSection
 
         # file_keys = self.content_store.get_file_keys()
         file_keys = self.content_store.keys()
@@ -783,12 +815,14 @@ class PyAMI:
 
     @classmethod
     def make_xml_sections(cls, file):
+        from py4ami.xml_lib import XmlLib
         xml_libx = XmlLib()
         xml_libx.logger.setLevel(logging.DEBUG)
         xml_libx.read(file)
         xml_libx.make_sections("sections", )
 
     def make_text_sections(self, file):
+        from py4ami.text_lib import TextUtil
         sections = []
         with open(file, "r", encoding="utf-8") as f:
             text = f.read()
@@ -801,7 +835,9 @@ class PyAMI:
         self.read_file_content()
         if apply_type:
             self.logger.info(f"apply {apply_type}")
-            func_tuple = self.func_dict[apply_type]
+            if not self.func_dict:
+                self.set_funcs()
+            func_tuple = self.func_dict.get(apply_type)
             if func_tuple is None:
                 self.logger.error(f"Cannot find func for {apply_type}")
             else:
@@ -922,8 +958,9 @@ class PyAMI:
         dictionary_file = self.get_symbol(name)
         if dictionary_file is None:
             dictionary_file = name
-        self.ami_dictionary = AmiDictionary.read_dictionary(
-            file=dictionary_file)
+        # cached; filter_file() applies the same dictionary to every file
+        from py4ami.ami_dict import AmiDictionaryRegistry
+        self.ami_dictionary = AmiDictionaryRegistry.get_dictionary(dictionary_file)
         new_hits = []
         if self.ami_dictionary is not None:
             for hit in hits:
@@ -940,6 +977,7 @@ class PyAMI:
         return [hit for hit in hits if re.match(regex, hit)]
 
     def add_ctree_filenames_to_content_store(self, apply_type):
+        from py4ami.ami_project import CTree, CSubDir
         # files = []
         ctree_list = self.cproject.get_ctrees()
         # TODO add this functionality to enums
@@ -1158,6 +1196,7 @@ class PyAMI:
         """ """
         assertions = self.args.get(self.ASSERT)
         if assertions is not None:
+            from py4ami.text_lib import DSLParser
             self.parser = DSLParser()
             if isinstance(assertions, str):
                 assertions = [assertions]
@@ -1227,21 +1266,12 @@ class ContentStore:
         return self.file_dict.get(file)
 
 
-class Converter(Enum):
-
-    def __init__(self, converter_class, intype, outtype, indir=".", outdir="."):
-        self.intype = intype
-        self.indir = indir
-        self.outtype = outtype
-        self.outdir = outdir
-
-    PDF2SVG = (Pdf2SvgConverter, "pdf", "svg", ".", "svg")
-    # PDF2TXT = (PdfReader, Filetype.F_PDF, Filetype.F_TXT, ".", ".")
-    XML2HTML = (Xml2HtmlConverter, "pdf", "html", ".", ".")
-    XML2TXT = (Xml2TxtConverter, "xml", "txt", ".", ".")
-    SVG2PAGE = (Svg2PageConverter, "svg", "html", "svg", "page")
-    PAGE2SECT = (Page2SectConverter, "html", "html", "page", "sect")
-    # TXT2SENT = (Txt2SentSplitter, Filetype.F_TXT, Filetype.F_TXT, ".", "sent")
+def __getattr__(name):
+    # Converter (an Enum of the pdfreader converters) has moved to pdfreader so pdfminer is not imported with pyamix
+    if name == "Converter":
+        from py4ami.pdfreader import Converter
+        return Converter
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def main():
@@ -1266,6 +1296,7 @@ def main():
     if run_tests:
         pyamix.run_tests()
     if run_dsl:
+        from py4ami.text_lib import DSLParser
         DSLParser.run_tests(sys.argv[1:])
 
 
@@ -2,26 +2,24 @@
 import logging
 
 from collections import Counter
+import copy
+import hashlib
 import re
 import json
 import glob
 import os
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-from nltk.tokenize import sent_tokenize
 from lxml import etree as LXET
 import sys
 # import RAKE  # python RAKE
-import tkinter as tk
 # from rake_nltk import Rake
 import cProfile
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 # from py4ami.ami_demos import AmiDemos
-from py4ami.gutil import Gutil, ScrollingCheckboxList
 
-from py4ami.ami_dict import AmiDictionaries
+from py4ami.ami_dict import AmiDictionaries, AmiDictionaryRegistry
 from py4ami.ami_project import AmiProjects
 from py4ami.file_lib import AmiPath, PROJ, FileLib
 from py4ami.text_lib import AmiSection
@@ -40,9 +38,89 @@ NS_LITERAL = "SPQ:literal"
 SMART_STOP_LIST = "SmartStoplist.txt"
 
 
+class AmiSearchResultsStore:
+    """per-section search results persisted in <project>/results/<section_type>/search_results.json
+
+    a result is reused only if the section file has the same size and mtime and the search
+    (dictionaries, patterns, options) has the same key_hash; otherwise it is recomputed.
+    Entries for files not seen in the current run are dropped on save()
+    """
+    FILENAME = "search_results.json"
+    FILES = "files"
+    KEY_HASH = "key_hash"
+    MTIME = "mtime_ns"
+    RESULT = "result"
+    SIZE = "size"
+
+    def __init__(self, path, key_hash):
+        """
+        :param path: JSON file (need not exist)
+        :param key_hash: hash of dictionaries, patterns and options; stored results with a different hash are ignored
+        """
+        self.path = Path(path)
+        self.key_hash = key_hash
+        self.entry_by_file = {}
+        self.seen_files = set()
+        self.hits = 0
+        self.misses = 0
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    store = json.load(f)
+                if store.get(AmiSearchResultsStore.KEY_HASH) == key_hash:
+                    self.entry_by_file = store.get(AmiSearchResultsStore.FILES, {})
+            except Exception as e:
+                logging.warning(f"cannot read results store {self.path}, ignored: {e}")
+
+    @classmethod
+    def create_for_project(cls, project_dir, section_type, key_hash):
+        return AmiSearchResultsStore(
+            Path(project_dir, RESULTS, section_type.lower(), AmiSearchResultsStore.FILENAME), key_hash)
+
+    def get(self, file):
+        """
+        :param file: section file
+        :return: stored result if file is unchanged, else None
+        """
+        self.seen_files.add(str(file))
+        entry = self.entry_by_file.get(str(file))
+        stat = os.stat(file)
+        if entry is None or entry[AmiSearchResultsStore.SIZE] != stat.st_size or \
+                entry[AmiSearchResultsStore.MTIME] != stat.st_mtime_ns:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[AmiSearchResultsStore.RESULT]
+
+    def put(self, file, result):
+        """stores JSON-serializable result for file with its current size and mtime"""
+        self.seen_files.add(str(file))
+        stat = os.stat(file)
+        self.entry_by_file[str(file)] = {
+            AmiSearchResultsStore.SIZE: stat.st_size,
+            AmiSearchResultsStore.MTIME: stat.st_mtime_ns,
+            AmiSearchResultsStore.RESULT: result,
+        }
+
+    def save(self):
+        """writes results for files seen in this run"""
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        files = {file: entry for file, entry in self.entry_by_file.items() if file in self.seen_files}
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({AmiSearchResultsStore.KEY_HASH: self.key_hash, AmiSearchResultsStore.FILES: files}, f)
+        os.replace(tmp_path, self.path)
+        logging.info(f"results store {self.path}: {self.hits} reused, {self.misses} recomputed")
+
+
 class AmiSearch:
+    # languages in which hits are labelled from the dictionary's synonyms
+    LABEL_LANGS = ['hi', 'ta', 'ur', 'fr', 'de']
 
-    def __init__(self):
+    def __init__(self, load_dictionaries=True):
+        """
+        :param load_dictionaries: if False do not read the AmiDictionaries collection (e.g. in worker processes)
+        """
         # these are the main facets
         self.dictionaries = []
         self.patterns = []
@@ -52,6 +130,11 @@ class AmiSearch:
         self.rake = None
         self.checked_values = []
         self.data_table = None
+        # if True reuse unchanged per-section results from <project>/results/ (see AmiSearchResultsStore)
+        self.incremental = False
+        self.results_store = None
+        # if > 1 search sections in a pool of worker processes, one chunk per CTree
+        self.workers = 1
 
 
 # working global variables
@@ -83,14 +166,24 @@ class AmiSearch:
         self.max_files = 10000
         self.min_hits = 2
         self.require_wikidata = False
+        # also match synonyms (any language) and count them as their entry's term
+        self.use_synonyms = False
+        # if > 0 also match words within this edit distance of a term (OCR/PDF variants; AmiFuzzyTermIndex)
+        self.max_edit_distance = 0
 
         # look up how sections work
-        self.ami_dictionaries = AmiDictionaries()
+        self.ami_dictionaries = AmiDictionaries() if load_dictionaries else None
         self.ami_gui = None
         self.filter = True
         self.results_by_section = {}
+        # edit distance of approximate hits by section, dictionary and term (only if max_edit_distance > 0)
+        self.distance_by_hit_by_section = {}
+        self.distance_by_hit_by_dict = {}
 
     def make_plot(self, counter, dict_name):
+        # matplotlib is only needed for plotting, so not imported with the module
+        import matplotlib as mpl
+        import matplotlib.pyplot as plt
         mpl.rcParams['font.family'] = 'Helvetica'
         commonest = counter.most_common()
         keys = [c[0] for c in commonest]
@@ -112,10 +205,17 @@ class AmiSearch:
             # print dictionaries
             print("\n==========AMI DICTIONARIES========")
 #            print("amidict keys: ", self.dict_)
+            print(f"dictionary cache: {AmiDictionaryRegistry.get_stats()}")
             print("==================================\n")
 
     def add_dictionary(self, name):
+        """adds dictionary by name (see AmiDictionaries) or by path of XML file (cached by AmiDictionaryRegistry)"""
         print("dict_name:", name)
+        dictionary_dict = self.ami_dictionaries.dictionary_dict
+        if name not in dictionary_dict and Path(name).is_file():
+            dictionary = AmiDictionaryRegistry.get_dictionary(name)
+            if dictionary is not None:
+                dictionary_dict[name] = dictionary
         AmiSearch._append_facet(
             "dictionary", name, self.ami_dictionaries.dictionary_dict, self.dictionaries)
 
@@ -169,6 +269,8 @@ class AmiSearch:
         total_hits = 0
         self.list_hits(hits_by_dict, section)
         self.results_by_section[section.name] = hits_by_dict
+        if self.distance_by_hit_by_dict:
+            self.distance_by_hit_by_section[section.name] = self.distance_by_hit_by_dict
         matches_by_amidict_multiple, hits_by_mwdict = self.match_multiple_words_against_dictionaries(
             section.text)
         self.list_hits(hits_by_mwdict, section)
@@ -197,12 +299,25 @@ class AmiSearch:
             self.results_by_section[section_name][dict_name] += hits
 
     def match_single_words_against_dictionaries(self, words):
-        """matches the set of words in a section against set of terms in a dictionary"""
+        """matches the set of words in a section against set of terms in a dictionary
+        if self.max_edit_distance > 0 matching is approximate and the smallest distance of each hit
+        is kept in self.distance_by_hit_by_dict
+        """
         found = False
         matches_by_amidict = {}
         hits_by_dict = {}
+        self.distance_by_hit_by_dict = {}
         for dictionary in self.dictionaries:
-            hits = dictionary.match(words)
+            if self.max_edit_distance > 0:
+                approximate_hits = dictionary.match_approximate(
+                    words, max_distance=self.max_edit_distance, synonyms=self.use_synonyms)
+                hits = [term for _, term, _ in approximate_hits]
+                distance_by_hit = {}
+                for _, term, distance in approximate_hits:
+                    distance_by_hit[term] = min(distance, distance_by_hit.get(term, distance))
+                self.distance_by_hit_by_dict[dictionary.name] = distance_by_hit
+            else:
+                hits = dictionary.match(words, synonyms=self.use_synonyms)
             #            print("hits", len(hits))
             wid_hits = None
             if dictionary.entry_by_term is not None:
@@ -215,6 +330,7 @@ class AmiSearch:
         # really crude - we concatenate words into a giant string with
         matches_by_multiple = {}
         found = False
+        from nltk.tokenize import sent_tokenize
         tokenized_sents = sent_tokenize(text)
 #        print("token sents", tokenized_sents)
         hits_by_dict = {}
@@ -227,18 +343,22 @@ class AmiSearch:
         return matches_by_multiple, hits_by_dict
 
     def annotate_hits_with_wikidata(self, dictionary, hits):
+        """labels hits (terms or synonyms) in self.wikidata_label_lang using the dictionary's AmiTermIndex
+        :param dictionary: AmiDictionary that gave the hits
+        :param hits: matched terms
+        :return: labels (the hit itself if the entry has no label in that language)
+        """
         wid_hits = []
+        term_index = dictionary.get_or_create_term_index()
         for hit in hits:
-            if hit in dictionary.entry_by_term:
-                entry = dictionary.entry_by_term[hit]
-                if self.require_wikidata and WIKIDATA_ID not in entry.attrib:
+            key = term_index.get_entry_key(hit)
+            if key is not None:
+                if self.require_wikidata and term_index.get_wikidata_id(key) is None:
                     print("no wikidataID for ", hit, "in", dictionary.name)
                     continue
-#                wikidata_id = entry.attrib[WIKIDATA_ID]
                 label = hit
-                if self.wikidata_label_lang in ['hi', 'ta', 'ur', 'fr', 'de']:
-                    #                            self.xpath_search(entry)  # doesn't work
-                    lang_label = self.search_by_xml_lang(entry)
+                if self.wikidata_label_lang in self.LABEL_LANGS:
+                    lang_label = term_index.get_label(key, self.wikidata_label_lang)
                     if lang_label is not None:
                         label = lang_label
                 wid_hits.append(label)
@@ -289,12 +409,26 @@ class AmiSearch:
 
         all_lower_words = []
         sections = []
-        for index, target_file in enumerate(section_files[:self.max_files]):
+        section_files = section_files[:self.max_files]
+        records = None
+        if self.workers and self.workers > 1:
+            records = self.create_section_records_in_parallel(section_files)
+        for index, target_file in enumerate(section_files):
             if index % self.debug_cnt == 0:
                 # eg <project_dir> /oil26/PMC5203915/sections/0_front/1_article-meta/19_abstract.xml
                 print("collect words in path", target_file)
-            matches_by_amidict, matches_by_pattern, section = self.search_and_generate_section(
-                target_file)
+            if records is not None and records[index] is not None:
+                matches_by_amidict, matches_by_pattern, section = self.apply_section_record(records[index])
+            else:
+                if records is not None:
+                    # worker failed; search here so that errors surface and no section is lost
+                    logging.warning(f"no result from search workers for {target_file}; searching sequentially")
+                if self.results_store is not None:
+                    matches_by_amidict, matches_by_pattern, section = \
+                        self.search_and_generate_section_incrementally(target_file)
+                else:
+                    matches_by_amidict, matches_by_pattern, section = self.search_and_generate_section(
+                        target_file)
             sections.append(section)
             all_lower_words += [w.lower() for w in section.words]
             self.add_matches_to_counter_dict(
@@ -306,6 +440,162 @@ class AmiSearch:
 
         return dictionary_counter_dict, pattern_counter_dict, all_lower_words, sections
 
+    def search_and_generate_section_incrementally(self, file):
+        """as search_and_generate_section() but reuses the result in self.results_store if file is unchanged
+        sections created from stored results have name and words but no text
+        """
+        record = self.results_store.get(file)
+        if record is None:
+            record = self.create_section_record(file)
+            self.results_store.put(file, record)
+        return self.apply_section_record(record)
+
+    def create_section_record(self, file):
+        """searches file and returns the results as a compact JSON-serializable dict
+        (section name and words, matches by dictionary and pattern, results_by_section row)"""
+        matches_by_amidict, matches_by_pattern, section = self.search_and_generate_section(file)
+        return {
+            "name": section.name,
+            "words": section.words,
+            "matches_by_amidict": copy.deepcopy(matches_by_amidict),
+            "matches_by_pattern": matches_by_pattern,
+            "results_by_section": copy.deepcopy(self.results_by_section.get(section.name)),
+            "distance_by_hit_by_dict": copy.deepcopy(self.distance_by_hit_by_section.get(section.name)),
+        }
+
+    def apply_section_record(self, record):
+        """adds record (from create_section_record()) to self.results_by_section
+        :return: (matches_by_amidict, matches_by_pattern, section) as search_and_generate_section();
+            section has name and words but no text
+        """
+        section = AmiSection()
+        section.name = record["name"]
+        section.words = record["words"]
+        if record["results_by_section"] is not None:
+            self.results_by_section[section.name] = copy.deepcopy(record["results_by_section"])
+        if record.get("distance_by_hit_by_dict") is not None:
+            self.distance_by_hit_by_section[section.name] = copy.deepcopy(record["distance_by_hit_by_dict"])
+        self.matches_by_amidict = copy.deepcopy(record["matches_by_amidict"])
+        return self.matches_by_amidict, record["matches_by_pattern"], section
+
+    def create_section_records_in_parallel(self, section_files):
+        """
+        searches section_files in self.workers processes, one task per CTree
+        stored results (if self.results_store) are reused and new ones stored
+        :param section_files: files to search
+        :return: list of records (see create_section_record()) in order of section_files; None if search failed
+            or None (not a list) if dictionaries cannot be sent to workers
+        """
+        dictionary_files = [getattr(dictionary, "file", None) for dictionary in self.dictionaries]
+        if None in dictionary_files:
+            logging.warning("dictionaries not read from files cannot be used by workers; searching sequentially")
+            return None
+        records = [None] * len(section_files)
+        pending = []
+        for index, file in enumerate(section_files):
+            if self.results_store is not None:
+                records[index] = self.results_store.get(file)
+            if records[index] is None:
+                pending.append(index)
+        dictionary_names = [dictionary.name for dictionary in self.dictionaries]
+        options = (self.filter, self.wikidata_label_lang, self.require_wikidata, self.use_synonyms,
+                   self.max_edit_distance)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            future_to_indexes = dict()
+            for indexes in AmiSearch.group_indexes_by_ctree(section_files, pending):
+                future = executor.submit(AmiSearch.create_section_records_for_files,
+                                         [section_files[index] for index in indexes],
+                                         dictionary_files, dictionary_names, self.patterns, options)
+                future_to_indexes[future] = indexes
+            for future in as_completed(future_to_indexes):
+                indexes = future_to_indexes[future]
+                try:
+                    chunk_records = future.result()
+                except Exception as e:
+                    logging.error(f"search worker failed for {section_files[indexes[0]]} ...: {e}")
+                    continue
+                for index, record in zip(indexes, chunk_records):
+                    records[index] = record
+                    if record is not None and self.results_store is not None:
+                        self.results_store.put(section_files[index], record)
+        return records
+
+    @classmethod
+    def group_indexes_by_ctree(cls, section_files, indexes):
+        """groups indexes of section_files by CTree (the directory containing 'sections'), keeping order
+        :return: list of lists of indexes"""
+        indexes_by_ctree = dict()
+        for index in indexes:
+            parts = Path(section_files[index]).parts
+            ctree = parts[:parts.index("sections")] if "sections" in parts else parts[:-1]
+            indexes_by_ctree.setdefault(ctree, []).append(index)
+        return list(indexes_by_ctree.values())
+
+    @classmethod
+    def create_section_records_for_files(cls, files, dictionary_files, dictionary_names, patterns, options):
+        """
+        worker for create_section_records_in_parallel()
+        :param files: section files (normally from one CTree)
+        :param dictionary_files: XML dictionaries (read through AmiDictionaryRegistry, so once per process)
+        :param dictionary_names: names of the caller's dictionaries (keys of the results), in the same order
+        :param patterns: SearchPatterns
+        :param options: (filter, wikidata_label_lang, require_wikidata, use_synonyms, max_edit_distance)
+        :return: list of records, None for files that could not be searched
+        """
+        ami_search = AmiSearch(load_dictionaries=False)
+        # registry dictionaries are shared within the process and must not be renamed;
+        # the records are keyed by the caller's names instead
+        ami_search.dictionaries = [AmiDictionaryRegistry.get_dictionary(file) for file in dictionary_files]
+        name_by_worker_name = {dictionary.name: name
+                               for dictionary, name in zip(ami_search.dictionaries, dictionary_names)}
+        if len(name_by_worker_name) != len(dictionary_names):
+            logging.error(f"worker dictionary names are not unique: {[d.name for d in ami_search.dictionaries]}")
+            return [None] * len(files)
+        ami_search.patterns = patterns
+        (ami_search.filter, ami_search.wikidata_label_lang, ami_search.require_wikidata,
+         ami_search.use_synonyms, ami_search.max_edit_distance) = options
+        records = []
+        for file in files:
+            try:
+                record = ami_search.create_section_record(file)
+                records.append(cls.rename_dictionaries_in_record(record, name_by_worker_name))
+            except Exception as e:
+                logging.error(f"cannot search {file}: {e}")
+                records.append(None)
+        return records
+
+    @classmethod
+    def rename_dictionaries_in_record(cls, record, name_by_dictionary_name):
+        """
+        rekeys the per-dictionary results in record (from create_section_record())
+        :param record: record (modified)
+        :param name_by_dictionary_name: new name by dictionary name; other keys (e.g. patterns) are kept
+        :return: record
+        """
+        for key in ["matches_by_amidict", "results_by_section", "distance_by_hit_by_dict"]:
+            value_by_name = record.get(key)
+            if value_by_name is not None:
+                record[key] = {name_by_dictionary_name.get(name, name): value for name, value in value_by_name.items()}
+        return record
+
+    def create_search_key_hash(self):
+        """hash of everything except the section files that determines the search results:
+        dictionary contents, patterns and options"""
+        sha = hashlib.sha256()
+        for dictionary in self.dictionaries:
+            file = getattr(dictionary, "file", None)
+            if file is not None and os.path.exists(file):
+                with open(file, "rb") as f:
+                    sha.update(f.read())
+            else:
+                sha.update("\n".join(sorted(getattr(dictionary, "entry_by_term", None) or [])).encode("utf-8"))
+        for pattern in self.patterns:
+            regex = pattern.regex.pattern if pattern.regex is not None else ""
+            sha.update(f"{pattern.name}|{pattern.type}|{regex}".encode("utf-8"))
+        sha.update(f"{self.filter}|{self.wikidata_label_lang}|{self.require_wikidata}|{self.use_synonyms}"
+                   f"|{self.max_edit_distance}".encode("utf-8"))
+        return sha.hexdigest()
+
     def print_results_by_section(self):
         # ic("results by section", self.results_by_section)
         print("ROWS", len(self.results_by_section))
@@ -322,17 +612,22 @@ class AmiSearch:
             row = self.data_table.make_row()
             self.data_table.append_contained_text(row, H_TD, section)
 
+            distance_by_hit_by_dict = self.distance_by_hit_by_section.get(section, {})
             for dictionary in hits_by_dictionary:
                 self.add_hits_for_dictionary(
-                    dictionary, hits_by_dictionary, row)
+                    dictionary, hits_by_dictionary, row, distance_by_hit_by_dict.get(dictionary))
 
-    def add_hits_for_dictionary(self, dictionary, hits_by_dictionary, row):
+    def add_hits_for_dictionary(self, dictionary, hits_by_dictionary, row, distance_by_hit=None):
+        """
+        :param distance_by_hit: edit distances of approximate hits; hits with distance > 0 are shown as term~distance
+        """
         hit_list = hits_by_dictionary[dictionary]
         print(hit_list)
         hits = set(hit_list)
         text = ""
         for h in hits:
-            text += h + " | "
+            distance = distance_by_hit.get(h, 0) if distance_by_hit else 0
+            text += (h if distance == 0 else f"{h}~{distance}") + " | "
         self.data_table.append_contained_text(row, H_TD, text)
 
     def create_counter_dict(self, search_tools):
@@ -375,8 +670,14 @@ class AmiSearch:
             if len(self.section_types) > 0:
                 for section_type in self.section_types:
                     self.glob_for_section_files(proj, section_type)
+                    if self.incremental:
+                        self.results_store = AmiSearchResultsStore.create_for_project(
+                            proj.dirx, section_type, self.create_search_key_hash())
                     sections = self.section_make_data_table_counter_and_plot(
                         section_type)
+                    if self.results_store is not None:
+                        self.results_store.save()
+                        self.results_store = None
                     self.write_data_table(proj.dirx, section_type)
                     # if self.use_rake:
                     #     self.analyze_all_words_with_Rake(sections)
@@ -530,6 +831,8 @@ class AmiSearch:
         print("finished search")
 
     def run_search_from_gui(self, ami_gui):
+        import tkinter as tk
+        from py4ami.gutil import Gutil
         self.min_hits = 1
         self.max_bars = 25
         self.ami_gui = ami_gui
@@ -847,6 +1150,14 @@ def create_arg_parser():
                         help='languages (NYI)')
     parser.add_argument('--debug', nargs="+",
                         help='debugging commands , numbers, (not formalised)')
+    parser.add_argument('--incremental', action="store_true",
+                        help='reuse results for unchanged sections stored in <project>/results/')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes for searching sections (chunked by CTree)')
+    parser.add_argument('--synonyms', action="store_true",
+                        help='also match dictionary synonyms (any language), counted as their term')
+    parser.add_argument('--maxdistance', type=int, default=0,
+                        help='also match words within this edit distance of a term (OCR/PDF variants); 0 is exact')
     return parser
 
 
@@ -861,6 +1172,10 @@ def copy_args_to_ami_search(args, ami_search):#
         ami_search.max_bars = args.maxbars
     if args.languages:
         ami_search.languages = args.languages
+    ami_search.incremental = args.incremental
+    ami_search.workers = args.workers
+    ami_search.use_synonyms = args.synonyms
+    ami_search.max_edit_distance = args.maxdistance
     for k, v in vars(args).items():
         #        print("k, v", k, "=", v)
         pass
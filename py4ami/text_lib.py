@@ -1,10 +1,10 @@
 import ast
 from bs4 import BeautifulSoup
 from collections import Counter
+import functools
 import glob
 import json
 import logging
-import nltk
 import os
 from pathlib import Path
 import re
@@ -14,6 +14,7 @@ import lxml
 logging.debug("loading text_lib")
 
 from py4ami.file_lib import AmiPath, FileLib
+from py4ami.util import LazyClassAttribute
 
 NFKD = "NFKD"
 
@@ -45,7 +46,6 @@ PY_DIAG = "../../python/diagrams"
 CCT_PROJ = os.path.abspath(os.path.normpath(
     os.path.join(PY_DIAG, "satish/cct")))
 
-STOPWORDS_EN = nltk.corpus.stopwords.words("english")
 STOPWORDS_PUB = {
     'figure', 'permission', 'reproduced', 'copyright', 'authors', 'society', "university", 'table',
     "manuscript", "published", "declare", "conflict", "research", "diagram", "images", "version",
@@ -57,6 +57,22 @@ STOPWORDS_PUB = {
 }
 
 
+@functools.lru_cache(maxsize=None)
+def get_stopwords_en():
+    """NLTK English stopwords, read (and nltk imported) on first use rather than on import
+    :return: list of stopwords
+    """
+    import nltk
+    return nltk.corpus.stopwords.words("english")
+
+
+def __getattr__(name):
+    # STOPWORDS_EN used to be read at import time; keep it available as a module attribute
+    if name == "STOPWORDS_EN":
+        return get_stopwords_en()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 class ProjectCorpus:
     """manages an AMI CProject, not yet fully incorporated"""
 
@@ -148,6 +164,7 @@ class Document:
     # REFACTOR
     @staticmethod
     def get_words_from_file(terminal_file):
+        import nltk
         ami_section = AmiSection()
         ami_section.read_file_get_text_filtered_words(terminal_file)
         ami_section.sentences = [Sentence(s) for s in (
@@ -256,16 +273,18 @@ class AmiSection:
         logging.info(f"dict_keys: {dikt.keys()}")
         return dikt
 
+    def read_templates(file):
+        """reads the section templates as JSON"""
+        logging.debug("loading templates.json")
+        with open(file, 'r') as json_file:
+            return json.load(json_file)
+
     templates_json = Path(FileLib.get_pyami_resources(),
                           SECTION_TEMPLATES_JSON)
-    SECTION_LIST1 = read_section_dict(templates_json)
-    SECTION_LIST = SECTION_LIST1
-    logging.debug("text_lib: reading section_templates")
-    logging.debug("SECTION LIST", SECTION_LIST1)
-
-    logging.debug("loading templates.json")
-    with open(templates_json, 'r') as json_file:
-        TEMPLATES = json.load(json_file)
+    # read on first access, not when text_lib is imported
+    SECTION_LIST1 = LazyClassAttribute(functools.partial(read_section_dict, templates_json))
+    SECTION_LIST = LazyClassAttribute(functools.partial(read_section_dict, templates_json))
+    TEMPLATES = LazyClassAttribute(functools.partial(read_templates, templates_json))
 
     def __init__(self):
         self.words = []
@@ -341,11 +360,12 @@ class AmiSection:
                         self.logger.error("error reading: ", file, ex)
                         raise ex
                 self.text = self.flatten_xml_to_text(self.xml)
+                import nltk
                 self.sentences = [Sentence(s) for s in (
                     nltk.sent_tokenize(self.text))]
                 #                        self.sentences = Sentence.merge_false_sentence_breaks(self.sentences)
                 if self.write_text and not os.path.exists(self.txt_file):
-                    self.logger.warning("wrote sentence path", self.txt_file)
+                    self.logger.warning(f"wrote sentence path {self.txt_file}")
                     AmiSection.write_numbered_sentence_file(
                         self.txt_file, self.sentences)
             self.words = self.get_words_from_sentences()
@@ -434,6 +454,7 @@ class Sentence:
         """ may be quite slow compared to brute splitting at spaces
 
         returns: list of words"""
+        import nltk
         return nltk.word_tokenize(string)
 
     @staticmethod
@@ -546,7 +567,7 @@ class TextUtil:
     @staticmethod  # OBSOLETE
     def filter_words(words) -> list:
         words = [w for w in words if len(w) > 2]
-        words = [w for w in words if w.lower() not in STOPWORDS_EN]
+        words = [w for w in words if w.lower() not in get_stopwords_en()]
         words = [w for w in words if w.lower() not in STOPWORDS_PUB]
         words = [w for w in words if not w.isnumeric()]
         return words
@@ -574,6 +595,7 @@ class TextUtil:
         """
         sentences = []
         if text:
+            import nltk
             sentences = nltk.sent_tokenize(text)
             for sent in sentences[:10]:
                 cls.logger.debug(">>", sent)
@@ -646,12 +668,14 @@ class WordFilter:
     generally deletes words not satisfying a condition but this may develop
     """
 
-    def __init__(self, stopword_sets=[STOPWORDS_EN, STOPWORDS_PUB],
+    def __init__(self, stopword_sets=None,
                  min_length=2, delete_numeric=True, delete_non_alphanum=True):
 
         self.min_length = min_length
         self.use_lower_stopwords = True
         self.stop_words_set = {}
+        if stopword_sets is None:
+            stopword_sets = [get_stopwords_en(), STOPWORDS_PUB]
         for swset in stopword_sets:
             self.stop_words_set = self.stop_words_set.union(swset)
         #            set(STOPWORDS_EN).union(STOPWORDS_PUB)
@@ -707,6 +707,110 @@ class AmiLogger:
         self.count[level] += 1
 
 
+class ImportProfiler:
+    """times the imports made while it is installed on sys.meta_path
+
+    wraps exec_module of each module's loader, so nested imports give both cumulative
+    and self (excluding submodule imports) times, as `python -X importtime` does.
+
+        profiler = ImportProfiler.start()
+        import py4ami.ami_dict
+        profiler.stop()
+        profiler.print_report()
+    """
+
+    def __init__(self):
+        self.records = []  # (module, cumulative, self) in order of completion
+        self.child_times = []  # stack of accumulated child times
+        self.start_time = None
+        self.elapsed = None
+
+    @classmethod
+    def start(cls):
+        """creates profiler and installs it at the front of sys.meta_path
+        :return: ImportProfiler
+        """
+        profiler = ImportProfiler()
+        sys.meta_path.insert(0, profiler)
+        profiler.start_time = time.perf_counter()
+        return profiler
+
+    def stop(self):
+        """removes profiler from sys.meta_path (modules already imported keep their loaders)"""
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+            self.elapsed = time.perf_counter() - self.start_time
+
+    def find_spec(self, fullname, path, target=None):
+        """asks the remaining finders for the spec and wraps its loader"""
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            # builtin/frozen importers are shared classes; only wrap per-module loader instances
+            if spec.loader is not None and not isinstance(spec.loader, type) and hasattr(spec.loader, "exec_module"):
+                spec.loader.exec_module = self.create_timed_exec_module(fullname, spec.loader.exec_module)
+            return spec
+        return None
+
+    def create_timed_exec_module(self, fullname, exec_module):
+        def timed_exec_module(module):
+            self.child_times.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - start
+                child_time = self.child_times.pop()
+                if self.child_times:
+                    self.child_times[-1] += elapsed
+                self.records.append((fullname, elapsed, elapsed - child_time))
+        return timed_exec_module
+
+    def get_total_time(self):
+        """:return: sum of self times, i.e. time spent importing"""
+        return sum(record[2] for record in self.records)
+
+    def print_report(self, max_modules=30, file=None):
+        """prints modules sorted by cumulative import time
+        :param max_modules: number of modules to list
+        :param file: output stream (default sys.stdout)
+        """
+        file = sys.stdout if file is None else file
+        print(f"imported {len(self.records)} modules in {self.get_total_time():.3f} s", file=file)
+        print(f"{'cumulative ms':>14} {'self ms':>10}  module", file=file)
+        for name, cumulative, self_time in sorted(self.records, key=lambda record: -record[1])[:max_modules]:
+            print(f"{cumulative * 1000:14.1f} {self_time * 1000:10.1f}  {name}", file=file)
+
+
+class LazyClassAttribute:
+    """class attribute computed by a function on first access and then cached on the class
+
+    used for resources (files, corpora) that should not be read when the module is imported
+
+        class AmiSection:
+            TEMPLATES = LazyClassAttribute(read_templates)
+    """
+
+    def __init__(self, func):
+        """
+        :param func: function of no arguments returning the value
+        """
+        self.func = func
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        value = self.func()
+        # replaces this descriptor so later accesses are plain attribute lookups
+        setattr(owner, self.name, value)
+        return value
+
+
 # sub/Super
 
 class SScript(Enum):
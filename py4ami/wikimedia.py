@@ -1,7 +1,15 @@
+import bz2
+import gzip
+import hashlib
 import json
 import logging
 import os
+import sqlite3
+import threading
+import time
 from enum import Enum
+from pathlib import Path
+from urllib.parse import quote
 
 from lxml import etree as ET
 from lxml import etree, html
@@ -76,12 +84,20 @@ class WikidataPredicate:
 # TODO add docstrings and check return values
 class WikidataLookup:
 
-    def __init__(self, exact_lookup=False):
+    def __init__(self, exact_lookup=False, cache=None, index=None):
+        """
+        :param exact_lookup: obsolete?
+        :param cache: optional WikidataCache for search and entity pages
+        :param index: optional WikidataDumpIndex used instead of the web
+                      (default WikidataDumpIndex.get_default_index())
+        """
         self.term = None
         self.wikidata_dict = None
         self.root = None
         self.exact_lookup = exact_lookup
         self.hits_dict = dict()
+        self.cache = cache
+        self.index = index if index is not None else WikidataDumpIndex.get_default_index()
 
     def lookup_wikidata(self, term):
         """
@@ -93,16 +109,16 @@ class WikidataLookup:
         :return: triple (e.g. hit0_id, hit0_description, wikidata_hits)
         """
 
-        from urllib.parse import quote
-
         if not term:
             logging.warning("null term")
             return None, None, None
         self.term = term
         MAX_ENTRIES = 5
+        if self.index is not None:
+            return self.index.lookup_wikidata(term, max_entries=MAX_ENTRIES)
         url = WIKIDATA_QUERY_URI + quote(term.encode('utf8'))
         # print(f"url {url}")
-        self.root = ParserWrapper.parse_utf8_html_to_root(url)
+        self.root = ParserWrapper.parse_utf8_html_to_root(url, cache=self.cache)
         body = self.root.find(BODY)
         ul = body.find(".//ul[@class='" + MW_SEARCH_RESULTS + "']")
         hit0 = None  # to avoid UnboundLocalError
@@ -126,19 +142,28 @@ class WikidataLookup:
             hit0_description = hit0[1]["desc"]
             return hit0_id, hit0_description, wikidata_hits
 
-    def lookup_items(self, terms):
+    def lookup_items(self, terms, executor=None):
         """looks up a series of terms and returns a tuple of list(qitem), list(desc)
         NOTE requires Internet
-        :terms: strings to search for"""
+        :terms: strings to search for
+        :param executor: optional WikidataLookupExecutor to run lookups concurrently"""
 
         qitems = []
         descs = []
-        for term in terms:
-            qitem0, desc, wikidata_hits = self.lookup_wikidata(term)
+        if executor is not None:
+            results = executor.map(self.lookup_wikidata_independently, terms)
+        else:
+            results = [self.lookup_wikidata(term) for term in terms]
+        for result in results:
+            qitem0, desc, wikidata_hits = result if result else (None, None, None)
             qitems.append(qitem0)
             descs.append(desc)
         return qitems, descs
 
+    def lookup_wikidata_independently(self, term):
+        """lookup_wikidata(term) in a new WikidataLookup sharing this cache (safe in concurrent threads)"""
+        return WikidataLookup(exact_lookup=self.exact_lookup, cache=self.cache, index=self.index).lookup_wikidata(term)
+
     def create_dict_for_all_possible_wd_matches(self, ul):
         wikidata_dict = {}
         for li in ul:
@@ -173,18 +198,45 @@ class WikidataLookup:
             #                print(f" no hit for {name}")
             pass
         else:
-            hits = dict()
-            for qid in entry_hits[2]:
-                wpage = WikidataPage(qid)
-                description = wpage.get_description()
-                regex = Util.matches_regex_list(description, REGEX_BLACKLIST)
-                if regex:
-                    logging.debug(f"{regex} // {description}")
-                else:
-                    logging.debug(f"\n{wpage.get_title()}\n{description}")
-                    hits[qid] = wpage.get_title()
-            if hits:
-                self.hits_dict[name] = hits
+            page_by_qid = {qid: WikidataPage(qid, cache=self.cache, index=self.index) for qid in entry_hits[2]}
+            self.add_possible_wikidata_hits(name, entry_hits[2], page_by_qid)
+
+    def get_possible_wikidata_hits_for_names(self, names, executor):
+        """as get_possible_wikidata_hits() for many names, with concurrent requests
+        searches all names, then fetches all candidate pages, so each task makes one request
+        :param names: terms or names to search
+        :param executor: WikidataLookupExecutor
+        """
+        names = list(names)
+        entry_hits_list = executor.map(self.lookup_wikidata_independently, names)
+        qids = list(dict.fromkeys(
+            qid for entry_hits in entry_hits_list if entry_hits and entry_hits[0] for qid in entry_hits[2]))
+        pages = executor.map(lambda qid: WikidataPage(qid, cache=self.cache, index=self.index), qids)
+        page_by_qid = {qid: page for qid, page in zip(qids, pages) if page is not None}
+        for name, entry_hits in zip(names, entry_hits_list):
+            if entry_hits and entry_hits[0]:
+                self.add_possible_wikidata_hits(name, entry_hits[2], page_by_qid)
+
+    def add_possible_wikidata_hits(self, name, qids, page_by_qid):
+        """adds non-blacklisted hits (qid: title) for name to self.hits_dict
+        :param name: searched term
+        :param qids: candidate qids from search
+        :param page_by_qid: WikidataPages for (at least) qids; missing pages are skipped
+        """
+        hits = dict()
+        for qid in qids:
+            wpage = page_by_qid.get(qid)
+            if wpage is None:
+                continue
+            description = wpage.get_description()
+            regex = Util.matches_regex_list(description, REGEX_BLACKLIST)
+            if regex:
+                logging.debug(f"{regex} // {description}")
+            else:
+                logging.debug(f"\n{wpage.get_title()}\n{description}")
+                hits[qid] = wpage.get_title()
+        if hits:
+            self.hits_dict[name] = hits
 
 
 class WikidataBrowser:
@@ -341,13 +393,33 @@ def label_match(label, wikidata_label, method, ignorecase):
 class WikidataPage:
     PROPERTY_ID = "id"
 
-    def __init__(self, pqitem=None):
+    def __init__(self, pqitem=None, cache=None, index=None):
+        """
+        :param pqitem: Q or P item to fetch
+        :param cache: optional WikidataCache
+        :param index: optional WikidataDumpIndex; if it has pqitem the page is not fetched
+        """
         self.root = None
         self.pqitem = pqitem
         self.json = None
-        if pqitem:
+        self.cache = cache
+        self.index_entity = None  # entity dict from WikidataDumpIndex (or batched API, see create_from_entity)
+        if pqitem and index is not None:
+            self.index_entity = index.get_entity(pqitem)
+        if pqitem and self.index_entity is None:
             self.root = self.get_root_for_item(self.pqitem)
 
+    @classmethod
+    def create_from_entity(cls, entity):
+        """page from an entity dict as returned by WikidataDumpIndex.get_entity() (no request is made)
+        :param entity: entity dict (see WikidataDumpIndex.create_entity_dict_from_json for API JSON)
+        :return: WikidataPage
+        """
+        page = WikidataPage()
+        page.pqitem = entity[ID]
+        page.index_entity = entity
+        return page
+
     @classmethod
     def create_wikidata_ppage_from_file(cls, file):
         page = None
@@ -371,7 +443,7 @@ class WikidataPage:
         :return: parsed lxml root"""
         if self.root is None:
             url_for_pqitem = self.get_url_for_pqitem(pqitem)
-            self.root = ParserWrapper.parse_utf8_html_to_root(url_for_pqitem)
+            self.root = ParserWrapper.parse_utf8_html_to_root(url_for_pqitem, cache=self.cache)
         return self.root
 
     def get_url_for_pqitem(self, qitem):
@@ -439,6 +511,9 @@ class WikidataPage:
         #     print(ahref.attrib["href"])
 
         lang_pages = {}
+        if self.index_entity is not None:
+            sitelinks = self.index_entity["sitelinks"]
+            return {lang: sitelinks[lang] for lang in lang_list or [] if lang in sitelinks}
         if lang_list:
             for lang in lang_list:
                 href_lang = ".//ul[@class='" + WB_SLLV_LV + "']" + "/li[@data-wb-siteid='" + f"{lang}wiki" + "']" + \
@@ -534,6 +609,8 @@ class WikidataPage:
         """gets title (string preceeding Q/P number)
         identical to label in language of browser (or only en?)
         """
+        if self.index_entity is not None:
+            return self.index_entity[TITLE]
         title_elem_list = self.root.xpath(
             f"/html/body/div/h1/span/span[@class='wikibase-title-label']")
         title = title_elem_list[0].text
@@ -548,6 +625,8 @@ class WikidataPage:
         < li class ="wikibase-entitytermsview-aliases-alias" data-aliases-separator="|" > l-menthol < / li > 
         < li class ="wikibase-entitytermsview-aliases-alias" data-aliases-separator="|" > levomenthol < / li > 
         """
+        if self.index_entity is not None:
+            return list(self.index_entity["aliases"])
         alias_elem_list = self.root.xpath(
             f"/html/body//ul[@class='wikibase-entitytermsview-aliases']/li")
         alias_list = [li.text for li in alias_elem_list]
@@ -560,6 +639,8 @@ class WikidataPage:
         <div class="wikibase-entitytermsview-heading-description">chemical compound</div>
 
         """
+        if self.index_entity is not None:
+            return self.index_entity[DESC] or ""
         # desc_list = self.root.xpath(
         #     f"/html//*[@class='wikibase-entitytermsview-heading-description']")
         desc_list = self.get_elements_for_normalized_attrib_val("class", "wikibase-entitytermsview-heading-description")
@@ -574,6 +655,8 @@ class WikidataPage:
         remove brackets
         :return: P/Q id or None
         """
+        if self.index_entity is not None:
+            return self.index_entity[ID]
         id_list = self.get_elements_for_normalized_attrib_val("class", "wikibase-title-id")
         id = None if not id_list else id_list[0].text
         if id:
@@ -776,19 +859,503 @@ class WikidataSparql:
         return sparql.query().convert().toxml()
 
 
+class WikidataCache:
+    """persistent cache of Wikidata responses (HTML pages and API JSON) in a SQLite database
+
+    rows are keyed by the SHA-256 of the URL (including query parameters) and expire after ttl seconds.
+    Safe to share between threads.
+
+    Usage:
+        cache = WikidataCache.get_default_cache()  # or WikidataCache(Path(project_dir, "wikidata_cache.sqlite"))
+        lookup = WikidataLookup(cache=cache)
+    """
+    DEFAULT_TTL = 30 * 24 * 3600  # seconds
+    DEFAULT_FILENAME = "wikidata_cache.sqlite"
+    CACHE_DIR_ENV = "PY4AMI_CACHE_DIR"
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        """
+        :param path: SQLite file (parent directories are created) or ":memory:"
+        :param ttl: time to live in seconds (None means never expire)
+        """
+        if str(path) != ":memory:":
+            Path(path).parent.mkdir(exist_ok=True, parents=True)
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS response "
+                "(key TEXT PRIMARY KEY, url TEXT, content TEXT, fetched REAL)")
+
+    @classmethod
+    def get_default_cache(cls, ttl=DEFAULT_TTL):
+        """cache in $PY4AMI_CACHE_DIR or ~/.cache/py4ami"""
+        cache_dir = os.environ.get(cls.CACHE_DIR_ENV)
+        if not cache_dir:
+            cache_dir = Path(Path.home(), ".cache", "py4ami")
+        return WikidataCache(Path(cache_dir, cls.DEFAULT_FILENAME), ttl=ttl)
+
+    @classmethod
+    def create_key(cls, url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def get(self, url):
+        """
+        :param url: full URL including query
+        :return: cached content or None if absent or expired
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT content, fetched FROM response WHERE key = ?", (self.create_key(url),)).fetchone()
+            if row is None or (self.ttl is not None and time.time() - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, url, content):
+        """stores (or replaces) content for url"""
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO response (key, url, content, fetched) VALUES (?, ?, ?, ?)",
+                (self.create_key(url), url, content, time.time()))
+
+    def purge_expired(self):
+        """deletes expired rows
+        :return: number deleted"""
+        if self.ttl is None:
+            return 0
+        with self.lock, self.connection:
+            cursor = self.connection.execute("DELETE FROM response WHERE fetched < ?", (time.time() - self.ttl,))
+            return cursor.rowcount
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM response").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class WikidataDumpIndex:
+    """offline index of a (possibly filtered) Wikidata JSON dump in a SQLite database
+
+    built by streaming the dump (.json, .json.bz2 or .json.gz; one entity per line) with build_from_dump().
+    Holds label/alias -> QIDs with statement counts (for ranking as in Wikidata search) and
+    QID -> label, description, aliases, Wikipedia sitelinks and selected claims.
+    Used by WikidataLookup and WikidataPage instead of the web when given as index=.
+    Safe to share between threads.
+
+    Usage:
+        index = WikidataDumpIndex.build_from_dump("latest-all.json.bz2", "wikidata_index.sqlite")
+        lookup = WikidataLookup(index=index)  # or set $PY4AMI_WIKIDATA_INDEX
+    """
+    INDEX_ENV = "PY4AMI_WIKIDATA_INDEX"
+    DEFAULT_CLAIMS = ["P31", "P279"]  # instance of, subclass of
+    BATCH_SIZE = 10000  # entities per transaction
+    _default_indexes = dict()
+
+    def __init__(self, path):
+        """
+        :param path: SQLite file (parent directories are created) or ":memory:"
+        """
+        if str(path) != ":memory:":
+            Path(path).parent.mkdir(exist_ok=True, parents=True)
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS entity "
+                "(qid TEXT PRIMARY KEY, label TEXT, description TEXT, aliases TEXT, statements INTEGER, "
+                "sitelinks TEXT, claims TEXT)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS label (text TEXT, qid TEXT, statements INTEGER, "
+                "PRIMARY KEY (text, qid)) WITHOUT ROWID")
+
+    @classmethod
+    def get_default_index(cls):
+        """index in $PY4AMI_WIKIDATA_INDEX (opened once) or None if not set"""
+        path = os.environ.get(cls.INDEX_ENV)
+        if not path:
+            return None
+        if path not in cls._default_indexes:
+            cls._default_indexes[path] = WikidataDumpIndex(path)
+        return cls._default_indexes[path]
+
+    @classmethod
+    def normalize_label(cls, text):
+        """lowercase with collapsed whitespace"""
+        return " ".join(text.split()).lower() if text else ""
+
+    @classmethod
+    def open_dump(cls, dump_path):
+        """opens .bz2, .gz or plain dump as text"""
+        suffix = Path(dump_path).suffix.lower()
+        if suffix == ".bz2":
+            return bz2.open(dump_path, "rt", encoding="UTF-8")
+        if suffix == ".gz":
+            return gzip.open(dump_path, "rt", encoding="UTF-8")
+        return open(dump_path, "r", encoding="UTF-8")
+
+    @classmethod
+    def iterate_dump_entities(cls, dump_path):
+        """yields entity dicts from a dump without reading it into memory
+        the dump is a JSON array with one entity per line"""
+        with cls.open_dump(dump_path) as f:
+            for line in f:
+                line = line.strip().rstrip(",")
+                if not line or line in ("[", "]"):
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    logging.warning(f"cannot parse dump line {line[:50]}: {e}")
+
+    @classmethod
+    def build_from_dump(cls, dump_path, index_path, lang="en", wikilangs=None, claim_ids=None, qids=None):
+        """streams dump into a new or existing index
+        :param dump_path: Wikidata JSON dump (.json, .json.bz2 or .json.gz)
+        :param index_path: SQLite index file
+        :param lang: language of labels, descriptions and aliases
+        :param wikilangs: languages of Wikipedia sitelinks to keep (None keeps all)
+        :param claim_ids: properties whose item values are kept (default DEFAULT_CLAIMS)
+        :param qids: if given only these entities are indexed
+        :return: WikidataDumpIndex
+        """
+        index = WikidataDumpIndex(index_path)
+        index.add_entities(cls.iterate_dump_entities(dump_path), lang=lang, wikilangs=wikilangs,
+                           claim_ids=claim_ids, qids=qids)
+        return index
+
+    def add_entities(self, entities, lang="en", wikilangs=None, claim_ids=None, qids=None):
+        """adds (or replaces) entities in batches of BATCH_SIZE
+        :param entities: iterable of Wikidata entity dicts (as in dumps or wbgetentities)
+        :return: number of entities added
+        """
+        claim_ids = self.DEFAULT_CLAIMS if claim_ids is None else claim_ids
+        qids = None if qids is None else set(qids)
+        count = 0
+        entity_rows = []
+        label_rows = []
+        for entity in entities:
+            qid = entity.get("id")
+            if not qid or (qids is not None and qid not in qids):
+                continue
+            rows = self.create_rows(entity, lang, wikilangs, claim_ids)
+            entity_rows.append(rows[0])
+            label_rows.extend(rows[1])
+            count += 1
+            if len(entity_rows) >= self.BATCH_SIZE:
+                self.insert_rows(entity_rows, label_rows)
+                entity_rows, label_rows = [], []
+        self.insert_rows(entity_rows, label_rows)
+        logging.info(f"indexed {count} entities in {self.path}")
+        return count
+
+    @classmethod
+    def create_rows(cls, entity, lang, wikilangs, claim_ids):
+        """
+        :return: (entity row, list of label rows)
+        """
+        qid = entity["id"]
+        label = entity.get("labels", {}).get(lang, {}).get("value")
+        description = entity.get("descriptions", {}).get(lang, {}).get("value")
+        aliases = [alias.get("value") for alias in entity.get("aliases", {}).get(lang, [])]
+        claims = entity.get("claims", {})
+        statements = sum(len(statement_list) for statement_list in claims.values())
+        sitelinks = dict()
+        for site, sitelink in entity.get("sitelinks", {}).items():
+            wikilang = site[:-len("wiki")] if site.endswith("wiki") else None
+            if not wikilang or "_" in wikilang or (wikilangs is not None and wikilang not in wikilangs):
+                continue  # not a wikipedia (e.g. commonswiki, enwikiquote)
+            title = sitelink.get("title", "").replace(" ", "_")
+            sitelinks[wikilang] = f"https://{wikilang.replace('_', '-')}.wikipedia.org/wiki/{quote(title)}"
+        selected_claims = dict()
+        for claim_id in claim_ids:
+            values = []
+            for statement in claims.get(claim_id, []):
+                value = statement.get("mainsnak", {}).get("datavalue", {}).get("value")
+                if isinstance(value, dict) and value.get("id"):
+                    values.append(value["id"])
+            if values:
+                selected_claims[claim_id] = values
+        entity_row = (qid, label, description, json.dumps(aliases), statements,
+                      json.dumps(sitelinks), json.dumps(selected_claims))
+        texts = {cls.normalize_label(text) for text in [label] + aliases if text}
+        return entity_row, [(text, qid, statements) for text in texts]
+
+    def insert_rows(self, entity_rows, label_rows):
+        if not entity_rows:
+            return
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM label WHERE qid = ?", [(row[0],) for row in entity_rows])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO entity VALUES (?, ?, ?, ?, ?, ?, ?)", entity_rows)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO label VALUES (?, ?, ?)", label_rows)
+
+    def search(self, term, max_entries=5):
+        """QIDs whose label or alias is term (case and whitespace insensitive)
+        :return: list of (qid, statements), most statements first"""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT qid, statements FROM label WHERE text = ? ORDER BY statements DESC, qid LIMIT ?",
+                (self.normalize_label(term), max_entries)).fetchall()
+
+    def get_entity(self, qid):
+        """
+        :return: dict with id, label, description, aliases, statements, sitelinks, claims or None
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT qid, label, description, aliases, statements, sitelinks, claims FROM entity WHERE qid = ?",
+                (qid,)).fetchone()
+        if row is None:
+            return None
+        return self.create_entity_dict(row)
+
+    @classmethod
+    def create_entity_dict(cls, row):
+        """:param row: entity row (see create_rows)"""
+        return {ID: row[0], TITLE: row[1], DESC: row[2], "aliases": json.loads(row[3]), STATEMENTS: row[4],
+                "sitelinks": json.loads(row[5]), "claims": json.loads(row[6])}
+
+    @classmethod
+    def create_entity_dict_from_json(cls, entity, lang="en", wikilangs=None):
+        """
+        :param entity: entity JSON as in a dump or a wbgetentities response
+        :return: entity dict as from get_entity()
+        """
+        return cls.create_entity_dict(cls.create_rows(entity, lang, wikilangs, cls.DEFAULT_CLAIMS)[0])
+
+    def lookup_wikidata(self, term, max_entries=5):
+        """offline equivalent of WikidataLookup.lookup_wikidata()
+        :return: triple (hit0_id, hit0_description, wikidata_hits) or (None, None, None)"""
+        hits = self.search(term, max_entries=max_entries)
+        if not hits:
+            return None, None, None
+        hit0_id = hits[0][0]
+        entity = self.get_entity(hit0_id)
+        return hit0_id, entity[DESC] if entity else None, [qid for qid, _ in hits]
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM entity").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class TokenBucket:
+    """thread-safe token bucket; acquire() blocks until a token is available
+    tokens are added at rate per second up to capacity (the permitted burst)
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: tokens per second (must be positive)
+        :param capacity: maximum burst (default max(1, rate))
+        """
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, found {rate}")
+        self.rate = rate
+        self.capacity = capacity if capacity else max(1.0, rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """takes one token, sleeping if necessary
+        :return: seconds waited"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class WikidataLookupExecutor:
+    """runs blocking Wikidata lookups concurrently in a bounded thread pool
+
+    requests made by the tasks are rate-limited by a TokenBucket: ParserWrapper and WikidataExtractor
+    call acquire_network_token() only when a response is not in the WikidataCache, so cached lookups
+    run at full speed. Tasks are retried with exponential backoff on HTTP 429 and 5xx (honouring Retry-After).
+    Results are returned in input order; failed tasks give None and are recorded in self.errors.
+
+    Usage:
+        executor = WikidataLookupExecutor(max_workers=8, rate=5)
+        pages = executor.map(lambda qid: WikidataPage(qid), qids)
+        print(executor.get_report())
+    """
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_RATE = 5.0  # requests per second
+    DEFAULT_MAX_RETRIES = 4
+    DEFAULT_BACKOFF = 1.0  # seconds, doubled on each retry
+    _thread_state = threading.local()  # rate_limiter of the executor running the task in this thread
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, rate=DEFAULT_RATE, burst=None,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF, progress_every=100):
+        """
+        :param max_workers: maximum concurrent requests
+        :param rate: maximum requests per second (None for no limit)
+        :param burst: token bucket capacity (default max(1, rate))
+        :param max_retries: retries after a 429/5xx before giving up
+        :param backoff: first retry delay in seconds
+        :param progress_every: log progress after every progress_every completed tasks
+        """
+        self.max_workers = max_workers
+        self.rate_limiter = TokenBucket(rate, burst) if rate else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.progress_every = progress_every
+        self.lock = threading.Lock()
+        self.errors = []
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.elapsed = 0.0
+
+    def map(self, function, items):
+        """
+        applies function to each item concurrently
+        :param function: callable making (normally) one HTTP request
+        :param items: arguments
+        :return: list of results in order of items (None for failures)
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        items = list(items)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(lambda item: self._call_with_retry(function, item, len(items)), items))
+        self.elapsed += time.perf_counter() - start
+        logging.info(self.get_report())
+        return results
+
+    @classmethod
+    def acquire_network_token(cls):
+        """called just before a request that is not answered from a cache; takes a token from the
+        rate limiter of the executor running the current task (no-op outside an executor)
+        :return: seconds waited"""
+        rate_limiter = getattr(cls._thread_state, "rate_limiter", None)
+        return rate_limiter.acquire() if rate_limiter is not None else 0.0
+
+    def _call_with_retry(self, function, item, total):
+        attempt = 0
+        while True:
+            WikidataLookupExecutor._thread_state.rate_limiter = self.rate_limiter
+            try:
+                result = function(item)
+                self._record(total)
+                return result
+            except Exception as e:
+                status = self.get_status_code(e)
+                if self.is_retryable_status(status) and attempt < self.max_retries:
+                    delay = self.get_retry_after(e)
+                    if delay is None:
+                        delay = self.backoff * (2 ** attempt)
+                    logging.warning(f"HTTP {status} for {item}, retry {attempt + 1} in {delay:.1f} s")
+                    with self.lock:
+                        self.retries += 1
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                logging.error(f"lookup failed for {item}: {e}")
+                with self.lock:
+                    self.errors.append((item, e))
+                self._record(total, failed=True)
+                return None
+            finally:
+                WikidataLookupExecutor._thread_state.rate_limiter = None
+
+    def _record(self, total, failed=False):
+        with self.lock:
+            self.completed += 1
+            if failed:
+                self.failed += 1
+            if self.progress_every and self.completed % self.progress_every == 0:
+                logging.info(f"wikidata lookups: {self.completed}/{total}")
+
+    @classmethod
+    def get_status_code(cls, exception):
+        """HTTP status from urllib HTTPError or requests HTTPError, else None"""
+        code = getattr(exception, "code", None)
+        if isinstance(code, int):
+            return code
+        response = getattr(exception, "response", None)
+        return getattr(response, "status_code", None)
+
+    @classmethod
+    def is_retryable_status(cls, status):
+        return status is not None and (status == 429 or 500 <= status < 600)
+
+    @classmethod
+    def get_retry_after(cls, exception):
+        """seconds from Retry-After header if present and numeric"""
+        headers = getattr(exception, "headers", None)
+        if headers is None:
+            headers = getattr(getattr(exception, "response", None), "headers", None)
+        value = headers.get("Retry-After") if headers is not None else None
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    def get_report(self):
+        """
+        :return: dict with completed, failed, retries, elapsed (s) and throughput (tasks/s)
+        """
+        with self.lock:
+            return {
+                "completed": self.completed,
+                "failed": self.failed,
+                "retries": self.retries,
+                "elapsed": round(self.elapsed, 3),
+                "throughput": round(self.completed / self.elapsed, 2) if self.elapsed > 0 else None,
+            }
+
+
 class ParserWrapper:
     @classmethod
-    def parse_utf8_html_to_root(cla, url):
+    def parse_utf8_html_to_root(cla, url, cache=None):
+        """
+        fetches and parses HTML
+        :param url: to fetch
+        :param cache: optional WikidataCache; used if content is present, else updated after fetching
+        :return: root of HTML tree
+        """
         from io import StringIO
         from urllib.request import urlopen
         from lxml import etree
         from urllib.error import HTTPError
 
-        try:
-            with urlopen(url) as u:
-                content = u.read().decode("utf-8")
-        except HTTPError as e:
-            print(f"cannout open {url} because {e}")
+        content = cache.get(url) if cache is not None else None
+        if content is None:
+            WikidataLookupExecutor.acquire_network_token()
+            try:
+                with urlopen(url) as u:
+                    content = u.read().decode("utf-8")
+            except HTTPError as e:
+                if WikidataLookupExecutor.is_retryable_status(e.code):
+                    raise  # caller may retry
+                print(f"cannout open {url} because {e}")
+            if cache is not None and content is not None:
+                cache.put(url, content)
         tree = etree.parse(StringIO(content), etree.HTMLParser())
         root = tree.getroot()
         return root
@@ -803,13 +1370,22 @@ class WikidataExtractor:
     VERSION = "0.1"
     USER_AGENT = "Mozilla/5.0 (compatible; Pyami/" + VERSION + "; +https://github.com/petermr/pyami/)"
     WIKIDATA_API = "https://www.wikidata.org/w/api.php"
+    MAX_IDS_PER_REQUEST = 50  # wbgetentities limit
 
-    def __init__(self, lang='en'):
+    def __init__(self, lang='en', response_cache=None, api_url=None):
+        """
+        :param lang: language for labels and descriptions
+        :param response_cache: optional (persistent) WikidataCache for API responses
+        :param api_url: API endpoint (default WIKIDATA_API)
+        """
         self.lang = lang.lower()
         self.cache = {}
         self.query = None
         self.number_of_requests = 0
         self.result = None
+        self.entities = {}  # entity JSON by id from load_many(); None if Wikidata has no such entity
+        self.response_cache = response_cache
+        self.api_url = api_url if api_url else WikidataExtractor.WIKIDATA_API
 
     def __str__(self):
         return self.query
@@ -839,17 +1415,53 @@ class WikidataExtractor:
             self.cache[id] = self._parse(data, id)
         return self.cache[id]
 
-    def _request(self, query=False, id=False):
-        headers = {
-            "User-Agent": WikidataExtractor.USER_AGENT
-        }
+    def load_many(self, ids):
+        """
+        loads entities with wbgetentities, up to MAX_IDS_PER_REQUEST per request;
+        ids already loaded are not requested. The full entity JSON is kept in self.entities
+        :param ids: list of Q/P ids
+        :return: dict of parsed entity (see load()) by id
+        """
+        ENTITIES = "entities"
+        ids = [id for id in dict.fromkeys(ids) if id]
+        missing = [id for id in ids if id not in self.cache or id not in self.entities]
+        for start in range(0, len(missing), WikidataExtractor.MAX_IDS_PER_REQUEST):
+            batch = missing[start:start + WikidataExtractor.MAX_IDS_PER_REQUEST]
+            params, _ = self.get_params("|".join(batch), False)
+            result = self._get_json(params)
+            if "error" in result:
+                raise Exception(result["error"]["code"], result["error"]["info"])
+            entities = result.get(ENTITIES, {})
+            for id in batch:
+                self.entities[id] = entities.get(id)
+                self.cache[id] = self._parse(entities.get(id), id)
+        return {id: self.cache[id] for id in ids}
+
+    def _get_json(self, params):
+        """GETs API response as JSON, using self.response_cache if set"""
+        url = requests.Request("GET", self.api_url, params=params).prepare().url
+        content = self.response_cache.get(url) if self.response_cache is not None else None
+        if content is None:
+            headers = {
+                "User-Agent": WikidataExtractor.USER_AGENT
+            }
+            WikidataLookupExecutor.acquire_network_token()
+            response = requests.get(self.api_url, headers=headers, params=params)
+            self.number_of_requests += 1
+            if WikidataLookupExecutor.is_retryable_status(response.status_code):
+                response.raise_for_status()
+            content = response.text
+            result = response.json()
+            if self.response_cache is not None and "error" not in result:
+                self.response_cache.put(url, content)
+            return result
+        return json.loads(content)
 
+    def _request(self, query=False, id=False):
         params, self.query = self.get_params(id, query)
-        data = requests.get(self.WIKIDATA_API, headers=headers, params=params)
-        result = data.json()
+        result = self._get_json(params)
         self.result = result
 
-        self.number_of_requests += 1
         CODE = "code"
         ENTITIES = "entities"
         ERR = "error"
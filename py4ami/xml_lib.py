@@ -656,9 +656,6 @@ class DataTable:
         self.create_table_thead_tbody()
         self.add_column_heads(colheads)
         self.add_rows(rowdata)
-        self.head = None
-        self.title = None
-        self.title.text = None
 
 
     def create_head(self, title):
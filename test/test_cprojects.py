@@ -250,6 +250,25 @@ class TestCProjTree(unittest.TestCase):
         assert file_3_38.exists(), f"file should exist {file_3_38}"
         print(f"PDFS dir {AmiAnyTest.TEMP_PDFS_DIR}")
 
+    def test_pdf2html_in_ctrees_workers_cmd(self):
+        """PROJECT --pdf2html --workers converts the PDF in each CTree in a pool of processes,
+        giving the same files as a single process"""
+        pdf_dir = Path(Resources.RESOURCES_DIR, "projects", "liion4", "PMC4391421")
+        html_files_by_workers = dict()
+        for workers in [1, 2]:
+            project_dir = Path(AmiAnyTest.TEMP_DIR, "pdf2html_workers", f"workers_{workers}")
+            if project_dir.exists():
+                shutil.rmtree(project_dir)
+            for ctree in ["ctree_a", "ctree_b", "ctree_c"]:
+                Path(project_dir, ctree).mkdir(parents=True)
+                FileLib.copy_file("fulltext.pdf", pdf_dir, Path(project_dir, ctree))
+            PyAMI().run_command(
+                ['PROJECT', '--project', str(project_dir), '--pdf2html', '--workers', str(workers)])
+            html_files_by_workers[workers] = sorted(
+                path.relative_to(project_dir).as_posix() for path in project_dir.glob("*/html/*"))
+        assert "ctree_c/html/raw.html" in html_files_by_workers[1]
+        assert html_files_by_workers[1] == html_files_by_workers[2]
+
     VERY_LONG = False
     @unittest.skipUnless(DOWNLOAD_IPCC_WG3A_DIR and VERY_LONG, "VERY LONG, DOWNLOADS")
     def test_download_pdfs_from_hrefs_in_url(self):
@@ -12,8 +12,8 @@ from lxml import etree
 from lxml.etree import XMLSyntaxError, _Element
 
 # local
-from py4ami.ami_dict import AmiDictionary, AmiEntry, AmiDictArgs, AMIDictError, \
-    AmiDictValidator, NAME, TITLE, TERM, LANG_UR, VERSION, WIKIDATA_ID
+from py4ami.ami_dict import AmiDictionary, AmiEntry, AmiDictArgs, AMIDictError, AmiTermAutomaton, AmiDictionaryRegistry, \
+    AmiCompiledDictionary, AmiTermIndex, AmiFuzzyTermIndex, AmiDictValidator, NAME, TITLE, TERM, LANG_UR, VERSION, WIKIDATA_ID
 from py4ami.constants import PHYSCHEM_RESOURCES, LOCAL_CEV_OPEN_DICT_DIR
 from py4ami.wikimedia import WikidataSparql, WikidataPage
 from py4ami.xml_lib import XmlLib
@@ -1226,6 +1226,218 @@ class TestAmiDictionary(AmiAnyTest):
         dict1_root = None
 
 
+class TestAmiTermAutomaton(AmiAnyTest):
+    """tests for single-pass multi-term matching"""
+
+    def test_find_single_and_multiword_terms(self):
+        automaton = AmiTermAutomaton.create_from_terms(["carbon dioxide", "methane", "carbon"])
+        hits = automaton.find_all("Methane and Carbon dioxide")
+        assert hits == [(0, 7, 'methane'), (12, 18, 'carbon'), (12, 26, 'carbon dioxide')], f"found {hits}"
+
+    def test_word_boundary(self):
+        automaton = AmiTermAutomaton.create_from_terms(["he", "she", "hers"])
+        assert automaton.find_all("ushers she") == [(7, 10, 'she')]
+        hits = automaton.find_all("ushers she", word_boundary=False)
+        assert [hit[2] for hit in hits] == ['she', 'he', 'hers', 'she', 'he'], f"found {hits}"
+
+    def test_case_sensitive(self):
+        automaton = AmiTermAutomaton.create_from_terms(["GHG"], ignorecase=False)
+        assert automaton.find_all("ghg GHG") == [(4, 7, 'GHG')]
+
+    def test_dictionary_match_terms_in_text(self):
+        amidict, _ = AmiDictionary.create_dictionary_from_words(["carbon dioxide", "methane", "GHG emissions"])
+        hits = amidict.match_terms_in_text("Methane, GHG emissions and CARBON DIOXIDE")
+        assert [hit[2] for hit in hits] == ['methane', 'ghg emissions', 'carbon dioxide'], f"found {hits}"
+        # automaton is cached on dictionary
+        assert amidict.get_or_create_term_automaton() is amidict.get_or_create_term_automaton()
+
+    def test_match_multiple_word_terms_against_sentences(self):
+        amidict, _ = AmiDictionary.create_dictionary_from_words(["carbon dioxide", "methane", "GHG emissions"])
+        matched = amidict.match_multiple_word_terms_against_sentences(
+            ["Carbon dioxide and carbon dioxide.", "GHG emissions are high", "no terms here"])
+        assert matched == ['carbon dioxide', 'ghg emissions'], f"found {matched}"
+
+    def test_annotate_spans_with_terms(self):
+        """terms (including regex metacharacters) are wrapped in <a> using longest non-overlapping matches"""
+        amidict, _ = AmiDictionary.create_dictionary_from_words(["GHG", "GHG emissions", "a+b (x)"])
+        div = lxml.etree.fromstring("<div><span id='s1'>the GHG emissions and a+b (x) are huge</span></div>")
+        assert amidict.annotate_spans_with_terms(div.xpath("./span")) == 2
+        assert [a.text for a in div.xpath("./a")] == ['GHG emissions', 'a+b (x)']
+        assert [span.text for span in div.xpath("./span")] == ['the ', ' and ', ' are huge']
+
+
+class TestAmiDictionaryRegistry(AmiAnyTest):
+
+    def setUp(self):
+        AmiDictionaryRegistry.clear()
+        AmiDictionaryRegistry.set_max_size(AmiDictionaryRegistry.DEFAULT_MAX_SIZE)
+
+    def tearDown(self):
+        AmiDictionaryRegistry.clear()
+        AmiDictionaryRegistry.set_max_size(AmiDictionaryRegistry.DEFAULT_MAX_SIZE)
+
+    def test_registry_hits_and_misses(self):
+        """second read of the same file (by any path spelling) is a hit returning the same object"""
+        dictfile = Path(AMIDICTS, "dict1.xml")
+        dictionary1 = AmiDictionaryRegistry.get_dictionary(dictfile)
+        dictionary2 = AmiDictionaryRegistry.get_dictionary(str(Path(AMIDICTS, "..", "amidicts", "dict1.xml")))
+        assert dictionary1 is not None and dictionary1 is dictionary2
+        stats = AmiDictionaryRegistry.get_stats()
+        assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+    def test_registry_reloads_changed_file(self):
+        """a new mtime invalidates the cached dictionary"""
+        temp_dir = Path(AmiAnyTest.TEMP_DIR, "dictionary")
+        temp_dir.mkdir(exist_ok=True, parents=True)
+        dictfile = Path(temp_dir, "registry_dict.xml")
+        dictfile.write_text(Path(AMIDICTS, "dict1.xml").read_text())
+        dictionary1 = AmiDictionaryRegistry.get_dictionary(dictfile)
+        mtime = dictfile.stat().st_mtime_ns
+        os.utime(dictfile, ns=(mtime + 1_000_000_000, mtime + 1_000_000_000))
+        dictionary2 = AmiDictionaryRegistry.get_dictionary(dictfile)
+        assert dictionary2 is not dictionary1
+        assert AmiDictionaryRegistry.get_stats()["size"] == 1
+
+    def test_registry_lru_eviction(self):
+        """least recently used dictionary is evicted"""
+        AmiDictionaryRegistry.set_max_size(2)
+        files = [Path(AMIDICTS, name) for name in ["dict1.xml", "dict_one_entry.xml", "mini_plant_part.xml"]]
+        for file in files:
+            AmiDictionaryRegistry.get_dictionary(file)
+        stats = AmiDictionaryRegistry.get_stats()
+        assert (stats["size"], stats["evictions"]) == (2, 1)
+        AmiDictionaryRegistry.get_dictionary(files[0])
+        assert AmiDictionaryRegistry.get_stats()["misses"] == 4
+
+    def test_registry_missing_file(self):
+        assert AmiDictionaryRegistry.get_dictionary(Path(AMIDICTS, "not_a_dictionary.xml")) is None
+        assert AmiDictionaryRegistry.get_dictionary(None) is None
+
+
+class TestAmiCompiledDictionary(AmiAnyTest):
+
+    def copy_plant_part_dictionary(self):
+        temp_dir = Path(AmiAnyTest.TEMP_DIR, "dictionary", "compiled")
+        temp_dir.mkdir(exist_ok=True, parents=True)
+        dictfile = Path(temp_dir, "eoplant_part.xml")
+        dictfile.write_bytes(Path(TEST_RESOURCE_DIR, "eoPlantPart", "eoplant_part.xml").read_bytes())
+        AmiCompiledDictionary.get_compiled_path(dictfile).unlink(missing_ok=True)
+        return dictfile
+
+    def test_compile_and_load_without_xml(self):
+        """second read uses the memory-mapped sidecar and gives the same terms, matches and entries"""
+        dictfile = self.copy_plant_part_dictionary()
+        xml_dict = AmiDictionary.create_from_compiled_file(dictfile)
+        assert xml_dict.compiled is None
+        assert AmiCompiledDictionary.is_current(dictfile)
+
+        compiled_dict = AmiDictionary.create_from_compiled_file(dictfile)
+        assert compiled_dict.compiled is not None
+        assert compiled_dict.get_entry_count() == xml_dict.get_entry_count() == 112
+        assert compiled_dict.get_or_create_term_set() == xml_dict.get_or_create_term_set()
+        words = ["Cone", "pistil", "flower", "not_a_term"]
+        assert compiled_dict.match(words) == xml_dict.match(words) == ["cone", "pistil", "flower"]
+        assert "leaf blade" in compiled_dict.match_multiple_word_terms_against_sentences(["the leaf blade is green"])
+
+        index = compiled_dict.compiled.find_entry_index("CONE")
+        assert compiled_dict.compiled.get_wikidata_id(index) == "Q22710"
+        assert ("cône", "fr", "") in compiled_dict.compiled.get_synonyms(index)
+        # full element only parsed on request
+        entry = compiled_dict.get_lxml_entry("cone")
+        assert entry.get(WIKIDATA_ID) == "Q22710"
+        assert lxml.etree.tostring(entry) == lxml.etree.tostring(xml_dict.get_lxml_entry("cone"), with_tail=False)
+        assert compiled_dict.get_lxml_entry("not_a_term") is None
+        compiled_dict.compiled.close()
+
+    def test_compiled_dictionary_invalidated_by_xml_change(self):
+        """editing the XML makes the sidecar stale; it is then re-read from XML and recompiled"""
+        dictfile = self.copy_plant_part_dictionary()
+        AmiDictionary.create_from_xml_file(dictfile).compile()
+        dictfile.write_text(dictfile.read_text().replace('term="cone"', 'term="strobilus"'))
+        assert not AmiCompiledDictionary.is_current(dictfile)
+        dictionary = AmiDictionary.create_from_compiled_file(dictfile)
+        assert dictionary.compiled is None and dictionary.match(["strobilus", "cone"]) == ["strobilus"]
+        dictionary = AmiDictionary.create_from_compiled_file(dictfile)
+        assert dictionary.compiled is not None and dictionary.match(["strobilus", "cone"]) == ["strobilus"]
+        dictionary.compiled.close()
+
+
+class TestAmiTermIndex(AmiAnyTest):
+
+    def test_term_index_synonyms_and_labels(self):
+        """terms and synonyms in any language map to their entry; labels come from synonyms with xml:lang"""
+        dictionary = AmiDictionary.create_from_xml_file(Path(TEST_RESOURCE_DIR, "eoPlantPart", "eoplant_part.xml"))
+        term_index = dictionary.get_or_create_term_index()
+        assert term_index is dictionary.get_or_create_term_index()
+        # comma-separated synonym list, German synonym, extra whitespace
+        assert [term_index.get_entry_key(surface) for surface in ["Strobilus", "Stempel", "pine  Cone", "xyz"]] == \
+               ["cone", "pistil", "cone", None]
+        assert (term_index.get_label("cone", "fr"), term_index.get_label("cone", "ta")) == ("cône", None)
+        assert term_index.get_wikidata_id("cone") == "Q22710"
+        assert dictionary.match(["Strobilus", "cone", "Stempel"], synonyms=True) == ["cone", "cone", "pistil"]
+        assert dictionary.match(["Strobilus", "cone", "Stempel"]) == ["cone"]
+
+    def test_term_index_ignores_wikidata_hits_and_matches_compiled(self):
+        """synonyms of type wikidata_hits are not names; compiled and XML dictionaries give the same index"""
+        temp_dir = Path(AmiAnyTest.TEMP_DIR, "dictionary", "term_index")
+        temp_dir.mkdir(exist_ok=True, parents=True)
+        dictfile = Path(temp_dir, "disambig.xml")
+        dictfile.write_bytes(Path(TEST_RESOURCE_DIR, "eoCompound", "disambig.xml").read_bytes())
+        AmiCompiledDictionary.get_compiled_path(dictfile).unlink(missing_ok=True)
+        xml_dict = AmiDictionary.create_from_xml_file(dictfile)
+        xml_dict.compile()
+        compiled_dict = AmiDictionary.create_from_compiled_file(dictfile)
+        assert compiled_dict.compiled is not None
+        xml_index = xml_dict.get_or_create_term_index()
+        compiled_index = compiled_dict.get_or_create_term_index()
+        assert xml_index.get_entry_key("['Q27108640', 'Q7448480', 'Q27131695', 'Q27132627', 'Q28598787']") is None
+        assert len(xml_index) == xml_dict.get_entry_count()
+        assert xml_index.entry_key_by_surface == compiled_index.entry_key_by_surface
+        assert xml_index.wikidata_id_by_key == compiled_index.wikidata_id_by_key
+        compiled_dict.compiled.close()
+
+
+class TestAmiFuzzyTermIndex(AmiAnyTest):
+
+    def test_fuzzy_match_ocr_variants(self):
+        """ligatures, diacritics, hyphenation and single-character errors match terms with their distance"""
+        dictionary = AmiDictionary.create_from_xml_file(Path(TEST_RESOURCE_DIR, "eoPlantPart", "eoplant_part.xml"))
+        fuzzy_index = dictionary.get_or_create_fuzzy_index(max_distance=1)
+        assert fuzzy_index is dictionary.get_or_create_fuzzy_index(max_distance=1)
+        assert fuzzy_index.lookup("\ufb02ower") == [("flower", 0)]
+        assert fuzzy_index.lookup("Flowcr") == [("flower", 1)]
+        assert fuzzy_index.lookup("pe\u0301tal") == [("petal", 0)]
+        # short words only match exactly
+        assert fuzzy_index.lookup("lef") == []
+        words = ["the", "pis-", "til", "of", "a", "flowcr", "xylophone"]
+        assert dictionary.match_approximate(words) == [("pis-til", "pistil", 0), ("flowcr", "flower", 1)]
+        assert dictionary.match(words, max_distance=1) == ["pistil", "flower"]
+        assert dictionary.match(words) == []
+        assert dictionary.match_approximate(["strobilis"], synonyms=True) == [("strobilis", "cone", 1)]
+
+    def test_symmetric_delete_agrees_with_distance(self):
+        """index finds exactly the surfaces within max_distance found by scanning with get_distance()"""
+        surfaces = ["chloroplast", "chlorophyll", "stomata", "stamen", "stamens", "xylem", "phloem"]
+        fuzzy_index = AmiFuzzyTermIndex.create_from_surfaces([(surface, surface) for surface in surfaces],
+                                                             max_distance=2)
+        for word in ["chloroplsat", "stomen", "phlaem", "xylems", "stmn", "cytoplasm"]:
+            scanned = sorted((surface, AmiFuzzyTermIndex.get_distance(word, surface, 2)) for surface in surfaces
+                             if AmiFuzzyTermIndex.get_distance(word, surface, 2) is not None)
+            assert sorted(fuzzy_index.lookup(word)) == scanned, word
+
+    def test_lookup_cache_is_bounded(self):
+        """the lookup cache keeps at most CACHE_MAX_SIZE words, evicting the least recently used"""
+        fuzzy_index = AmiFuzzyTermIndex.create_from_surfaces([("flower", "flower"), ("petal", "petal")])
+        fuzzy_index.CACHE_MAX_SIZE = 2
+        assert fuzzy_index.lookup("flowcr") == [("flower", 1)]
+        fuzzy_index.lookup("petals")
+        fuzzy_index.lookup("flowcr")
+        fuzzy_index.lookup("xylem")
+        assert list(fuzzy_index.hits_by_word) == [("flowcr", 1), ("xylem", 1)]
+        assert fuzzy_index.lookup("petals") == [("petal", 1)]
+        assert len(fuzzy_index.hits_by_word) == 2
+
+
 
 
 def main(argv=None):
@@ -4,8 +4,12 @@ import logging
 import os
 import pprint
 import re
+import shutil
+import threading
+import time
 import unittest
 from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
 
 import lxml.etree
@@ -17,14 +21,14 @@ from numpy.lib.user_array import container
 
 from py4ami.ami_bib import Reference, Biblioref
 from py4ami.ami_dict import AmiDictionary
-from py4ami.ami_html import HTMLSearcher, HtmlTree, TargetExtractor, Target, AnnotatorCommand, HtmlAnnotator
+from py4ami.ami_html import HTMLSearcher, HTMLArgs, BatchRecordWriter, HtmlTree, TargetExtractor, Target, AnnotatorCommand, HtmlAnnotator
 from py4ami.ami_html import HtmlUtil, H_SPAN, CSSStyle, HtmlTidy, HtmlStyle, HtmlClass, SectionHierarchy, AmiFont, \
-    FloatBoundary, Footnote, HtmlGroup, IPCCAnchor
+    FloatBoundary, Footnote, HtmlGroup, IPCCAnchor, FrozenCSSStyle
 from py4ami.ami_pdf import PDFArgs, AmiPDFPlumber
 from py4ami.pyamix import PyAMI
 from py4ami.util import Util
 from py4ami.xml_lib import HtmlLib, XmlLib
-from py4ami.ami_html import URLCache, LinkFactory, IPCCTargetLink
+from py4ami.ami_html import URLCache, LinkFactory, IPCCTargetLink, TargetIndex, PageGeometryIndex
 
 from test.resources import Resources
 from test.test_all import AmiAnyTest
@@ -414,6 +418,20 @@ class TestHtml(AmiAnyTest):
         with open(str(Path(test_dir, "add_href.html")), "wb") as f:
             f.write(lxml.etree.tostring(div, method="html"))
 
+    def test_split_span_at_offsets(self):
+        """split span into 2n+1 spans at precomputed offsets in one pass
+        Tests HtmlUtil.split_span_at_offsets"""
+        div_elem = lxml.etree.fromstring(
+            "<div><span class='foo'>prefix the (bracketed) and more (brackets) string postfix </span></div>")
+        span = div_elem.xpath("./span")[0]
+        new_elems, id_counter = HtmlUtil.split_span_at_offsets(span, [(12, 21), (33, 41)], id_root="ss")
+        assert len(new_elems) == 5
+        assert id_counter == 5
+        assert lxml.etree.tostring(div_elem).decode("UTF-8") == \
+               """<div><span class="re_pref" id="ss0">prefix the (</span><span class="re_match" id="ss1">bracketed</span>""" \
+               """<span class="re_pref" id="ss2">) and more (</span><span class="re_match" id="ss3">brackets</span>""" \
+               """<span class="re_post" id="ss4">) string postfix </span></div>"""
+
     def test_markup_chapter_with_dictionary_no_css(self):
         """read dictionary file and index a set of spans
         Test: ami_dict.markup_html_from_dictionary
@@ -685,6 +703,67 @@ class TestHtml(AmiAnyTest):
 
         Target.make_dirs_from_targets(common_target_tuples, temp_dir)
 
+    def test_target_index_matches_table_and_is_incremental(self):
+        """inverted index over chapter files gives the same commonest targets as the table, and reuses its sidecar"""
+        file = Path(Resources.TEST_IPCC_DIR, "LongerReport", "fulltext.html")
+        index_dir = Path(AmiAnyTest.TEMP_HTML_DIR, "ipcc", "target_index")
+        if index_dir.exists():
+            shutil.rmtree(index_dir)
+        table = TargetExtractor.extract_ipcc_fulltext_into_source_target_table(file)
+        target_extractor = TargetExtractor.create_target_extractor(TargetIndex.COLUMNS)
+
+        index = TargetIndex(index_dir=index_dir, corpus_dir=Resources.TEST_IPCC_DIR)
+        index.add_chapter_file(file)
+        assert index.extracted_chapters == ["LongerReport"]
+        assert Path(index_dir, "LongerReport.targets.json").exists()
+        assert len(index.get_table()) == len(table)
+        assert index.find_commonest_targets() == target_extractor.find_commonest_in_node_lists(table, node_name="target")
+        assert index.find_commonest_sources() == target_extractor.find_commonest_in_node_lists(table, node_name="source")
+        target, count = index.find_commonest_targets()[0]
+        sources = index.get_sources_for_target(target)
+        assert len(sources) == count
+        assert list(sources.columns) == ["chapter", "id"]
+        assert index.get_target_counts("LongerReport")["count"].sum() == len(table)
+
+        # second index reads the sidecar; re-adding a chapter does not duplicate entries
+        index1 = TargetIndex(index_dir=index_dir, corpus_dir=Resources.TEST_IPCC_DIR)
+        index1.add_chapter_file(file)
+        index1.add_chapter_file(file)
+        assert index1.extracted_chapters == []
+        assert len(index1.get_table()) == len(table)
+        assert index1.find_commonest_targets() == index.find_commonest_targets()
+
+    def test_target_index_keeps_same_named_chapters_apart(self):
+        """chapters in same-named directories of different reports have different keys and sidecars"""
+        file = Path(Resources.TEST_IPCC_DIR, "LongerReport", "fulltext.html")
+        corpus_dir = Path(AmiAnyTest.TEMP_HTML_DIR, "ipcc", "target_corpus")
+        index_dir = Path(AmiAnyTest.TEMP_HTML_DIR, "ipcc", "target_corpus_index")
+        for dirx in [corpus_dir, index_dir]:
+            if dirx.exists():
+                shutil.rmtree(dirx)
+        files = []
+        for report in ["wg1", "wg3"]:
+            chapter_file = Path(corpus_dir, report, "LongerReport", "fulltext.html")
+            chapter_file.parent.mkdir(parents=True)
+            shutil.copyfile(file, chapter_file)
+            files.append(chapter_file)
+        row_count = len(TargetExtractor.extract_ipcc_fulltext_into_source_target_table(file))
+
+        index = TargetIndex(index_dir=index_dir, corpus_dir=corpus_dir)
+        for chapter_file in files:
+            index.add_chapter_file(chapter_file)
+        assert index.extracted_chapters == ["wg1/LongerReport", "wg3/LongerReport"]
+        assert len(index.get_table()) == 2 * row_count
+        assert Path(index_dir, "wg1", "LongerReport.targets.json").exists()
+        assert Path(index_dir, "wg3", "LongerReport.targets.json").exists()
+
+        # each chapter is reloaded from its own sidecar
+        index1 = TargetIndex(index_dir=index_dir, corpus_dir=corpus_dir)
+        for chapter_file in files:
+            index1.add_chapter_file(chapter_file)
+        assert index1.extracted_chapters == []
+        assert len(index1.get_table()) == 2 * row_count
+
     def test_create_target_node_dir_trees_from_ipcc_chapters_DEVELOP_HACKATHON(self):
         """reads a chapter in HTML, finds targets in {...'...} , uses div id as anchor
         and builds directory tree of targets
@@ -1123,6 +1202,106 @@ class Test_PDFHTML(AmiAnyTest):
         with open(outfile, "wb") as f:
             f.write(lxml.etree.tostring(html_elem, method="html"))
 
+    def test_annotation_plan_matches_run_commands(self):
+        """compiled single-traversal plan gives the same annotation as running commands on each span"""
+        input_html = Path(Resources.TEST_IPCC_DIR, "syr", "lr", "pages", f"page_16.html")
+        html_elem = lxml.etree.parse(str(input_html)).getroot()
+        annotator = HtmlAnnotator.create_ipcc_annotator()
+        for span in html_elem.xpath(".//span"):
+            annotator.run_commands(span)
+
+        html_elem1 = lxml.etree.parse(str(input_html)).getroot()
+        plan = annotator.annotate_elements(html_elem1, profile=True)
+        assert lxml.etree.tostring(html_elem1) == lxml.etree.tostring(html_elem)
+        report = plan.get_profile_report()
+        assert len(report) == len(annotator.commands)
+        matches = {name: count for name, count, seconds in report}
+        assert matches["8:targets"] == 6
+        assert matches["14:footnote"] == 1
+
+    def test_annotate_ipcc_commandline_profile(self):
+        """HTML --ipcc_annotate --profile"""
+        infile = Path(Resources.TEST_IPCC_DIR, "syr", "lr", "pages", f"page_16.html")
+        outpath = Path(AmiAnyTest.TEMP_HTML_IPCC, "annotation", "lr", "page_16.profiled.html")
+        if outpath.exists():
+            os.remove(outpath)
+        PyAMI().run_command(f"HTML --inpath {infile} --outpath {outpath} --ipcc_annotate --profile")
+        assert outpath.exists(), f"outpath {outpath} should exist"
+        assert len(lxml.etree.parse(str(outpath)).xpath("//span[@class='targets']")) == 6
+
+    def test_batch_annotate_and_search_commandline(self):
+        """HTML --batch runs annotation and chunk/node search over files in a process pool
+        and streams one record per task into JSON lines or CSV"""
+        chap06 = Path(Resources.TEST_IPCC_CHAP06, "fulltext.html")
+        dictfile = Path(Resources.TEST_IPCC_CHAP06, "abbrev_as.xml")
+        spm_glob = str(Path(Resources.TEST_IPCC_DIR, "*_spm", "fulltext.html"))
+        outdir = Path(AmiAnyTest.TEMP_HTML_IPCC, "batch")
+        if outdir.exists():
+            shutil.rmtree(outdir)
+        jsonl = Path(outdir, "annotate.jsonl")
+        PyAMI().run_command(["HTML", "--batch", str(chap06), spm_glob, "--annotate", "--dict", str(dictfile),
+                             "--outdir", str(outdir), "--batch_output", str(jsonl), "--workers", "2"])
+        records = BatchRecordWriter.read_records(jsonl)
+        assert sorted(Path(record["inpath"]).parent.name for record in records) == ["Chapter06", "wg2_spm", "wg3_spm"]
+        for record in records:
+            assert record["error"] is None
+            assert Path(record["outpath"]).exists()
+            assert record["matches"] == sum(record["hits"].values())
+        chap06_record = [record for record in records if record["inpath"] == str(chap06)][0]
+        assert chap06_record["matches"] > 0
+
+        # sequential run gives the same results
+        html_args = HTMLArgs()
+        html_args.batch = [str(chap06), spm_glob]
+        html_args.annotate = True
+        html_args.dictfile = str(dictfile)
+        html_args.outdir = Path(outdir, "sequential")
+        html_args.batch_output = Path(outdir, "annotate.csv")
+        sequential = html_args.run_batch()
+        assert {record["inpath"]: record["hits"] for record in sequential} == \
+               {record["inpath"]: record["hits"] for record in records}
+        assert len(BatchRecordWriter.read_records(html_args.batch_output)) == 3
+
+        # chunk/node search for bracketed citations
+        search_jsonl = Path(outdir, "search.jsonl")
+        PyAMI().run_command(["HTML", "--batch", str(chap06), "--search_xpath", "//span",
+                             "--chunk_re", "\\(([^\\)]*)\\)", "--splitter_re", "\\s*;\\s*",
+                             "--node_re", "[A-Z].*\\s+(20|19)\\d\\d[a-z]?",
+                             "--batch_output", str(search_jsonl)])
+        search_records = BatchRecordWriter.read_records(search_jsonl)
+        assert len(search_records) == 1
+        hits = search_records[0]["hits"]
+        assert search_records[0]["matches"] == len(hits) > 0
+        assert all(hit["nodes"]["node_re"] for hit in hits)
+
+    def test_batch_outputs_keep_same_named_chapters_apart(self):
+        """outputs are placed by the path of each input relative to the batch root; clashing outputs are refused"""
+        batch_dir = Path(AmiAnyTest.TEMP_HTML_IPCC, "batch_same_names")
+        inpaths = []
+        for report in ["wg1", "wg3"]:
+            inpath = Path(batch_dir, report, "Chapter07", "fulltext.html")
+            inpath.parent.mkdir(exist_ok=True, parents=True)
+            inpath.write_text("<html><body><p>text</p></body></html>", encoding="UTF-8")
+            inpaths.append(inpath)
+        outdir = Path(batch_dir, "out")
+        html_args = HTMLArgs()
+        html_args.ipcc_annotate = True
+        html_args.outdir = outdir
+        tasks = html_args.create_batch_tasks(inpaths)
+        assert [task["outpath"] for task in tasks] == [
+            Path(outdir, "wg1", "Chapter07", "fulltext_ipcc.html"),
+            Path(outdir, "wg3", "Chapter07", "fulltext_ipcc.html"),
+        ]
+        # a single input keeps its chapter directory
+        assert html_args.create_batch_tasks(inpaths[:1])[0]["outpath"] == \
+               Path(outdir, "Chapter07", "fulltext_ipcc.html")
+
+        html_args.ipcc_annotate = False
+        html_args.annotate = True
+        html_args.dictfile = [str(Path(batch_dir, "dict1", "abbrev.xml")), str(Path(batch_dir, "dict2", "abbrev.xml"))]
+        with self.assertRaises(ValueError):
+            html_args.create_batch_tasks(inpaths)
+
     def test_annotate_pdf_html_report_HACKATHON(self):
         input_html = Path(Resources.TEST_IPCC_DIR, "syr", "lr", "pages", f"total_pages.html")
         html_elem = lxml.etree.parse(str(input_html)).getroot()
@@ -1388,9 +1567,254 @@ class Test_PDFHTML(AmiAnyTest):
         HtmlLib.write_html_file(html_elem, outfile)
 
 
+class TestHtmlGroup(AmiAnyTest):
+
+    SECTIONS_HTML = """
+    <html><body>
+      <div><span>preamble</span></div>
+      <div><span class="section_title" id="1">Section 1</span></div>
+      <div><span>stuff a</span></div>
+      <div><span class="sub_section_title" id="1.1">1.1</span></div>
+      <div><span>stuff b</span></div>
+      <div><span class="sub_sub_section_title" id="1.1.1">1.1.1</span></div>
+      <div><span>stuff z</span></div>
+      <div><span class="sub_sub_section_title" id="1.1.2">1.1.2</span></div>
+      <div><span>stuff x</span></div>
+      <div><span class="sub_section_title" id="1.2">1.2</span></div>
+      <div><span class="section_title" id="2">Section 2</span></div>
+      <div><span>stuff c</span></div>
+    </body></html>
+    """
+
+    def test_group_nested_siblings(self):
+        """
+        groups flat title divs and followers into a 3-level hierarchy in one pass
+        """
+        html_elem = lxml.etree.fromstring(self.SECTIONS_HTML)
+        containers = HtmlGroup.group_nested_siblings(html_elem)
+        assert [c.attrib["title"] for c in containers] == ["1", "2"]
+        body = HtmlLib.get_body(html_elem)
+        assert len(body) == 3, "preamble + 2 sections"
+        assert body[0].xpath("string(.)") == "preamble"
+        section1 = containers[0]
+        assert [c.attrib.get("title") for c in section1.xpath("./div[@title]")] == ["1.1", "1.2"]
+        assert [c.attrib.get("title") for c in section1.xpath("./div[@title='1.1']/div[@title]")] == ["1.1.1", "1.1.2"]
+        assert section1.xpath("./div[@title='1.1']/div[@title='1.1.2']//span/text()") == ["1.1.2", "stuff x"]
+        assert containers[1].xpath(".//span/text()") == ["Section 2", "stuff c"]
+        assert containers[0].attrib["style"].startswith("border : solid purple")
+
+    def test_group_siblings_between_fenceposts(self):
+        """
+        wraps each fencepost and following div[span]s up to the next fencepost
+        """
+        html_elem = lxml.etree.fromstring(self.SECTIONS_HTML)
+        fenceposts = html_elem.xpath("/html/body/div[span[starts-with(@class, 'section')]]")
+        HtmlGroup.group_siblings_between_fenceposts(fenceposts, style="border: red solid 1px;")
+        body = HtmlLib.get_body(html_elem)
+        assert len(body) == 3
+        assert len(body[1]) == 9
+        assert len(body[2]) == 2
+
+
+class StubGithubHandler(BaseHTTPRequestHandler):
+    """serves a small HTML document with an ETag and counts requests"""
+    request_paths = []
+    ETAG = '"v1"'
+
+    def do_GET(self):
+        StubGithubHandler.request_paths.append(self.path)
+        if self.path.startswith("/missing"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == self.ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        content = f"<html><body><div><span id='A.1'>{self.path}</span> target text</div>" \
+                  f"<div><span id='A.2'>other</span></div></body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", self.ETAG)
+        self.end_headers()
+        self.wfile.write(content.encode("utf-8"))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestURLCache(AmiAnyTest):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(("127.0.0.1", 0), StubGithubHandler)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        StubGithubHandler.request_paths = []
+        self.cache_dir = Path(AmiAnyTest.TEMP_DIR, "url_cache")
+        if self.cache_dir.exists():
+            shutil.rmtree(self.cache_dir)
+
+    def test_lru_and_subtree_copies(self):
+        """
+        memory tier is bounded; by-id reads copy only the target subtrees
+        """
+        url_cache = URLCache(max_size=1, delay=0)
+        parents = url_cache.read_elements_by_id(f"{self.base_url}/doc1.html", "A.1", parent=True)
+        assert len(parents) == 1
+        assert ''.join(parents[0].itertext()) == "/doc1.html target text"
+        assert parents[0].getparent() is None
+        # edits to copies do not touch the cached tree
+        parents[0][0].text = "edited"
+        cached = url_cache.read_xml_element_from_github(f"{self.base_url}/doc1.html", copy_element=False)
+        assert cached.xpath("//span[@id='A.1']")[0].text == "/doc1.html"
+        url_cache.read_elements_by_id(f"{self.base_url}/doc2.html", "A.2")
+        assert url_cache.read_elements_by_id(f"{self.base_url}/doc2.html", "Z.9") == []
+        stats = url_cache.get_stats()
+        assert stats["size"] == 1
+        assert stats["evictions"] == 1
+        assert stats["hits"] == 2
+        assert stats["fetches"] == 2
+        assert url_cache.read_xml_element_from_github(f"{self.base_url}/missing.html") is None
+
+    def test_disk_tier_and_etag(self):
+        """
+        a second cache on the same directory needs no network; revalidation uses the ETag
+        """
+        url = f"{self.base_url}/doc.html"
+        URLCache(cache_dir=self.cache_dir, delay=0).read_xml_element_from_github(url)
+        assert len(StubGithubHandler.request_paths) == 1
+
+        url_cache = URLCache(cache_dir=self.cache_dir, delay=5)
+        start = time.time()
+        html_elem = url_cache.read_xml_element_from_github(url)
+        assert time.time() - start < 1, "no delay for disk reads"
+        assert html_elem.xpath("//span[@id='A.1']")[0].text == "/doc.html"
+        assert len(StubGithubHandler.request_paths) == 1
+        assert url_cache.get_stats()["disk_hits"] == 1
+
+        url_cache = URLCache(cache_dir=self.cache_dir, delay=0, revalidate=True)
+        assert url_cache.read_xml_element_from_github(url) is not None
+        assert len(StubGithubHandler.request_paths) == 2, "revalidated with If-None-Match"
+        assert url_cache.get_stats()["disk_hits"] == 1
+
+    def test_delay_is_per_host(self):
+        """
+        politeness delay applies between fetches to the same host only
+        """
+        url_cache = URLCache(delay=0.3)
+        start = time.time()
+        url_cache.read_xml_element_from_github(f"{self.base_url}/a.html")
+        url_cache.read_xml_element_from_github(f"{self.base_url}/a.html")
+        assert time.time() - start < 0.3, "cached reads are not delayed"
+        url_cache.read_xml_element_from_github(f"{self.base_url}/b.html")
+        assert time.time() - start >= 0.3
+
 
 class TestHtmlTidy(AmiAnyTest):
 
+    RAW_PDF_HTML = """
+    <html><body>
+      <div style="position:absolute; border: textbox 1px solid; writing-mode:lr-tb; left:30px; top:50px; width:20px; height:10px;">
+        <span style="font-family: Calibri; font-size:10px">12<br/></span></div>
+      <div style="position:absolute; left:80px; top:70px; width:400px; height:40px;">
+        <span style="font-family: Calibri; font-size:40px">HUGE TITLE</span>
+        <span style="font-family: Calibri; font-size:10px">body text<br/>over
+ two lines</span><span style="font-size:10px;">  </span>
+        <div><span> </span></div>
+      </div>
+      <div style="position:absolute; left:80px; top:120px;"><span style="font-size:10px">more</span> tail</div>
+    </body></html>
+    """
+
+    def test_fused_tidy_rules_match_separate_passes(self):
+        """
+        the single-pass rule engine gives the same tree as the original sequence of whole-tree passes
+        """
+        tidy = HtmlTidy()
+        tidy.set_remove_flags()
+        fused_elem = lxml.etree.fromstring(self.RAW_PDF_HTML)
+        tidy.raw_elem = fused_elem
+        tidy.remove_unwanted_attributes_and_elements()
+
+        elem = lxml.etree.fromstring(self.RAW_PDF_HTML)
+        HtmlUtil.add_generated_ids(elem)
+        lxml.etree.strip_tags(elem, ["br"])
+        HtmlUtil.remove_lh_line_numbers(elem)
+        HtmlUtil.remove_large_fonted_elements(elem)
+        for tag in tidy.empty_elements_to_remove:
+            HtmlUtil.remove_empty_elements(elem, [tag])
+        for style in tidy.styles_to_remove:
+            HtmlUtil.remove_style(elem, [style])
+        for att in tidy.style_attributes_to_remove:
+            HtmlUtil.remove_style_attribute(elem, att)
+        HtmlUtil.remove_newlines(elem)
+
+        # ids are persisted anchors, so they must be numbered as before
+        assert lxml.etree.tostring(fused_elem) == lxml.etree.tostring(elem)
+        assert fused_elem.xpath("//*/@id")
+        assert "HUGE" not in "".join(fused_elem.itertext())
+        assert len(fused_elem.xpath("//br")) == 0
+        assert fused_elem.xpath("//span[contains(., 'body text')]")[0].text == "body textover two lines"
+        assert set(tidy.rule_counts) >= {"add_id", "strip_tags", "remove_lh_line_numbers",
+                                         "remove_large_fonted_elements", "remove_empty_elements", "remove_style"}
+        assert [rule[0] for rule in tidy.get_rule_report()] == list(dict(tidy.rule_timings.most_common()))
+
+    @classmethod
+    def make_raw_pdf_pages_html(cls, npages, page_height=841, gap=47):
+        """pdfminer-like raw html: page box, page marker, header, body, line number and footer on each page"""
+        pages = []
+        for n in range(npages):
+            top = 50 + n * (page_height + gap)
+            pages.append(f"""
+      <span style="position:absolute; border: gray 1px solid; left:0px; top:{top}px; width:595px; height:{page_height}px;"></span>
+      <div style="position:absolute; top:{top}px;"><a name="{n + 1}">Page {n + 1}</a></div>
+      <div style="position:absolute; left:80px; top:{top + 20}px;"><span style="font-size:10px">header {n}</span></div>
+      <div style="position:absolute; left:80px; top:{top + 300}px;"><span style="font-size:10px">body {n}</span></div>
+      <div style="position:absolute; left:20px; top:{top + 400}px;"><span style="font-size:10px">{n + 17}</span></div>
+      <div style="position:absolute; left:80px; top:{top + 830}px;"><span style="font-size:10px">footer {n}</span></div>""")
+        return "<html><body>" + "".join(pages) + "</body></html>"
+
+    def test_page_geometry_index_header_footer_line_numbers(self):
+        """
+        the page index (built once by extract_page_boxes) drives header/footer and line-number removal
+        """
+        npages = 5
+        raw_html = self.make_raw_pdf_pages_html(npages)
+        tidy = HtmlTidy()
+        tidy_html = tidy.tidy_flow(raw_html)
+        assert len(tidy.page_boxes) == npages
+        page_index = tidy.page_index
+        assert page_index.page_tops[:2] == [50.0, 938.0]
+        assert len(page_index.page_tops) == npages + 1  # includes bottom of last page
+        for n in range(npages):
+            assert f"body {n}" in tidy_html
+            assert f"header {n}" not in tidy_html
+            assert f"footer {n}" not in tidy_html
+            assert f">{n + 17}<" not in tidy_html
+
+        # bisect gives the same page tops as the linear search
+        for coord in range(0, 5000, 37):
+            assert page_index.get_page_top(coord) == \
+                   HtmlUtil.get_largest_coord_less_than(page_index.page_tops, coord)
+        assert HtmlUtil.get_largest_coord_less_than(page_index, 1000) == 938.0
+        assert page_index.get_page_index(1000) == 1
+
+        # cached coordinates remove the same line numbers as the style conditions
+        elem = lxml.etree.fromstring(raw_html)
+        HtmlUtil.remove_lh_line_numbers(elem, page_index=PageGeometryIndex.create_from_document(elem))
+        elem1 = lxml.etree.fromstring(raw_html)
+        HtmlUtil.remove_lh_line_numbers(elem1)
+        assert lxml.etree.tostring(elem) == lxml.etree.tostring(elem1)
+        assert f">17<" not in lxml.etree.tostring(elem).decode()
+
     def test_html_good(self):
         """
         ensures valid html passes
@@ -1560,7 +1984,11 @@ class TestCSSStyle(AmiAnyTest):
             """
         html_elem = lxml.etree.fromstring(html_s)
         html_elem = HtmlTidy.ensure_html_head_body(html_elem)  # redundant as tidy already
-        HtmlStyle.extract_all_text_styles_to_head(html_elem)
+        classref_by_style = HtmlStyle.extract_all_text_styles_to_head(html_elem)
+        assert len(classref_by_style) == 3, f"3 distinct text styles"
+        assert len(html_elem.xpath("/html/head/style")) == 4, f"pink + 3 unique text styles"
+        assert [li.attrib["class"] for li in html_elem.xpath("/html/body/ul/li")] == ["s0", "s1", "s0", "s2", "s0"]
+        assert html_elem.xpath("/html/body/ul/li")[0].attrib["style"] == "left: 10px;"
         # print(f"ss {lxml.etree.tostring(html_elem.xpath('/html/head')[0])} \n ... {lxml.etree.tostring(html_elem)}")
         html_dir = Path(AmiAnyTest.TEMP_DIR, "html")
         html_dir.mkdir(exist_ok=True)
@@ -1598,6 +2026,24 @@ class TestCSSStyle(AmiAnyTest):
         assert len(html_elem.xpath("/html/body//*[@class]")) == 51, \
             f"new document should have 51 elements with @class attributes"
 
+    def test_extract_styles_and_normalize_classrefs_reuses_head_classes(self):
+        """styles already extracted to <head> (s0, s1...) are reused when a document is normalized again"""
+        html_elem = lxml.etree.fromstring("""
+        <html><head><style>.pink {background-color: pink;}</style></head><body>
+          <p style="font-weight: bold; font-size: 13px; color: blue; left: 10px;">bold blue</p>
+          <p style="font-style: italic; font-size: 20px; color: red;">italic red</p>
+        </body></html>""")
+        HtmlStyle.extract_styles_and_normalize_classrefs(html_elem)
+        body = HtmlLib.get_body(html_elem)
+        for style in ["font-style: italic; font-size: 20px; color: red;", "font-size: 9px; color: green;",
+                      "font-weight: bold; font-size: 13px; color: blue;"]:
+            p = lxml.etree.SubElement(body, "p")
+            p.attrib["style"] = style
+        classref_by_style = HtmlStyle.extract_styles_and_normalize_classrefs(html_elem)
+        assert len(classref_by_style) == 3
+        assert len(html_elem.xpath("/html/head/style")) == 4, "pink + 3 unique text styles"
+        assert [p.attrib["class"] for p in body.xpath("p")] == ["s0", "s1", "s1", "s2", "s0"]
+
     def test_extract_normalize_styles_old_chapter_4_EXAMPLE(self):
         """
         Old chapter still with header/footer.
@@ -1656,6 +2102,50 @@ class TestCSSStyle(AmiAnyTest):
         assert "width" in css_style
         assert css_style.get("width") == "34"
 
+    def test_interned_css_style(self):
+        """distinct style strings are parsed once and shared; values are precomputed and immutable"""
+        CSSStyle.clear_interned_styles()
+        div = lxml.etree.fromstring(
+            "<div>"
+            "<span style='font-family: TimesNewRoman-Bold; font-size: 9.96px; x0: 72.0; y0: 700.5'>A</span>"
+            "<span style='font-family: TimesNewRoman-Bold; font-size: 9.96px; x0: 72.0; y0: 700.5'>B</span>"
+            "<span style='font-size: medium'>C</span>"
+            "</div>")
+        spans = div.xpath("./span")
+        style0, style1, style2 = [CSSStyle.get_interned_style_of_element(span) for span in spans]
+        assert style0 is style1
+        assert type(style0) is FrozenCSSStyle
+        assert style0.is_bold_name() and style0.font_size == 10.0
+        assert (style0.x0, style0.y0, style0.x1) == (72.0, 700.5, None)
+        assert style2.font_size is None  # not numeric
+        assert style0 == CSSStyle.create_css_style_from_attribute_of_body_element(spans[0])
+        with self.assertRaises(AttributeError):
+            style0.font_size = 12
+        with self.assertRaises(TypeError):
+            style0.name_value_dict["font-size"] = "12px"
+        editable = style0.to_css_style()
+        editable.set_attribute(CSSStyle.FONT_SIZE, "12px")
+        assert style0.font_size == 10.0
+        stats = CSSStyle.get_intern_stats()
+        assert (stats["hits"], stats["misses"], stats["size"]) == (1, 2, 2)
+
+    def test_interned_css_style_eviction(self):
+        """least recently used styles are evicted"""
+        CSSStyle.clear_interned_styles()
+        max_size = CSSStyle.INTERN_MAX_SIZE
+        try:
+            CSSStyle.INTERN_MAX_SIZE = 2
+            style_a = CSSStyle.get_interned_style("top: 1")
+            CSSStyle.get_interned_style("top: 2")
+            CSSStyle.get_interned_style("top: 1")
+            CSSStyle.get_interned_style("top: 3")  # evicts "top: 2"
+            assert CSSStyle.get_interned_style("top: 1") is style_a
+            assert list(CSSStyle.interned_style_by_string.keys()) == ["top: 3", "top: 1"]
+            assert CSSStyle.get_intern_stats()["evictions"] == 1
+        finally:
+            CSSStyle.INTERN_MAX_SIZE = max_size
+            CSSStyle.clear_interned_styles()
+
     def test_make_style_dict_from_html(self):
         """
         extracts <style> elements into a Python dic
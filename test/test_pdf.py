@@ -8,6 +8,7 @@ import os
 import glob
 import pprint
 import re
+import shutil
 import sys
 import unittest
 from collections import Counter
@@ -129,7 +130,69 @@ class PDFPlumberTest(AmiAnyTest):
         imagedir = str(Path(AmiAnyTest.TEMP_DIR, "images"))
         ami_pdfplumber.debug_page(pages[0], imagedir=imagedir)
 
-
+    def test_lazy_plumber_json_matches_whole_document_json(self):
+        """lazy per-page json gives the same spans as whole-document to_json()
+        Tests AmiPDFPlumber.create_ami_plumber_json_lazy"""
+        ami_pdfplumber = AmiPDFPlumber()
+        whole_pages = ami_pdfplumber.create_ami_plumber_json(PMC1421_PDF, pages=[1, 2]).get_ami_json_pages()
+        lazy_json = ami_pdfplumber.create_ami_plumber_json_lazy(PMC1421_PDF, pages=[1, 2])
+        lazy_pages = list(lazy_json.iterate_ami_json_pages())
+        assert len(lazy_pages) == len(whole_pages) == 2
+        for lazy_page, whole_page in zip(lazy_pages, whole_pages):
+            assert lazy_page.page["mediabox"] == whole_page.page["mediabox"]
+            lazy_spans = [lxml.etree.tostring(span) for span in lazy_page.get_spans()]
+            whole_spans = [lxml.etree.tostring(span) for span in whole_page.get_spans()]
+            assert lazy_spans == whole_spans
+
+    def test_columnar_spans_match_per_char_spans(self):
+        """AmiPlumberJsonPage.get_spans (vectorized span breaks) gives the same spans as get_spans_by_char"""
+        pages = AmiPDFPlumber().create_ami_plumber_json(PMC1421_PDF, pages=[1, 2]).get_ami_json_pages()
+        for page in pages:
+            columnar_spans = [lxml.etree.tostring(span) for span in page.get_spans()]
+            assert len(columnar_spans) > 10
+            assert columnar_spans == [lxml.etree.tostring(span) for span in page.get_spans_by_char()]
+
+        # y0 drifting within epsilon of the span start, whitespace on another line, font change, non-upright char
+        def char(text, x0, y0, fontname="Times-Roman", upright=1):
+            return {"object_type": "char", "upright": upright, "text": text, "x0": x0, "x1": x0 + 5, "y0": y0,
+                    "y1": y0 + 10, "width": 5, "size": 10, "fontname": fontname,
+                    "non_stroking_color": [0], "stroking_color": None}
+        chars = [char("a", 10, 100), char("b", 15, 100.06), char("c", 20, 100.12), char(" ", 25, 100.1),
+                 char(" ", 30, 90), char("d", 35, 100.05), char("e", 40, 100.05, fontname="Times-Bold"),
+                 char("f", 45, 50), char("g", 50, 50, upright=0), char("h", 55, 50)]
+        page = AmiPlumberJsonPage({"chars": chars})
+        spans = page.get_spans()
+        assert [span.text for span in spans] == ["ab", "c d", "e", "f"]
+        assert [lxml.etree.tostring(span) for span in spans] == \
+               [lxml.etree.tostring(span) for span in page.get_spans_by_char()]
+        assert "Times-Bold" in AmiPlumberJsonPage.FONT_CACHE
+
+    def test_create_html_pages_lazy(self):
+        """writes page_<n>.html and total_pages.html from lazily extracted pages"""
+        output_page_dir = Path(AmiAnyTest.TEMP_DIR, "html", "pmc4391421", "pages")
+        output_page_dir.mkdir(exist_ok=True, parents=True)
+        AmiPDFPlumber().create_html_pages(PMC1421_PDF, output_page_dir, pages=[1, 2, 3])
+        assert Path(output_page_dir, "page_3.html").exists()
+        assert Path(output_page_dir, "total_pages.html").exists()
+
+    def test_create_html_pages_parallel(self):
+        """pages converted in worker processes are merged in page order, identical to sequential conversion"""
+        sequential_dir = Path(AmiAnyTest.TEMP_DIR, "html", "pmc4391421", "pages_sequential")
+        parallel_dir = Path(AmiAnyTest.TEMP_DIR, "html", "pmc4391421", "pages_parallel")
+        sequential_dir.mkdir(exist_ok=True, parents=True)
+        AmiPDFPlumber().create_html_pages(PMC1421_PDF, sequential_dir, pages=[1, 2, 3, 4], workers=1)
+        AmiPDFPlumber().create_html_pages(PMC1421_PDF, parallel_dir, pages=[1, 2, 3, 4], workers=2)
+        for file in ["page_1.html", "page_4.html", "total_pages.html"]:
+            with open(Path(sequential_dir, file)) as f1, open(Path(parallel_dir, file)) as f2:
+                assert f1.read() == f2.read(), f"{file} differs"
+
+    def test_create_html_pages_parallel_out_of_range_pages(self):
+        """pages beyond the end of the PDF are ignored"""
+        output_page_dir = Path(AmiAnyTest.TEMP_DIR, "html", "pmc4391421", "pages_parallel_range")
+        failed = AmiPDFPlumber().create_html_pages_parallel(PMC1421_PDF, output_page_dir, pages=[2, 999], workers=2)
+        assert failed == []
+        assert Path(output_page_dir, "page_1.html").exists()
+        assert not Path(output_page_dir, "page_2.html").exists()
 
     def test_pdfplumber_singlecol_create_spans_with_CSSStyles(self):
         """
@@ -443,6 +506,61 @@ class PDFTest(AmiAnyTest):
         assert output_dir.exists()
         assert Path(output_dir, f"{output_stem}_{5}.html").exists()
 
+    def test_iterate_pdf_pages_single_open(self):
+        """
+        streams selected pages from a single open of the PDF and reports per-page timing
+        Tests AmiPage.iterate_pdf_pages and AmiPage.create_html_pages_pdfplumber
+        """
+        page_nos = [page_no for page_no, _ in AmiPage.iterate_pdf_pages(PMC1421_PDF, range_list=[range(2, 4)])]
+        assert page_nos == [1, 2]
+
+        output_stem = "streamed"
+        output_dir = Path(AmiAnyTest.TEMP_PDFS_DIR, "pmc4391421")
+        page_times = AmiPage.create_html_pages_pdfplumber(input_pdf=PMC1421_PDF, output_dir=output_dir,
+                                                          output_stem=output_stem, range_list=range(1, 3))
+        assert list(page_times.keys()) == [0, 1]
+        assert Path(output_dir, f"{output_stem}_1.html").exists()
+
+    def test_create_html_pages_pdfplumber_workers(self):
+        """distributes pages across worker processes; times are returned in page order"""
+        output_stem = "parallel"
+        output_dir = Path(AmiAnyTest.TEMP_PDFS_DIR, "pmc4391421")
+        page_times = AmiPage.create_html_pages_pdfplumber(input_pdf=PMC1421_PDF, output_dir=output_dir,
+                                                          output_stem=output_stem, range_list=[range(1, 5)],
+                                                          workers=2, total_stem="total_pages")
+        assert list(page_times.keys()) == [0, 1, 2, 3]
+        assert Path(output_dir, f"{output_stem}_3.html").exists()
+        total_pages = lxml.etree.parse(str(Path(output_dir, "total_pages.html"))).getroot()
+        page_divs = total_pages.xpath("/html/body/div")
+        assert len(page_divs) == 4
+        first_page = lxml.etree.parse(str(Path(output_dir, f"{output_stem}_0.html"))).getroot()
+        assert lxml.etree.tostring(page_divs[0]) == lxml.etree.tostring(first_page.xpath("/html/body/div")[0])
+
+    def test_pdf_cli_workers_merges_total_pages(self):
+        """PDF --pdf2html pdfplumber writes the same page files and total_pages.html for any --workers"""
+        contents_by_workers = dict()
+        for workers in [1, 2]:
+            output_dir = Path(AmiAnyTest.TEMP_PDFS_DIR, "pmc4391421", f"cli_workers_{workers}")
+            if output_dir.exists():
+                shutil.rmtree(output_dir)
+            PyAMI().run_command(["PDF", "--inpath", str(PMC1421_PDF), "--outdir", str(output_dir),
+                                 "--pdf2html", "pdfplumber", "--workers", str(workers)])
+            page_files = sorted(output_dir.glob("*_[0-9]*.html"))
+            assert len(page_files) > 1
+            total_pages = lxml.etree.parse(str(Path(output_dir, "total_pages.html"))).getroot()
+            assert len(total_pages.xpath("/html/body/div")) == len(page_files)
+            contents_by_workers[workers] = {file.name: file.read_bytes() for file in output_dir.glob("*.html")}
+        assert contents_by_workers[1] == contents_by_workers[2]
+
+    def test_pdf_cli_workers_needs_pdfplumber(self):
+        """the newstyle (pdfminer) converter works on the whole document, so --workers > 1 is rejected"""
+        output_dir = Path(AmiAnyTest.TEMP_PDFS_DIR, "pmc4391421", "cli_workers_pdfminer")
+        pdf_args = PDFArgs()
+        pdf_args.arg_dict = PDFArgs.create_default_arg_dict()
+        pdf_args.arg_dict.update({INPATH: PMC1421_PDF, OUTDIR: output_dir, PDF2HTML: "pdfminer", "workers": 2})
+        with self.assertRaisesRegex(ValueError, "needs --pdf2html pdfplumber"):
+            pdf_args.process_args()
+
     def test_bmp_png_to_png(self):
         """
         convert bmp, jpgs, etc to PNG
@@ -2,6 +2,7 @@
 import argparse
 import ast
 from pathlib import Path
+import subprocess
 import sys
 import unittest
 # local
@@ -167,6 +168,23 @@ class TestPyami(AmiAnyTest):
         args = f"DICT --dict {infile} --validate"
         pyami.run_command(args)
 
+    def test_DICT_imports_only_dict_modules(self):
+        """DICT does not import the GUI, PDF, plotting or NLP libraries; --import-profile reports import times
+        runs in a new interpreter as this one has already imported everything
+        """
+        infile = TestAmiDictionary().setup()[TestAmiDictionary.ETHNOBOT_DICT]
+        heavy_modules = ["matplotlib", "nltk", "pandas", "pdfminer3", "py4ami.ami_gui", "py4ami.ami_pdf",
+                         "sklearn", "tkinter"]
+        code = (f"import sys\n"
+                f"from py4ami.pyamix import PyAMI\n"
+                f"PyAMI().run_command(['DICT', '--dict', r'{infile}', '--import-profile'])\n"
+                f"print('HEAVY', sorted(m for m in {heavy_modules} if m in sys.modules))\n")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=Path(__file__).parent.parent)
+        assert result.returncode == 0, result.stderr
+        assert "HEAVY []" in result.stdout, result.stdout
+        assert "cumulative ms" in result.stdout and "py4ami.ami_dict" in result.stdout
+
     @unittest.skip("commands don't work properly")
     def test_argparse_PDF_pdf2html(self):
 
@@ -2,10 +2,52 @@
 """
 
 import logging
+import os
+import shutil
 import unittest
+from pathlib import Path
+
+import lxml.etree
 # local
-from py4ami.search_lib import AmiSearch
-from py4ami.ami_dict import AmiDictionary
+from py4ami.search_lib import AmiSearch, AmiSearchResultsStore
+from py4ami.ami_dict import AmiDictionary, AmiDictionaryRegistry
+from test.test_all import AmiAnyTest
+
+PLANT_PART_DICT = Path(Path(__file__).parent, "resources", "eoPlantPart", "eoplant_part.xml")
+PLANT_SECTION_TEXTS = {
+    "PMC1/sections/1_body/1_p.xml": "The flower has a pistil and a stamen inside.",
+    "PMC1/sections/1_body/2_p.xml": "Each flower was dissected.",
+    "PMC2/sections/1_body/1_p.xml": "The pine cone and its seeds.",
+    "PMC3/sections/1_body/1_p.xml": "No plant parts here.",
+}
+
+
+def create_plant_search_project(project_dir):
+    """writes a small CProject with sections (PLANT_SECTION_TEXTS) in project_dir
+    :return: list of section files (str)"""
+    if project_dir.exists():
+        shutil.rmtree(project_dir)
+    section_files = []
+    for name, text in PLANT_SECTION_TEXTS.items():
+        file = Path(project_dir, name)
+        file.parent.mkdir(exist_ok=True, parents=True)
+        file.write_text(f"<p>{text}</p>", encoding="UTF-8")
+        section_files.append(str(file))
+    return section_files
+
+
+def search_plant_sections(section_files, workers=1, results_store=None):
+    """runs AmiSearch.search_and_count with the plant_part dictionary (read from its file)
+    :return: (ami_search, dictionary counters, all_lower_words)"""
+    ami_search = AmiSearch(load_dictionaries=False)
+    dictionary = AmiDictionary.create_from_xml_file(PLANT_PART_DICT)
+    dictionary.name = "plant_part"
+    ami_search.dictionaries = [dictionary]
+    ami_search.workers = workers
+    ami_search.results_store = results_store
+    ami_search.create_data_table("body")
+    counters, _, all_lower_words, _ = ami_search.search_and_count(section_files)
+    return ami_search, counters, all_lower_words
 
 
 @unittest.skip("no args given and no documentation")
@@ -23,3 +65,184 @@ def test_search():
     else:
         print("no option given")
 
+
+
+class TestAmiSearchResultsStore(AmiAnyTest):
+
+    def test_results_store_reuses_unchanged_sections(self):
+        """results are reused only for unchanged files and unchanged search key; unseen files are dropped"""
+        project_dir = Path(AmiAnyTest.TEMP_DIR, "search", "incremental")
+        sections_dir = Path(project_dir, "PMC1", "sections")
+        sections_dir.mkdir(exist_ok=True, parents=True)
+        file1 = Path(sections_dir, "1_p.xml")
+        file2 = Path(sections_dir, "2_p.xml")
+        file1.write_text("<p>one</p>")
+        file2.write_text("<p>two</p>")
+        store_path = Path(project_dir, "results", "intro", AmiSearchResultsStore.FILENAME)
+        store_path.unlink(missing_ok=True)
+
+        store = AmiSearchResultsStore.create_for_project(project_dir, "INTRO", "hash1")
+        assert store.path == store_path
+        assert store.get(file1) is None
+        store.put(file1, {"words": ["one"]})
+        store.put(file2, {"words": ["two"]})
+        store.save()
+
+        store = AmiSearchResultsStore.create_for_project(project_dir, "INTRO", "hash1")
+        assert store.get(file1) == {"words": ["one"]}
+        mtime = file2.stat().st_mtime_ns + 1_000_000_000
+        os.utime(file2, ns=(mtime, mtime))
+        assert store.get(file2) is None
+        assert (store.hits, store.misses) == (1, 1)
+
+        # file2 not seen in this run
+        store = AmiSearchResultsStore.create_for_project(project_dir, "INTRO", "hash1")
+        store.get(file1)
+        store.save()
+        store = AmiSearchResultsStore.create_for_project(project_dir, "INTRO", "hash1")
+        assert list(store.entry_by_file.keys()) == [str(file1)]
+
+        # dictionaries or options changed
+        store = AmiSearchResultsStore.create_for_project(project_dir, "INTRO", "hash2")
+        assert store.get(file1) is None
+
+    def test_incremental_search_reuses_unchanged_sections(self):
+        """a second incremental search reads every section from the store; a touched file is searched again;
+        counters, table rows and words are those of a non-incremental search"""
+        project_dir = Path(AmiAnyTest.TEMP_DIR, "search", "incremental_project")
+        section_files = create_plant_search_project(project_dir)
+        key_hash = search_plant_sections([])[0].create_search_key_hash()
+
+        def search_incrementally():
+            store = AmiSearchResultsStore.create_for_project(project_dir, "body", key_hash)
+            result = search_plant_sections(section_files, results_store=store)
+            store.save()
+            return result, store
+
+        _, store = search_incrementally()
+        assert (store.hits, store.misses) == (0, 4)
+        (ami_search, counters, words), store = search_incrementally()
+        assert (store.hits, store.misses) == (4, 0)
+        sequential_search, sequential_counters, sequential_words = search_plant_sections(section_files)
+        assert counters == sequential_counters
+        assert counters["plant_part"]["flower"] == 2
+        assert words == sequential_words
+        assert lxml.etree.tostring(ami_search.data_table.html) == \
+               lxml.etree.tostring(sequential_search.data_table.html)
+
+        changed_file = Path(section_files[1])
+        changed_file.write_text("<p>Each petal was dissected.</p>", encoding="UTF-8")
+        mtime = changed_file.stat().st_mtime_ns + 1_000_000_000
+        os.utime(changed_file, ns=(mtime, mtime))
+        (ami_search, counters, words), store = search_incrementally()
+        assert (store.hits, store.misses) == (3, 1)
+        sequential_search, sequential_counters, sequential_words = search_plant_sections(section_files)
+        assert counters == sequential_counters
+        assert (counters["plant_part"]["flower"], counters["plant_part"]["petal"]) == (1, 1)
+        assert words == sequential_words
+        assert lxml.etree.tostring(ami_search.data_table.html) == \
+               lxml.etree.tostring(sequential_search.data_table.html)
+
+
+class TestAmiSearchTermIndex(AmiAnyTest):
+
+    def test_synonym_matches_labelled_in_language(self):
+        """synonyms count as their term when use_synonyms; hits are labelled from the dictionary's term index"""
+        dictionary = AmiDictionary.create_from_xml_file(
+            Path(Path(__file__).parent, "resources", "eoPlantPart", "eoplant_part.xml"))
+        dictionary.name = "plant_part"
+        ami_search = AmiSearch(load_dictionaries=False)
+        ami_search.dictionaries = [dictionary]
+        words = ["the", "strobilus", "and", "pistil"]
+        matches_by_amidict, hits_by_dict = ami_search.match_single_words_against_dictionaries(words)
+        assert hits_by_dict == {"plant_part": ["pistil"]}
+        ami_search.use_synonyms = True
+        ami_search.wikidata_label_lang = "fr"
+        matches_by_amidict, hits_by_dict = ami_search.match_single_words_against_dictionaries(words)
+        assert hits_by_dict == {"plant_part": ["cone", "pistil"]}
+        assert matches_by_amidict == {"plant_part": ["cône", "pistil"]}
+
+    def test_approximate_matches_record_distance(self):
+        """with max_edit_distance hits include near misses and their distance is kept per section"""
+        dictionary = AmiDictionary.create_from_xml_file(
+            Path(Path(__file__).parent, "resources", "eoPlantPart", "eoplant_part.xml"))
+        dictionary.name = "plant_part"
+        ami_search = AmiSearch(load_dictionaries=False)
+        ami_search.dictionaries = [dictionary]
+        ami_search.max_edit_distance = 1
+        matches_by_amidict, hits_by_dict = ami_search.match_single_words_against_dictionaries(
+            ["the", "flowcr", "and", "pistil", "\ufb02ower"])
+        assert hits_by_dict == {"plant_part": ["flower", "pistil", "flower"]}
+        assert ami_search.distance_by_hit_by_dict == {"plant_part": {"flower": 0, "pistil": 0}}
+        matches_by_amidict, hits_by_dict = ami_search.match_single_words_against_dictionaries(["flowcr"])
+        assert ami_search.distance_by_hit_by_dict == {"plant_part": {"flower": 1}}
+
+
+class TestAmiSearchParallel(AmiAnyTest):
+
+    def test_group_indexes_by_ctree(self):
+        """sections are chunked by CTree; order within and between chunks follows section_files"""
+        section_files = [
+            "proj/PMC1/sections/0_front/1_abstract.xml",
+            "proj/PMC2/sections/1_body/1_p.xml",
+            "proj/PMC1/sections/1_body/2_p.xml",
+            "proj/PMC3/sections/1_body/1_p.xml",
+        ]
+        assert AmiSearch.group_indexes_by_ctree(section_files, range(4)) == [[0, 2], [1], [3]]
+        assert AmiSearch.group_indexes_by_ctree(section_files, [1, 2]) == [[1], [2]]
+
+    def test_apply_section_record(self):
+        """records returned by workers are merged into results_by_section"""
+        ami_search = AmiSearch(load_dictionaries=False)
+        record = {
+            "name": "PMC1/sections/1_body/2_p.xml",
+            "words": ["oil", "mentha"],
+            "matches_by_amidict": {"plant": ["mentha"]},
+            "matches_by_pattern": {},
+            "results_by_section": {"plant": ["mentha"]},
+        }
+        matches_by_amidict, matches_by_pattern, section = ami_search.apply_section_record(record)
+        assert matches_by_amidict == {"plant": ["mentha"]}
+        assert section.words == ["oil", "mentha"]
+        assert ami_search.results_by_section == {"PMC1/sections/1_body/2_p.xml": {"plant": ["mentha"]}}
+
+    def test_parallel_search_equals_sequential(self):
+        """sections searched in worker processes give the same counters, results_by_section and words;
+        worker dictionaries carry the caller's names"""
+        section_files = create_plant_search_project(Path(AmiAnyTest.TEMP_DIR, "search", "parallel_project"))
+        sequential_search, sequential_counters, sequential_words = search_plant_sections(section_files)
+        parallel_search, parallel_counters, parallel_words = search_plant_sections(section_files, workers=2)
+        assert sequential_counters["plant_part"] == {"flower": 2, "pistil": 1, "stamen": 1, "cone": 1}
+        assert parallel_counters == sequential_counters
+        assert parallel_search.results_by_section == sequential_search.results_by_section
+        assert parallel_words == sequential_words
+
+    def test_worker_records_use_callers_dictionary_names(self):
+        """the worker keys its records by the caller's names without renaming the shared registry dictionary"""
+        section_files = create_plant_search_project(Path(AmiAnyTest.TEMP_DIR, "search", "worker_names"))
+        options = (True, None, False, False, 0)
+        records = AmiSearch.create_section_records_for_files(
+            section_files[:1], [PLANT_PART_DICT], ["my_plant_parts"], [], options)
+        assert records[0]["results_by_section"] == {"my_plant_parts": ["flower", "pistil", "stamen"]}
+        assert list(records[0]["matches_by_amidict"]) == ["my_plant_parts"]
+        assert AmiDictionaryRegistry.get_dictionary(PLANT_PART_DICT).name == "eoplant_part"
+
+    def test_parallel_search_falls_back_for_failed_workers(self):
+        """sections without a worker result are searched in the calling process, not dropped"""
+        section_files = create_plant_search_project(Path(AmiAnyTest.TEMP_DIR, "search", "parallel_fallback"))
+        records = AmiSearch.create_section_records_in_parallel
+        AmiSearch.create_section_records_in_parallel = lambda self, files: [None] * len(files)
+        try:
+            _, counters, words = search_plant_sections(section_files, workers=2)
+        finally:
+            AmiSearch.create_section_records_in_parallel = records
+        _, sequential_counters, sequential_words = search_plant_sections(section_files)
+        assert counters == sequential_counters and words == sequential_words
+
+    def test_parallel_needs_dictionary_files(self):
+        """dictionaries created in memory cannot be reread by workers, so the search stays sequential"""
+        ami_search = AmiSearch(load_dictionaries=False)
+        ami_search.workers = 2
+        dictionary, _ = AmiDictionary.create_dictionary_from_words(["mentha"], title="plant")
+        ami_search.dictionaries = [dictionary]
+        assert ami_search.create_section_records_in_parallel(["proj/PMC1/sections/1_p.xml"]) is None
@@ -1,5 +1,8 @@
 # Tests wikipedia and wikidata methods under pytest
 import ast
+import bz2
+import gzip
+import json
 import lxml
 import os
 import pprint
@@ -8,8 +11,13 @@ from pathlib import Path
 import logging
 from lxml import etree, html
 import requests
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
 # local
-from py4ami.wikimedia import WikidataPage, ParserWrapper, WikidataExtractor, WikidataProperty, WikidataFilter
+from py4ami.wikimedia import WikidataPage, ParserWrapper, WikidataExtractor, WikidataProperty, WikidataFilter, \
+    WikidataCache, WikidataLookupExecutor, TokenBucket, WikidataDumpIndex, WIKIDATA_QUERY_URI
 from py4ami.ami_dict import WIKIDATA_ID, AmiEntry
 from test.resources import Resources
 from test.test_all import AmiAnyTest
@@ -642,5 +650,305 @@ entry like:
                    'regex'] == "(chemical compound|chemical element)", f"found {filter.json['filter']['regex']}"
 
 
+class StubWikidataHandler(BaseHTTPRequestHandler):
+    """minimal offline stand-in for the Wikidata API (wbgetentities, wbsearchentities) and item pages"""
+    request_paths = []
+
+    def do_GET(self):
+        StubWikidataHandler.request_paths.append(self.path)
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        action = params.get("action", [None])[0]
+        if action == "wbgetentities":
+            entities = {id: {"id": id,
+                             "labels": {"en": {"language": "en", "value": f"label {id}"}},
+                             "descriptions": {"en": {"language": "en", "value": f"description {id}"}},
+                             "sitelinks": {"enwiki": {"site": "enwiki", "title": f"Page {id}"},
+                                           "dewiki": {"site": "dewiki", "title": f"Seite {id}"}}}
+                        for id in params["ids"][0].split("|")}
+            self.reply(json.dumps({"entities": entities}), "application/json")
+        elif action == "wbsearchentities":
+            term = params["search"][0]
+            self.reply(json.dumps({"search": [{"id": "Q42", "match": {"language": "en", "text": term}}]}),
+                       "application/json")
+        elif url.path.startswith("/flaky/") and StubWikidataHandler.request_paths.count(self.path) == 1:
+            # first request is throttled
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+        elif url.path == "/error":
+            self.send_response(500)
+            self.end_headers()
+        else:
+            self.reply(f"<html><body><h1>{url.path}</h1></body></html>", "text/html")
+
+    def reply(self, content, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.end_headers()
+        self.wfile.write(content.encode("utf-8"))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestWikidataCache(AmiAnyTest):
+    """offline tests of WikidataCache and batched WikidataExtractor using a local stub server"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(("127.0.0.1", 0), StubWikidataHandler)
+        cls.api_url = f"http://127.0.0.1:{cls.server.server_port}/w/api.php"
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubWikidataHandler.request_paths = []
+
+    def test_load_many_batches_ids(self):
+        """120 ids need 3 wbgetentities requests"""
+        extractor = WikidataExtractor('en', api_url=self.api_url)
+        ids = [f"Q{i}" for i in range(1, 121)]
+        entity_by_id = extractor.load_many(ids)
+        assert len(entity_by_id) == 120
+        assert entity_by_id["Q77"] == {"id": "Q77", "label": "label Q77", "description": "description Q77"}
+        assert extractor.number_of_requests == 3
+        # already loaded
+        extractor.load_many(ids[:10])
+        assert extractor.number_of_requests == 3
+
+    def test_persistent_cache_across_extractors(self):
+        """second extractor (e.g. a later run) is served from the SQLite cache"""
+        cache_path = Path(AmiAnyTest.TEMP_DIR, "wikidata", "test_cache.sqlite")
+        cache_path.unlink(missing_ok=True)
+        cache = WikidataCache(cache_path)
+        extractor = WikidataExtractor('en', response_cache=cache, api_url=self.api_url)
+        assert extractor.search("acetone") == "Q42"
+        extractor.load_many(["Q1", "Q2"])
+        assert len(StubWikidataHandler.request_paths) == 2
+        cache.close()
+
+        cache = WikidataCache(cache_path)
+        extractor = WikidataExtractor('en', response_cache=cache, api_url=self.api_url)
+        assert extractor.search("acetone") == "Q42"
+        assert extractor.load_many(["Q1", "Q2"])["Q2"]["label"] == "label Q2"
+        assert len(StubWikidataHandler.request_paths) == 2
+        assert extractor.number_of_requests == 0
+        assert cache.hits == 2
+        cache.close()
+
+    def test_dictionary_enrichment_fetches_items_in_batches(self):
+        """add_wikidata_from_terms searches each term but fetches the items found with one wbgetentities
+        request per MAX_IDS_PER_REQUEST items instead of one page per entry"""
+        cache = WikidataCache(":memory:")
+        terms = [f"term{i}" for i in range(60)]
+        for i, term in enumerate(terms):
+            # search results are already cached (offline)
+            cache.put(WIKIDATA_QUERY_URI + term, self.create_search_page(f"Q{100 + i}", f"description {i}"))
+        dictionary, _ = AmiDictionary.create_dictionary_from_words(terms, title="batched", wikilangs=["en", "de"])
+        extractor = WikidataExtractor('en', response_cache=cache, api_url=self.api_url)
+        dictionary.add_wikidata_from_terms(cache=cache, extractor=extractor)
+        assert extractor.number_of_requests == 2
+        assert len(StubWikidataHandler.request_paths) == 2
+        entry = dictionary.root.find("entry[@term='term7']")
+        assert entry.get(WIKIDATA_ID) == "Q107"
+        assert entry.get("desc") == "description 7"
+        assert entry.get("wikipediaPage") == "https://en.wikipedia.org/wiki/Page_Q107"
+        assert entry.find("wikipedia[@lang='de']").text == "https://de.wikipedia.org/wiki/Seite_Q107"
+
+    @classmethod
+    def create_search_page(cls, qitem, description):
+        """Wikidata search result page with a single hit"""
+        return (f"<html><body><ul class='mw-search-results'><li>"
+                f"<div class='mw-search-result-heading'><a href='/wiki/{qitem}'>label ({qitem})</a></div>"
+                f"<div class='searchresult'><span>{description}</span></div>"
+                f"<div class='mw-search-result-data'>12 statements, 2 sitelinks</div>"
+                f"</li></ul></body></html>")
+
+    def test_cache_ttl(self):
+        cache = WikidataCache(":memory:", ttl=60)
+        cache.put("http://example.org/a", "content")
+        assert cache.get("http://example.org/a") == "content"
+        # age the row
+        cache.connection.execute("UPDATE response SET fetched = ?", (time.time() - 120,))
+        assert cache.get("http://example.org/a") is None
+        assert cache.purge_expired() == 1
+        assert len(cache) == 0
+
+    def test_html_page_cache(self):
+        """ParserWrapper (used by WikidataLookup and WikidataPage) fetches each page once"""
+        cache = WikidataCache(":memory:")
+        url = f"http://127.0.0.1:{self.server.server_port}/wiki/Q42"
+        for _ in range(3):
+            root = ParserWrapper.parse_utf8_html_to_root(url, cache=cache)
+            assert root.find(".//h1").text == "/wiki/Q42"
+        assert len(StubWikidataHandler.request_paths) == 1
+
+
+class TestWikidataDumpIndex(AmiAnyTest):
+    """offline lookups from an index built by streaming a (tiny) Wikidata JSON dump"""
+
+    @classmethod
+    def create_entity(cls, qid, label, description, aliases=(), nstatements=1, sitelinks=None, instance_of="Q11173"):
+        claims = {"P31": [{"mainsnak": {"datavalue": {"value": {"id": instance_of}}}}]}
+        claims["P2067"] = [{"mainsnak": {"datavalue": {"value": {"amount": "+58"}}}}] * (nstatements - 1)
+        return {"id": qid, "labels": {"en": {"language": "en", "value": label}},
+                "descriptions": {"en": {"language": "en", "value": description}},
+                "aliases": {"en": [{"language": "en", "value": alias} for alias in aliases]},
+                "claims": claims,
+                "sitelinks": {f"{lang}wiki": {"site": f"{lang}wiki", "title": title}
+                              for lang, title in (sitelinks or {}).items()}}
+
+    @classmethod
+    def write_dump(cls, path, entities):
+        """writes entities in dump format (JSON array, one entity per line)"""
+        lines = ["["] + [json.dumps(entity) + "," for entity in entities[:-1]] + [json.dumps(entities[-1]), "]"]
+        with cls.open_for_write(path) as f:
+            f.write("\n".join(lines) + "\n")
+
+    @classmethod
+    def open_for_write(cls, path):
+        if str(path).endswith(".bz2"):
+            return bz2.open(path, "wt", encoding="UTF-8")
+        if str(path).endswith(".gz"):
+            return gzip.open(path, "wt", encoding="UTF-8")
+        return open(path, "w", encoding="UTF-8")
+
+    def setUp(self):
+        self.entities = [
+            self.create_entity("Q49546", "acetone", "chemical compound", aliases=["propanone", "dimethyl ketone"],
+                               nstatements=40, sitelinks={"en": "Acetone", "de": "Aceton", "fr": "Acétone"}),
+            self.create_entity("Q222936", "acetone cyanohydrin", "chemical compound", nstatements=20),
+            self.create_entity("Q99999", "Acetone", "album by Acetone", nstatements=3, instance_of="Q482994"),
+            self.create_entity("Q2270", "benzene", "chemical compound", nstatements=60,
+                               sitelinks={"en": "Benzene", "enwikiquote": "x"}),
+        ]
+        self.wikidata_dir = Path(AmiAnyTest.TEMP_DIR, "wikidata")
+        self.wikidata_dir.mkdir(exist_ok=True, parents=True)
+
+    def test_build_index_and_lookup_offline(self):
+        """bz2 and gz dumps give the same index; lookups rank by statements; pages need no network"""
+        for suffix in ["json.bz2", "json.gz"]:
+            dump_path = Path(self.wikidata_dir, f"dump.{suffix}")
+            index_path = Path(self.wikidata_dir, f"index_{suffix.replace('.', '_')}.sqlite")
+            index_path.unlink(missing_ok=True)
+            self.write_dump(dump_path, self.entities)
+            index = WikidataDumpIndex.build_from_dump(dump_path, index_path, wikilangs=["en", "de"])
+            assert len(index) == 4
+
+            lookup = WikidataLookup(index=index)
+            assert lookup.lookup_wikidata("Acetone") == ("Q49546", "chemical compound", ["Q49546", "Q99999"])
+            assert lookup.lookup_wikidata("  Dimethyl   KETONE ")[0] == "Q49546"
+            assert lookup.lookup_wikidata("unknown") == (None, None, None)
+
+            page = WikidataPage("Q49546", index=index)
+            assert page.root is None
+            assert page.get_title() == "acetone"
+            assert page.get_description() == "chemical compound"
+            assert page.get_id() == "Q49546"
+            assert page.get_aliases() == ["propanone", "dimethyl ketone"]
+            assert page.get_wikipedia_page_links(["en", "de", "fr"]) == {
+                "en": "https://en.wikipedia.org/wiki/Acetone", "de": "https://de.wikipedia.org/wiki/Aceton"}
+            assert index.get_entity("Q99999")["claims"] == {"P31": ["Q482994"]}
+            assert index.get_entity("Q2270")["sitelinks"] == {"en": "https://en.wikipedia.org/wiki/Benzene"}
+            index.close()
+
+    def test_add_wikidata_from_terms_with_index(self):
+        """dictionary enrichment against the index (no web access)"""
+        dump_path = Path(self.wikidata_dir, "dump.json")
+        index_path = Path(self.wikidata_dir, "index_dict.sqlite")
+        index_path.unlink(missing_ok=True)
+        self.write_dump(dump_path, self.entities)
+        index = WikidataDumpIndex.build_from_dump(dump_path, index_path, qids=["Q49546", "Q2270", "Q99999"])
+        assert len(index) == 3
+
+        dictionary, _ = AmiDictionary.create_dictionary_from_words(["acetone", "benzene"], title="solvents",
+                                                                   wikilangs=["en", "de"])
+        dictionary.add_wikidata_from_terms(index=index)
+        acetone = dictionary.get_lxml_entry("acetone")
+        assert acetone.attrib[WIKIDATA_ID] == "Q49546"
+        assert acetone.attrib["wikipediaPage"] == "https://en.wikipedia.org/wiki/Acetone"
+        assert acetone.xpath("./wikidataHit")[0].text == "Q99999"
+        assert dictionary.get_lxml_entry("benzene").attrib[WIKIDATA_ID] == "Q2270"
+        index.close()
+
+
+class TestWikidataLookupExecutor(AmiAnyTest):
+    """offline tests of concurrent, rate-limited lookups using a local stub server"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(("127.0.0.1", 0), StubWikidataHandler)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubWikidataHandler.request_paths = []
+
+    def test_token_bucket_limits_rate(self):
+        """after the burst, tokens are released at rate per second"""
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.perf_counter()
+        for _ in range(6):
+            bucket.acquire()
+        assert time.perf_counter() - start >= 0.2
+
+    def test_map_keeps_order_and_retries(self):
+        """results are in input order; 429 responses are retried; 500 is retried then fails"""
+        executor = WikidataLookupExecutor(max_workers=4, rate=100, max_retries=2, backoff=0.01)
+        paths = ["/wiki/Q1", "/flaky/Q2", "/wiki/Q3", "/flaky/Q4", "/error"]
+        roots = executor.map(lambda path: ParserWrapper.parse_utf8_html_to_root(self.base_url + path), paths)
+        assert [root.find(".//h1").text for root in roots[:4]] == paths[:4]
+        assert roots[4] is None
+        report = executor.get_report()
+        assert report["completed"] == 5
+        assert report["failed"] == 1
+        assert report["retries"] == 4  # 2 flaky + 2 for /error
+        assert len(executor.errors) == 1 and executor.errors[0][0] == "/error"
+
+    def test_cached_lookups_are_not_rate_limited(self):
+        """only requests that reach the network take a token, so a cached re-run is not throttled"""
+        cache = WikidataCache(":memory:")
+        urls = [f"{self.base_url}/wiki/Q{i}" for i in range(20)]
+        for url in urls:
+            cache.put(url, f"<html><body><h1>{url}</h1></body></html>")
+        executor = WikidataLookupExecutor(max_workers=4, rate=2, burst=1)
+        start = time.perf_counter()
+        roots = executor.map(lambda url: ParserWrapper.parse_utf8_html_to_root(url, cache=cache), urls)
+        assert time.perf_counter() - start < 1.0
+        assert [root.find(".//h1").text for root in roots] == urls
+        assert StubWikidataHandler.request_paths == []
+        # uncached: after the burst of 1, tokens come at 2 per second
+        start = time.perf_counter()
+        executor.map(lambda path: ParserWrapper.parse_utf8_html_to_root(self.base_url + path, cache=cache),
+                     ["/wiki/A", "/wiki/B", "/wiki/C"])
+        assert time.perf_counter() - start >= 0.9
+        assert len(StubWikidataHandler.request_paths) == 3
+
+    def test_wikidata_pages_for_ids_concurrently(self):
+        """AmiEntry.get_wikidata_pages_for_ids with an executor (WikidataPage fetches from the stub site)"""
+        from py4ami.ami_dict import AmiEntry
+        site = WikidataPage.__dict__["get_wikidata_site"]
+        WikidataPage.get_wikidata_site = classmethod(lambda cls: self.base_url + "/wiki/")
+        try:
+            executor = WikidataLookupExecutor(max_workers=3, rate=50)
+            pages = AmiEntry.get_wikidata_pages_for_ids(["Q1", "Q2", "Q3"], executor=executor)
+        finally:
+            WikidataPage.get_wikidata_site = site
+        assert [page.root.find(".//h1").text for page in pages] == ["/wiki/Q1", "/wiki/Q2", "/wiki/Q3"]
+        assert executor.get_report()["throughput"] > 0
+
+
 if __name__ == '__main__':
     unittest.main()